@@ -0,0 +1,115 @@
+"""
+This script compares the wall-clock time to a target objective of the synchronous and the steady-state CMA-ES.
+"""
+
+import os,sys,inspect
+import argparse
+import csv
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir) 
+from src.env.cell_lines import retrieve_lines
+from src.search.evaluator import Evaluator
+from src.search.covariance_matrix_adaption import cma_es, async_cma_es, parameters
+from src.search.scheduler import print_makespan_report, aggregate_history
+from src.util.domain import retrieve_domain
+from src.env.objectives import retrieve_multi_objective
+
+# -------------------------------------------------------------------
+# Setup conditions for experiments
+# -------------------------------------------------------------------
+
+# cma-es configuration
+MAX_ITER = 200
+SCALE = "linear"
+THRES = 8000
+
+# path for the traces of both runs
+PATH = "./artifacts/async/"
+
+# persistent proliferation cache is disabled, otherwise the second run would reuse the simulations of the first
+CACHE = None
+
+# start steady state solves from the closest known steady state. Disabled since the steady states at hand
+# depend on the evaluation order, which differs between both variants
+WARM_START = False
+
+# load the model once and share it copy-on-write with all workers, e.g. "forkserver"
+BOOTSTRAP = None
+
+# -------------------------------------------------------------------
+# Run both variants on the same tissue
+# -------------------------------------------------------------------
+
+def run(method, tissue, domain, objective, seed, workers):
+    conf = {
+        "n_steps": 1,
+        "cell_lines": retrieve_lines(tissue),
+        "objective": objective,
+        "max_dosage": THRES,
+        "domain": domain,
+        "scale": SCALE,
+        "cache": CACHE,
+        "warm_start": WARM_START,
+        "bootstrap": BOOTSTRAP,
+        "scheduler": "flat",
+        "workers": workers
+    }
+    evaluator = Evaluator(conf, store=False)
+    trace = []
+    method(evaluator, domain, MAX_ITER, verbose=False, seed=seed, trace=trace)
+    history, line_statistics = evaluator.makespan_report()
+    evaluator.terminate()
+    return trace, history, line_statistics
+
+def time_to_target(trace, target):
+    """Returns wall time and evaluations until the best objective reaches the target, or None."""
+    for seconds, n_evals, best in trace:
+        if best <= target:
+            return seconds, n_evals
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare synchronous and steady-state CMA-ES.')
+    parser.add_argument("-t", '--tissue', metavar='tissue', type=str, required=False, default="initial",
+                        help='the name of the relevant tissue. The default is the initial set of cell lines.')
+    parser.add_argument("-o", '--objective', metavar='objective', type=str, required=False, default="avg",
+                        help='Possible values are "avg" and "worst".')
+    parser.add_argument("-l", '--lambd', metavar='lambd', type=float, required=False, default=0,
+                        help='Weighting parameter of the linear penalty function.')
+    parser.add_argument("-g", '--target', metavar='target', type=float, required=False, default=None,
+                        help='Target objective. Defaults to the best objective of the synchronous run.')
+    parser.add_argument("-w", '--workers', metavar='workers', type=int, required=False, default=None,
+                        help='Number of worker processes. Defaults to the number of cores.')
+    parser.add_argument("-r", '--random_seed', metavar='random_seed', type=int, required=False, default=23,
+                        help='Seed for random number generator.')
+    args = parser.parse_args()
+
+    if not os.path.isdir(PATH):
+        os.mkdir(PATH)
+
+    objective = retrieve_multi_objective(args.objective, args.lambd)
+    traces = {}
+    for name, method in [("sync", cma_es), ("async", async_cma_es)]:
+        domain = retrieve_domain("simplex", seed=args.random_seed)
+        print("Running", name, "CMA-ES...")
+        traces[name], history, line_statistics = run(method, args.tissue, domain, objective, args.random_seed, args.workers)
+        if method is async_cma_es: # one batch per candidate, reported per generation of tasks
+            history = aggregate_history(history, parameters(domain.dim)["m"] * len(retrieve_lines(args.tissue)))
+        print_makespan_report(history, line_statistics)
+
+    target = args.target if args.target is not None else traces["sync"][-1][2]
+    print("\nTarget objective:", target)
+    for name, trace in traces.items():
+        reached = time_to_target(trace, target)
+        if reached is None:
+            print("%-6s did not reach the target, best %.5f after %.1f s" % (name, trace[-1][2], trace[-1][0]))
+        else:
+            print("%-6s reached the target after %.1f s and %d evaluations" % (name, reached[0], reached[1]))
+        with open(PATH + args.tissue + "_" + name + "_trace.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["time", "evaluations", "best"])
+            writer.writerows(trace)
+
+if __name__ == '__main__':
+    main()
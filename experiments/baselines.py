@@ -9,6 +9,8 @@ parentdir = os.path.dirname(currentdir)
 sys.path.insert(0,parentdir) 
 from src.baseline.generate import single_drug_baseline, two_drug_baseline
 from src.env.cell_lines import retrieve_lines
+from src.reference_simulator.simulator import model_fingerprint
+from src.util.cache import ProliferationCache, warm_from_baselines
 
 # -------------------------------------------------------------------
 # Setup conditions for experiments
@@ -23,9 +25,18 @@ STEP_SIZE = 1
 # number of threads used for generation
 WORKERS = 16
 
+# number of threads AMICI uses in every worker, None splits the cores among the workers
+THREADS = None
+
 # perform two drug baseline
 DUAL_BASELINE = True
 
+# start steady state solves from the closest known steady state, which changes results within the solver tolerance
+WARM_START = False
+
+# persistent proliferation cache the baselines are loaded into, e.g. "./artifacts/cache/proliferation.sqlite"
+CACHE = None
+
 # -------------------------------------------------------------------
 # Single drug baseline
 # -------------------------------------------------------------------
@@ -38,7 +49,7 @@ def single_baseline(cell_lines):
         if os.path.isfile(path):
             print ("Single drug baseline data already exists for " + cell_line + ".")
         else:
-            single_drug_baseline(cell_line, max_concentration=MAX_DOSAGE, step_size=STEP_SIZE, workers=WORKERS)
+            single_drug_baseline(cell_line, max_concentration=MAX_DOSAGE, step_size=STEP_SIZE, workers=WORKERS, threads=THREADS, warm_start=WARM_START)
    
 # -------------------------------------------------------------------
 # Two drug baseline
@@ -52,7 +63,7 @@ def two_baseline(cell_lines):
         if os.path.isfile(path):
             print ("Two drug baseline data already exists for " + cell_line + ".")
         else:
-            two_drug_baseline(cell_line, max_concentration=MAX_DOSAGE, step_size=STEP_SIZE, workers=WORKERS)
+            two_drug_baseline(cell_line, max_concentration=MAX_DOSAGE, step_size=STEP_SIZE, workers=WORKERS, threads=THREADS, warm_start=WARM_START)
 
 # -------------------------------------------------------------------
 # Finished experiment
@@ -71,6 +82,12 @@ def main():
     if DUAL_BASELINE:
         two_baseline(cell_lines)
 
+    if CACHE is not None:
+        cache = ProliferationCache(model_fingerprint(), path=CACHE)
+        n = warm_from_baselines(cache, cell_lines)
+        print("Stored", n, "baseline entries in proliferation cache.")
+        cache.close()
+
     print("----------------------------------------")
     print("Completed experimentation and stored baseline data successfully.")
 
@@ -0,0 +1,87 @@
+"""
+This script measures the cold-start time of a fresh process until the first treatment has been applied.
+Every repetition runs in a new interpreter so that no module or model is loaded already.
+"""
+
+import os,sys,inspect
+import argparse
+import json
+import subprocess
+import time
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir) 
+import numpy as np
+
+# -------------------------------------------------------------------
+# Setup conditions for experiments
+# -------------------------------------------------------------------
+
+# number of fresh processes
+REPETITIONS = 5
+
+# stages of the cold start in the order they happen
+STAGES = ["import", "model", "initialize", "apply_treatment", "total"]
+
+# -------------------------------------------------------------------
+# Measurement within a fresh process
+# -------------------------------------------------------------------
+
+def child(cell_line):
+    start = time.perf_counter()
+    from src.reference_simulator.simulator import Simulator
+    from src.env.drugs import single_treatment
+    t_import = time.perf_counter()
+    simulator = Simulator()
+    t_model = time.perf_counter()
+    simulator.initialize(cell_line)
+    t_initialize = time.perf_counter()
+    simulator.apply_treatment(single_treatment('PD0325901', 1000))
+    t_apply = time.perf_counter()
+
+    timings = {
+        "import": t_import - start,
+        "model": t_model - t_import,
+        "initialize": t_initialize - t_model,
+        "apply_treatment": t_apply - t_initialize,
+        "total": t_apply - start,
+    }
+    print(json.dumps(timings))
+
+# -------------------------------------------------------------------
+# Repeated measurements
+# -------------------------------------------------------------------
+
+def measure(cell_line, repetitions=REPETITIONS):
+    timings = {stage: [] for stage in STAGES}
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "-t", cell_line, "--child"],
+            cwd=parentdir, check=True, capture_output=True, text=True).stdout
+        interpreter = time.perf_counter() - start
+        res = json.loads(out.strip().splitlines()[-1])
+        for stage in STAGES:
+            timings[stage].append(res[stage])
+        timings.setdefault("process", []).append(interpreter)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cold-start time to the first treatment.')
+    parser.add_argument("-t", '--cell_line', metavar='cell_line', type=str, required=False, default="DV90",
+                        help='the cell line which is simulated.')
+    parser.add_argument("-n", '--repetitions', metavar='repetitions', type=int, required=False, default=REPETITIONS,
+                        help='the number of fresh processes which are measured.')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.cell_line)
+        return
+
+    timings = measure(args.cell_line, repetitions=args.repetitions)
+    print("Cold start of", args.cell_line, "over", args.repetitions, "processes (seconds):")
+    for stage in STAGES + ["process"]:
+        print("  %-16s mean %.3f  min %.3f  max %.3f" % (stage, np.mean(timings[stage]), np.min(timings[stage]), np.max(timings[stage])))
+
+if __name__ == '__main__':
+    main()
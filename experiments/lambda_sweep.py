@@ -0,0 +1,153 @@
+"""
+This script runs the multi-cell-line experiments for a whole grid of penalty weights in one job. Each
+lambda starts from the search distribution the previous lambda ended with, since neighbouring penalty
+levels have nearby optima. The results are stored per lambda with the same prefixes as multi_cell.py.
+"""
+
+import os,sys,inspect
+import argparse
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir) 
+from src.env.cell_lines import retrieve_lines
+from src.search.evaluator import Evaluator
+from src.search.covariance_matrix_adaption import cma_es, initial_state, StopCriteria
+from src.util.domain import retrieve_domain
+from src.env.objectives import retrieve_multi_objective
+from src.util.bootstrap import print_reports
+from src.util.store import initialize_result_dictionary, update_result_dictionary, store
+
+# -------------------------------------------------------------------
+# Setup conditions for experiments
+# -------------------------------------------------------------------
+
+# cma-es configuration of the first lambda and of every following lambda
+MAX_ITER = 200
+CONTINUATION_ITER = 60
+
+# the step size a lambda starts with is at least SIGMA_MIN, so the distribution can follow the optimum
+SIGMA_MIN = 0.05
+
+# stop criteria of cma-es, a criterion set to None is not checked
+TOL_FUN = 1e-6
+TOL_X = 1e-5
+STAGNATION = 40 # generations
+MAX_EVALS = None
+MAX_TIME = None # seconds
+
+N_ENVS = 9
+SCALE = "linear"
+THRES = 8000
+
+# lambda = 10^(-value / 4) for every value of the grid, as in scripts/multi_cell.sh
+GRID = list(range(4, 29))
+
+# path for optimization results
+PATH = "./artifacts/multi/"
+
+# store all experimental evaluations
+STORE = False
+
+# persistent proliferation cache shared by all jobs, e.g. "./artifacts/cache/proliferation.sqlite", None disables it
+CACHE = None
+
+# start steady state solves from the closest known steady state, which changes results within the solver tolerance
+WARM_START = False
+
+# load the model once and share it copy-on-write with all workers, e.g. "forkserver"
+BOOTSTRAP = None
+
+# "nested" runs one environment per worker, "flat" evaluates all (treatment, cell line) pairs on a single
+# pool with one worker per core
+SCHEDULER = "nested"
+
+# -------------------------------------------------------------------
+# Run CMA for every lambda
+# -------------------------------------------------------------------
+
+def sweep(tissue, domain, domain_name, objective_name, values, seed):
+    cell_lines = retrieve_lines(tissue)
+    state = initial_state(domain)
+    n_evals = 0
+    conf = {
+        "n_steps": 1,
+        "cell_lines": cell_lines,
+        "objective": retrieve_multi_objective(objective_name, 0), # replaced for every lambda
+        "max_dosage": THRES,
+        "domain": domain,
+        "scale": SCALE,
+        "cache": CACHE,
+        "warm_start": WARM_START,
+        "bootstrap": BOOTSTRAP,
+        "scheduler": SCHEDULER
+    }
+    # one evaluator for all lambdas keeps its workers, their loaded models and warm start states
+    evaluator = Evaluator(conf, n_envs=N_ENVS, store=STORE)
+    for i, value in enumerate(values):
+        exponent = -value / 4
+        lambd = 10 ** exponent
+        prefix = objective_name + "_" + domain_name + "_" + str(exponent).replace(".", "_") + "_cma_es"
+        print(tissue, "lambda:", lambd)
+        print("-----------------------")
+        evaluator.set_objective(retrieve_multi_objective(objective_name, lambd))
+        stop = StopCriteria(tol_fun=TOL_FUN, tol_x=TOL_X, stagnation=STAGNATION, max_evals=MAX_EVALS, max_time=MAX_TIME)
+        state["sigma"] = max(state["sigma"], SIGMA_MIN)
+        max_iter = MAX_ITER if i == 0 else CONTINUATION_ITER
+        mu, obj, rel_prolif, reason = cma_es(evaluator, domain, max_iter, verbose=True, seed=seed, stop=stop, state=state)
+        assert len(rel_prolif) == len(cell_lines), "Number of proliferations differs from number of cell lines."
+        n_evals += stop.n_evals
+        print("Stop criterion:", reason, "after", stop.n_evals, "evaluations,", n_evals, "in total")
+
+        res_dict = initialize_result_dictionary()
+        res_dict["threshold"] = []
+        update_result_dictionary(res_dict, [mu], [rel_prolif], THRES, SCALE)
+        res_dict["threshold"].append(THRES)
+        store(res_dict, PATH, tissue, prefix, format="csv")
+    print_reports(evaluator.worker_report())
+    evaluator.terminate()
+
+# -------------------------------------------------------------------
+# Finished experiment
+# -------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a warm-started sweep over the penalty weights for a tissue.')
+    parser.add_argument("-t", '--tissue', metavar='tissue', type=str, required=True,
+                        help='the name of the relevant tissue. \
+                        Possible tissues are "breast", "intestine", "lung", "pancreas", "skin" and "initial".')
+
+    parser.add_argument("-d", '--domain', metavar='domain', type=str, required=True,
+                    help='the domain for the optimization process. \
+                    Possible domains are "simplex" and "cube".')
+
+    parser.add_argument("-o", '--objective', metavar='objective', type=str, required=True,
+                        help='Specifies how the objective function uses the proliferation vector of the population. \
+                        Possible values are "avg" and "worst".')
+
+    parser.add_argument("-r", '--random_seed', metavar='random_seed', type=int, required=True,
+                        help='Seed for random number generator.')
+
+    parser.add_argument('--reverse', action='store_true',
+                        help='Walks the grid from the smallest to the largest penalty weight.')
+
+    if not os.path.isdir(PATH):
+        os.mkdir(PATH)
+
+    args = parser.parse_args()
+    domain = retrieve_domain(args.domain, seed=args.random_seed)
+    values = list(reversed(GRID)) if args.reverse else GRID
+
+    print("Tissue:", args.tissue)
+    print("objective:", args.objective)
+    print("Lambdas:", [10 ** (-value / 4) for value in values])
+    print("")
+
+    print("Running optimization...")
+    sweep(args.tissue, domain, args.domain, args.objective, values, args.random_seed)
+    print("Completed optimization.")
+
+    print("\n----------------------------------------")
+    print("Stored results successfully.")
+
+if __name__ == '__main__':
+    main()
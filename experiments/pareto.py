@@ -0,0 +1,134 @@
+"""
+This script searches the front of relative proliferation against total dosage for multi-cell-line
+experiments in a single run. The non-dominated treatments are stored in the format of multi_cell.py,
+so the best treatment for any lambda can be read from them with best_multi_search_result.
+"""
+
+import os,sys,inspect
+import argparse
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+from src.env.cell_lines import retrieve_lines
+from src.search.evaluator import Evaluator
+from src.search.pareto import pareto_search
+from src.util.domain import retrieve_domain
+from src.env.objectives import MultiAvgLinear, MultiWorstLinear
+from src.util.bootstrap import print_reports
+from src.search.scheduler import print_makespan_report
+from src.util.store import initialize_result_dictionary, update_result_dictionary, store
+
+# -------------------------------------------------------------------
+# Setup conditions for experiments
+# -------------------------------------------------------------------
+
+# pareto search configuration
+MAX_ITER = 200
+POPULATION = 40
+SIGMA = 0.1
+ARCHIVE = 200 # non-dominated treatments stored per run
+
+N_ENVS = 9
+SCALE = "linear"
+THRES = [8000]
+
+# path for optimization results
+PATH = "./artifacts/multi/"
+
+# store all experimental evaluations
+STORE = False
+
+# persistent proliferation cache shared by all jobs, e.g. "./artifacts/cache/proliferation.sqlite", None disables it
+CACHE = None
+
+# start steady state solves from the closest known steady state, which changes results within the solver tolerance
+WARM_START = False
+
+# load the model once and share it copy-on-write with all workers, e.g. "forkserver"
+BOOTSTRAP = None
+
+# "nested" runs one environment per worker, "flat" evaluates all (treatment, cell line) pairs on a single
+# pool with one worker per core
+SCHEDULER = "nested"
+
+# -------------------------------------------------------------------
+# Run the pareto search for the tissue
+# -------------------------------------------------------------------
+
+def pareto_experiment(tissue, domain, aggregation, prefix, seed):
+    print(tissue)
+    print("-----------------------")
+    cell_lines = retrieve_lines(tissue)
+    res_dict = initialize_result_dictionary()
+    res_dict["threshold"] = []
+    for T in THRES:
+        conf = {
+            "n_steps": 1,
+            "cell_lines": cell_lines,
+            "objective": MultiAvgLinear(0) if aggregation == "avg" else MultiWorstLinear(0), # not used by the search
+            "max_dosage": T,
+            "domain": domain,
+            "scale": SCALE,
+            "cache": CACHE,
+            "warm_start": WARM_START,
+            "bootstrap": BOOTSTRAP,
+            "scheduler": SCHEDULER
+        }
+        evaluator = Evaluator(conf, n_envs=N_ENVS, store=STORE)
+        xs, objectives, prolifs = pareto_search(evaluator, domain, MAX_ITER, population=POPULATION, aggregation=aggregation,
+            sigma=SIGMA, archive_size=ARCHIVE, verbose=True, seed=seed)
+        print("Size of front:", len(xs))
+        assert prolifs.shape[1] == len(cell_lines), "Number of proliferations differs from number of cell lines."
+        update_result_dictionary(res_dict, list(xs), list(prolifs), T, SCALE)
+        res_dict["threshold"] += [T] * len(xs)
+        print_reports(evaluator.worker_report())
+        if SCHEDULER == "flat":
+            print_makespan_report(*evaluator.makespan_report())
+        evaluator.terminate()
+    store(res_dict, PATH, tissue, prefix, format="csv")
+
+# -------------------------------------------------------------------
+# Finished experiment
+# -------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description='Search the front of proliferation against dosage for tissue.')
+    parser.add_argument("-t", '--tissue', metavar='tissue', type=str, required=True,
+                        help='the name of the relevant tissue. \
+                        Possible tissues are "breast", "intestine", "lung", "pancreas", "skin" and "initial".')
+
+    parser.add_argument("-d", '--domain', metavar='domain', type=str, required=True,
+                    help='the domain for the optimization process. \
+                    Possible domains are "simplex" and "cube".')
+
+    parser.add_argument("-o", '--objective', metavar='objective', type=str, required=True,
+                        help='Specifies how the proliferation vector of the population is aggregated. \
+                        Possible values are "avg" and "worst" for the average and worst case proliferation.')
+
+    parser.add_argument("-r", '--random_seed', metavar='random_seed', type=int, required=True,
+                        help='Seed for random number generator.')
+
+    if not os.path.isdir(PATH):
+        os.mkdir(PATH)
+
+    args = parser.parse_args()
+    seed = args.random_seed
+    domain = retrieve_domain(args.domain, seed=seed)
+    if args.objective not in ["avg", "worst"]:
+        raise ValueError("The specified objective type is unknown.")
+    prefix = args.objective + "_" + args.domain + "_pareto"
+
+    print("Tissue:", args.tissue)
+    print("objective:", args.objective)
+    print("Prefix:", prefix)
+    print("")
+
+    print("Running optimization...")
+    pareto_experiment(args.tissue, domain, args.objective, prefix, seed)
+    print("Completed optimization.")
+
+    print("\n----------------------------------------")
+    print("Stored results successfully.")
+
+if __name__ == '__main__':
+    main()
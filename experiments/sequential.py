@@ -11,9 +11,13 @@ sys.path.insert(0,parentdir)
 from src.env.cell_lines import retrieve_lines
 from src.env.thresholds import THRESHOLDS
 from src.search.evaluator import Evaluator
-from src.search.covariance_matrix_adaption import cma_es
+from src.search.covariance_matrix_adaption import cma_es, StopCriteria, parameters
+from src.search.restarts import restart_cma_es
 from src.util.domain import retrieve_domain
 from src.env.objectives import MultiAvgLinear, MultiWorstLinear
+from src.util.bootstrap import print_reports
+from src.search.scheduler import print_makespan_report
+from src.util.checkpoint import remove_checkpoint, reproducible_config
 from src.util.store import initialize_sequential_result_dictionary, update_sequential_result_dictionary, store, load_data
 
 # -------------------------------------------------------------------
@@ -22,6 +26,18 @@ from src.util.store import initialize_sequential_result_dictionary, update_seque
 
 # cma-es configuration
 MAX_ITER = 200
+
+# stop criteria of cma-es, a criterion set to None is not checked. All are off so that runs take MAX_ITER
+# iterations like earlier results; TOL_FUN = 1e-6, TOL_X = 1e-5 and STAGNATION = 40 end converged runs early.
+TOL_FUN = None
+TOL_X = None
+STAGNATION = None # generations
+MAX_EVALS = None
+MAX_TIME = None # seconds
+
+# number of populations which run concurrently with restarts, the budget is the one of MAX_ITER default generations
+CONCURRENT = 2
+
 N_ENVS = 9
 SCALE = "linear"
 THRES = [8000]
@@ -32,34 +48,76 @@ PATH = "./artifacts/sequential/"
 # store all experimental evaluations
 STORE = False
 
+# checkpoints of running optimizations, a preempted job continues from its last checkpoint with the same
+# iterations. Checkpointed runs use neither CACHE nor WARM_START, set CHECKPOINTS = None to use them.
+CHECKPOINTS = "./artifacts/checkpoints/"
+
+# persistent proliferation cache shared by all jobs, e.g. "./artifacts/cache/proliferation.sqlite", None disables it
+CACHE = None
+
+# start steady state solves from the closest known steady state, which changes results within the solver tolerance
+WARM_START = False
+
+# load the model once and share it copy-on-write with all workers, e.g. "forkserver"
+BOOTSTRAP = None
+
+# "nested" runs one environment per worker, "flat" evaluates all (treatment, cell line) pairs on a single
+# pool with one worker per core
+SCHEDULER = "nested"
+
+# compose multi-step results from cached single-step ratios
+COMPOSE = False
+
 # -------------------------------------------------------------------
 # Run CMA for each cell line
 # -------------------------------------------------------------------
 
 # find better way to store results
 
-def cma_experiment(tissue, n_steps, domain, objective, prefix, seed):
+def cma_experiment(tissue, n_steps, domain, objective, prefix, seed, covariance="full", rank=None, restart=None):
     print(tissue)
     print("-----------------------")
     cell_lines = retrieve_lines(tissue)
     res_dict = initialize_sequential_result_dictionary(n_steps)
     res_dict["threshold"] = []
+    checkpoints = []
     for T in THRES:
+        checkpoints.append(CHECKPOINTS + prefix + "_" + tissue + "_" + str(T) + "_" + str(seed) + ".pkl" if CHECKPOINTS is not None else None)
         conf = {
             "n_steps": n_steps,
             "cell_lines": cell_lines,
             "objective": objective,
             "max_dosage": T,
             "domain": domain, 
-            "scale": SCALE
+            "scale": SCALE,
+            "compose": COMPOSE,
+            "cache": CACHE,
+            "warm_start": WARM_START,
+            "bootstrap": BOOTSTRAP,
+            "scheduler": SCHEDULER
         }
+        if CHECKPOINTS is not None: # a resumed run needs results which do not depend on the evaluation order
+            conf = reproducible_config(conf)
         evaluator = Evaluator(conf, n_envs=N_ENVS, store=STORE)
-        mu, obj, rel_prolif = cma_es(evaluator, domain, MAX_ITER, verbose=True, seed=seed)
+        if restart is None:
+            stop = StopCriteria(tol_fun=TOL_FUN, tol_x=TOL_X, stagnation=STAGNATION, max_evals=MAX_EVALS, max_time=MAX_TIME)
+            mu, obj, rel_prolif, reason = cma_es(evaluator, domain, MAX_ITER, verbose=True, seed=seed, covariance=covariance, rank=rank, stop=stop,
+                checkpoint=checkpoints[-1])
+            print("Stop criterion:", reason)
+        else:
+            mu, obj, rel_prolif, reason = restart_cma_es(evaluator, domain, MAX_ITER * parameters(domain.dim)["m"], strategy=restart,
+                concurrent=CONCURRENT, verbose=True, seed=seed, covariance=covariance, rank=rank, checkpoint=checkpoints[-1])
         assert len(rel_prolif) == len(cell_lines), "Number of proliferations differs from number of cell lines."
         update_sequential_result_dictionary(res_dict, [mu], [rel_prolif], T, SCALE, n_steps)
         res_dict["threshold"].append(T)
+        print_reports(evaluator.worker_report())
+        if SCHEDULER == "flat":
+            print_makespan_report(*evaluator.makespan_report())
         evaluator.terminate()
     store(res_dict, PATH, tissue, prefix, format="csv")
+    for checkpoint in checkpoints:
+        if checkpoint is not None:
+            remove_checkpoint(checkpoint)
 
 # -------------------------------------------------------------------
 # Finished experiment
@@ -91,6 +149,17 @@ def main():
     parser.add_argument("-r", '--random_seed', metavar='random_seed', type=int, required=True,
                         help='Seed for random number generator.')
 
+    parser.add_argument("-c", '--covariance', metavar='covariance', type=str, required=False, default="full",
+                        help='Specifies the covariance model of CMA-ES. Possible values are "full", "diagonal" and "low_rank". \
+                        The diagonal and low rank models scale linearly with the number of steps.')
+
+    parser.add_argument("-k", '--rank', metavar='rank', type=int, required=False, default=None,
+                        help='Number of evolution paths kept by the low rank covariance model. Defaults to the population size.')
+
+    parser.add_argument("-R", '--restart', metavar='restart', type=str, required=False, default=None,
+                        help='Runs CMA-ES with restarts and concurrent populations. Possible strategies are "ipop" and "bipop". \
+                        If no strategy is specified a single population is run.')
+
     if not os.path.isdir(PATH):
         os.mkdir(PATH)
 
@@ -105,6 +174,10 @@ def main():
     else: 
         prefix = str(args.steps) + "step_" + args.objective + "_" + args.domain + "_" + str(lambd).replace(".", "_") + "_cma_es" # create prefix here and then give it to function
         lambd = 10 ** lambd
+    if args.covariance != "full": # keep the file names of the full model unchanged
+        prefix = prefix[:-len("_cma_es")] + "_" + args.covariance + "_cma_es"
+    if args.restart is not None:
+        prefix = prefix[:-len("_cma_es")] + "_" + args.restart + "_cma_es"
 
     if args.objective == "avg":
         objective = MultiAvgLinear(lambd)
@@ -118,10 +191,13 @@ def main():
     print("Prefix:", prefix)
     print("Lambda:", lambd)
     print("Steps:", args.steps)
+    print("Covariance:", args.covariance)
+    print("Restarts:", args.restart)
     print("")
 
     print("Running optimization...")
-    cma_experiment(args.tissue, args.steps, domain, objective, prefix, seed)
+    cma_experiment(args.tissue, args.steps, domain, objective, prefix, seed, covariance=args.covariance, rank=args.rank,
+        restart=args.restart)
     print("Completed optimization.")
 
     print("\n----------------------------------------")
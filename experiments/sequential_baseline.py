@@ -11,9 +11,12 @@ sys.path.insert(0,parentdir)
 from src.env.cell_lines import retrieve_lines
 from src.env.thresholds import THRESHOLDS
 from src.search.evaluator import Evaluator
-from src.search.covariance_matrix_adaption import cma_es
+from src.search.covariance_matrix_adaption import cma_es, StopCriteria
 from src.util.domain import retrieve_domain
 from src.env.objectives import MultiAvgLinear, MultiWorstLinear
+from src.util.bootstrap import print_reports
+from src.search.scheduler import print_makespan_report
+from src.util.checkpoint import remove_checkpoint, reproducible_config
 from src.util.store import initialize_sequential_result_dictionary, update_sequential_result_dictionary, store, load_data
 import numpy as np
 
@@ -23,6 +26,15 @@ import numpy as np
 
 # cma-es configuration
 MAX_ITER = 200
+
+# stop criteria of cma-es, a criterion set to None is not checked. All are off so that runs take MAX_ITER
+# iterations like earlier results; TOL_FUN = 1e-6, TOL_X = 1e-5 and STAGNATION = 40 end converged runs early.
+TOL_FUN = None
+TOL_X = None
+STAGNATION = None # generations
+MAX_EVALS = None
+MAX_TIME = None # seconds
+
 N_ENVS = 9
 SCALE = "linear"
 THRES = [8000]
@@ -33,6 +45,26 @@ PATH = "./artifacts/sequential_baseline/"
 # store all experimental evaluations
 STORE = False
 
+# checkpoints of running optimizations, a preempted job continues from its last checkpoint with the same
+# iterations. Checkpointed runs use neither CACHE nor WARM_START, set CHECKPOINTS = None to use them.
+CHECKPOINTS = "./artifacts/checkpoints/"
+
+# persistent proliferation cache shared by all jobs, e.g. "./artifacts/cache/proliferation.sqlite", None disables it
+CACHE = None
+
+# start steady state solves from the closest known steady state, which changes results within the solver tolerance
+WARM_START = False
+
+# load the model once and share it copy-on-write with all workers, e.g. "forkserver"
+BOOTSTRAP = None
+
+# "nested" runs one environment per worker, "flat" evaluates all (treatment, cell line) pairs on a single
+# pool with one worker per core
+SCHEDULER = "nested"
+
+# compose multi-step results from cached single-step ratios
+COMPOSE = False
+
 # -------------------------------------------------------------------
 # Run CMA for each cell line
 # -------------------------------------------------------------------
@@ -45,22 +77,40 @@ def cma_experiment(tissue, n_steps, domain, objective, prefix, seed):
     cell_lines = retrieve_lines(tissue)
     res_dict = initialize_sequential_result_dictionary(n_steps)
     res_dict["threshold"] = []
+    checkpoints = []
     for T in THRES:
+        checkpoints.append(CHECKPOINTS + prefix + "_" + tissue + "_" + str(T) + "_" + str(seed) + ".pkl" if CHECKPOINTS is not None else None)
         conf = {
             "n_steps": n_steps,
             "cell_lines": cell_lines,
             "objective": objective,
             "max_dosage": T,
             "domain": domain, 
-            "scale": SCALE
+            "scale": SCALE,
+            "compose": COMPOSE,
+            "cache": CACHE,
+            "warm_start": WARM_START,
+            "bootstrap": BOOTSTRAP,
+            "scheduler": SCHEDULER
         }
+        if CHECKPOINTS is not None: # a resumed run needs results which do not depend on the evaluation order
+            conf = reproducible_config(conf)
         evaluator = Evaluator(conf, n_envs=N_ENVS, store=STORE, repeated=True) # NOTE: repeated causes the evaluator to use the same treatment at every step
-        mu, obj, rel_prolif = cma_es(evaluator, domain, MAX_ITER, verbose=True, seed=seed)
+        stop = StopCriteria(tol_fun=TOL_FUN, tol_x=TOL_X, stagnation=STAGNATION, max_evals=MAX_EVALS, max_time=MAX_TIME)
+        mu, obj, rel_prolif, reason = cma_es(evaluator, domain, MAX_ITER, verbose=True, seed=seed, stop=stop,
+            checkpoint=checkpoints[-1])
+        print("Stop criterion:", reason)
         assert len(rel_prolif) == len(cell_lines), "Number of proliferations differs from number of cell lines."
         update_sequential_result_dictionary(res_dict, [np.concatenate([mu] * n_steps)], [rel_prolif], T, SCALE, n_steps)
         res_dict["threshold"].append(T)
+        print_reports(evaluator.worker_report())
+        if SCHEDULER == "flat":
+            print_makespan_report(*evaluator.makespan_report())
         evaluator.terminate()
     store(res_dict, PATH, tissue, prefix, format="csv")
+    for checkpoint in checkpoints:
+        if checkpoint is not None:
+            remove_checkpoint(checkpoint)
 
 # -------------------------------------------------------------------
 # Finished experiment
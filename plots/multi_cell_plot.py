@@ -9,7 +9,7 @@ os.chdir("..")
 import time
 from src.baseline.evaluate import build_combined_single_frame, build_combined_dual_frame, best_single_treatment, best_dual_treatment
 from src.baseline.evaluate import best_single_treatment_by_dosage, best_dual_treatment_by_dosage
-from src.search.evaluate_search import best_multi_search_result
+from src.search.evaluate_search import best_multi_search_result, pareto_front
 from src.env.cell_lines import retrieve_lines
 import matplotlib
 matplotlib.use('Agg')
@@ -26,6 +26,9 @@ PATH_DATA = "./artifacts/multi/"
 THRESHOLD = 8000
 VERIFICATION = False
 
+# overlay the front of experiments/pareto.py, requires its results for TISSUE
+PARETO = False
+
 # TODO: receive from command line arguments
 OBJECTIVE = "worst"
 DOMAIN = "simplex"
@@ -48,6 +51,11 @@ def get_data_search():
             print("   ...%2d lambdas loaded..." % len(lambdas))
     return lambdas, proliferations, objectives, concentrations, treatments
 
+def get_data_pareto():
+    prefix = OBJECTIVE + "_" + DOMAIN + "_pareto"
+    _, concentrations, proliferations = pareto_front(TISSUE, PATH_DATA, prefix, obj=OBJECTIVE, max_dosage=THRESHOLD)
+    return concentrations, proliferations
+
 def get_data_single(lambdas):
     comb_data = build_combined_single_frame(retrieve_lines(TISSUE))
     proliferations, objectives, concentrations = [], [], []
@@ -91,6 +99,13 @@ dual_prolifs, dual_objectives, dual_concentration = get_data_dual(lambdas)
 print(">>> Total time: ", round(time.time() - t0, 2), " seconds <<<\n")
 t0 = time.time()
 
+pareto_concentrations, pareto_prolifs = None, None
+if PARETO:
+    print("*** Pareto search results ***")
+    pareto_concentrations, pareto_prolifs = get_data_pareto()
+    print(">>> Total time: ", round(time.time() - t0, 2), " seconds <<<\n")
+    t0 = time.time()
+
 print("*** All single drug results ***")
 best_drugs, single_all_concentrations, single_all_prolifs = best_single_treatment_by_dosage(retrieve_lines(TISSUE), obj=OBJECTIVE, path="./artifacts/baselines/")
 print(">>> Total time: ", round(time.time() - t0, 2), " seconds <<<\n")
@@ -181,8 +196,11 @@ def prolif_vs_lambda_plot(ax, search_prolifs, single_prolifs, dual_prolifs):
 
 def prolif_vs_dosage_plot(ax,
                           search_concentration, single_all_concentrations, dual_all_concentrations,
-                          search_prolifs, single_all_prolifs, dual_all_prolifs):
+                          search_prolifs, single_all_prolifs, dual_all_prolifs,
+                          pareto_concentrations=None, pareto_prolifs=None):
     ax.plot(search_concentration / 1000,      search_prolifs,     label="Optimization Result")
+    if pareto_concentrations is not None:
+        ax.step(pareto_concentrations / 1000, pareto_prolifs, where="post", label="Pareto Front")
     ax.plot(single_all_concentrations / 1000, single_all_prolifs, label="Best Single Drug")
     ax.plot(dual_all_concentrations / 1000,   dual_all_prolifs,   label="PD0325901+PLX-4720")
     
@@ -198,7 +216,8 @@ fig.savefig(f"./plots/pdfs/multi_{TISSUE}_prolif_vs_lambda.pdf", bbox_inches='ti
 
 fig, ax = plt.subplots(figsize=(3.9,2.99))
 prolif_vs_dosage_plot(ax, np.array(search_concentration), np.array(single_all_concentrations), np.array(dual_all_concentrations),
-                          np.array(search_prolifs), np.array(single_all_prolifs), np.array(dual_all_prolifs))
+                          np.array(search_prolifs), np.array(single_all_prolifs), np.array(dual_all_prolifs),
+                          pareto_concentrations, pareto_prolifs)
 fig.savefig(f"./plots/pdfs/multi_{TISSUE}_prolif_vs_dosage.pdf", bbox_inches='tight')
 
 fig, ax = plt.subplots(figsize=(3.9,2.99))
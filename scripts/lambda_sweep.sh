@@ -0,0 +1,14 @@
+#!/bin/bash
+# a runner script to execute the warm-started lambda sweep of the multi-cell experiment on the simplex, one job per tissue.
+
+cmd=""
+seed=23
+for tissue in skin intestine pancreas breast
+do
+cmd+="python experiments/lambda_sweep.py -t $tissue -d simplex -o worst -r $seed\n"
+done
+echo -e $cmd
+echo "============================="
+echo "Waiting 10s before starting jobs...."
+sleep 10s
+echo -e $cmd | xargs -n1 -P4 -I{} -- bash -c '{}'
@@ -3,10 +3,12 @@ This file contains code to create a dataframe containing the results for the sin
 treatment. It uses parallelization to compute the table efficiently.
 """
 
+import os
+import numpy as np
 import pandas as pd
 from multiprocessing import Pool
 from src.reference_simulator.simulator import Simulator
-from src.env.drugs import DRUGS, empty_treatment
+from src.env.drugs import DRUGS
 
 # used to distribute to the jobs
 BATCH_NUMBER = 20
@@ -14,25 +16,53 @@ BATCH_NUMBER = 20
 # used for the two drug treatment
 RATIOS = [x * 5 for x in range(21)] # 5% steps
 
+# number of neighbouring doses which are solved in one call in warm start mode
+WARM_CHUNK = 16
+
+# simulators of a worker process, shared by all of its jobs
+_simulators = {}
+
 # -------------------------------------------------------------------
-# Code for single drug baseline
+# Helper functions
 # -------------------------------------------------------------------
 
-def experiment_batch(arg):
-    simulator = Simulator()
+def simulate_grid(simulator, treatments, threads, warm_start):
+    """Simulates the treatments of a dose grid. In warm start mode the grid is walked in order in chunks of
+    WARM_CHUNK treatments, so every chunk starts from the steady states of the neighbouring doses solved in
+    the chunk before."""
+    if not warm_start:
+        return list(simulator.apply_treatments(treatments, num_threads=threads))
     res = []
-    for con in arg["concentations"]:
-        treatment = empty_treatment()
-        treatment[arg["drug"]] = con
+    for i in range(0, len(treatments), WARM_CHUNK):
+        res += list(simulator.apply_treatments(treatments[i:i + WARM_CHUNK], num_threads=threads))
+    return res
 
-        simulator.initialize(arg["cell_line"])
-        rel_proliferation = simulator.apply_treatment(treatment)
-        simulator.initialized = False
+def worker_simulator(cell_line, warm_start):
+    """Returns the initialized simulator of this worker process, so a cell line is loaded and checked once per worker."""
+    key = (cell_line, warm_start)
+    if key not in _simulators:
+        simulator = Simulator(warm_start=warm_start)
+        simulator.initialize(cell_line)
+        _simulators[key] = simulator
+    return _simulators[key]
+
+def threads_per_worker(workers, threads=None):
+    """Returns the number of AMICI threads of every worker. By default the cores are split among the workers."""
+    if threads is not None:
+        return threads
+    return max(1, (os.cpu_count() or 1) // workers)
 
-        res.append(rel_proliferation)
-    return res
+# -------------------------------------------------------------------
+# Code for single drug baseline
+# -------------------------------------------------------------------
+
+def experiment_batch(arg):
+    simulator = worker_simulator(arg["cell_line"], arg["warm_start"])
+    treatments = np.zeros((len(arg["concentations"]), len(DRUGS)))
+    treatments[:, DRUGS.index(arg["drug"])] = arg["concentations"]
+    return simulate_grid(simulator, treatments, arg["threads"], arg["warm_start"])
 
-def single_drug_baseline(cell_line, max_concentration=8000, step_size=10, workers=8):
+def single_drug_baseline(cell_line, max_concentration=8000, step_size=10, workers=8, threads=None, warm_start=False):
     assert max_concentration % step_size == 0, "max_concentration needs to be a multiple of the step size."
 
     steps = max_concentration // step_size + 1
@@ -48,6 +78,8 @@ def single_drug_baseline(cell_line, max_concentration=8000, step_size=10, worker
                 'drug': drug,
                 'cell_line': cell_line,
                 'concentations': batch,
+                'threads': threads_per_worker(workers, threads),
+                'warm_start': warm_start,
             }
             jobs.append(job)
 
@@ -79,21 +111,14 @@ def single_drug_baseline(cell_line, max_concentration=8000, step_size=10, worker
 # -------------------------------------------------------------------
 
 def dual_drug_batch(arg):
-    simulator = Simulator()
-    res = []
-    for con in arg["concentations"]:
-        treatment = empty_treatment()
-        treatment['PD0325901'] = (1 - (arg["ratio"] / 100.0)) * con
-        treatment['PLX-4720'] = (arg["ratio"] / 100.0) * con
-
-        simulator.initialize(arg["cell_line"])
-        rel_proliferation = simulator.apply_treatment(treatment)
-        simulator.initialized = False
-
-        res.append(rel_proliferation)
-    return res
-
-def two_drug_baseline(cell_line, max_concentration=8000, step_size=10, workers=8):
+    simulator = worker_simulator(arg["cell_line"], arg["warm_start"])
+    concentrations = np.array(arg["concentations"], dtype=float)
+    treatments = np.zeros((len(concentrations), len(DRUGS)))
+    treatments[:, DRUGS.index('PD0325901')] = (1 - (arg["ratio"] / 100.0)) * concentrations
+    treatments[:, DRUGS.index('PLX-4720')] = (arg["ratio"] / 100.0) * concentrations
+    return simulate_grid(simulator, treatments, arg["threads"], arg["warm_start"])
+
+def two_drug_baseline(cell_line, max_concentration=8000, step_size=10, workers=8, threads=None, warm_start=False):
     assert max_concentration % step_size == 0, "max_concentration needs to be a multiple of the step size."
 
     steps = max_concentration // step_size + 1
@@ -109,6 +134,8 @@ def two_drug_baseline(cell_line, max_concentration=8000, step_size=10, workers=8
                 'ratio': r,
                 'cell_line': cell_line,
                 'concentations': batch,
+                'threads': threads_per_worker(workers, threads),
+                'warm_start': warm_start,
             }
             jobs.append(job)
 
@@ -2,10 +2,20 @@ from abc import ABC, abstractmethod
 import numpy as np
 
 class Objective(ABC):
+    """Objective value of a treatment from the relative proliferation of every cell line.
+
+    Subclasses implement eval. Subclasses which are used with score_objectives also implement aggregate,
+    which combines the proliferations of many treatments at once, without the dosage penalty.
+    """
+
     @abstractmethod
     def eval(self, rel_proliferations, action_dict):
         raise NotImplementedError()
 
+    def aggregate(self, rel_proliferations):
+        """Combines a matrix of relative proliferations, one row per treatment, into one value per treatment."""
+        raise TypeError(type(self).__name__ + " does not implement aggregate, which score_objectives requires.")
+
 class SingleLinear(Objective):
     def __init__(self, lambd):
         self.lambd = lambd
@@ -19,6 +29,10 @@ class SingleLinear(Objective):
         val = rel_proliferations[0] + self.lambd * total_dosage 
         return val
 
+    def aggregate(self, rel_proliferations):
+        assert rel_proliferations.shape[1] == 1, "Objective not designed for multi-cell experiments."
+        return rel_proliferations[:, 0]
+
 class MultiAvgLinear(Objective):
     def __init__(self, lambd):
         self.lambd = lambd
@@ -31,6 +45,9 @@ class MultiAvgLinear(Objective):
         val = np.average(rel_proliferations) + self.lambd * total_dosage 
         return val
 
+    def aggregate(self, rel_proliferations):
+        return np.average(rel_proliferations, axis=1)
+
 class MultiWorstLinear(Objective):
     def __init__(self, lambd):
         self.lambd = lambd
@@ -43,6 +60,9 @@ class MultiWorstLinear(Objective):
         val = max(rel_proliferations) + self.lambd * total_dosage 
         return val
 
+    def aggregate(self, rel_proliferations):
+        return np.max(rel_proliferations, axis=1)
+
 # -------------------------------------------------------------------------------------------------
 
 def retrieve_multi_objective(obj, lambd):
@@ -53,3 +73,27 @@ def retrieve_multi_objective(obj, lambd):
     else:
         raise ValueError("The specified objective type is unknown.")
     return objective
+
+def score_objectives(rel_proliferations, dosages, objectives):
+    """Evaluates several linear objectives on the same simulations at once.
+
+    Args:
+        rel_proliferations: Matrix of relative proliferations, one row per treatment and one column per cell line.
+        dosages: Total dosage of every treatment.
+        objectives: List of linear objectives, e.g. the same aggregation for several lambdas.
+
+    Returns:
+        ys: Matrix of objective values, one row per objective and one column per treatment.
+    """
+    rel_proliferations = np.atleast_2d(rel_proliferations)
+    dosages = np.asarray(dosages, dtype=float)
+    if len(objectives) == 0:
+        return np.zeros((0, len(dosages)))
+    # every aggregation is computed once, the penalties of all lambdas are added in one outer product
+    aggregated = {}
+    for objective in objectives:
+        if type(objective) not in aggregated:
+            aggregated[type(objective)] = objective.aggregate(rel_proliferations)
+    base = np.array([aggregated[type(objective)] for objective in objectives])
+    lambdas = np.array([objective.lambd for objective in objectives], dtype=float)
+    return base + np.outer(lambdas, dosages)
@@ -4,19 +4,19 @@ It uses a reward and a penalty function to convert an array of proliferation val
 """
 
 import os,sys,inspect
+import time
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0,parentdir) 
 import numpy as np
-from scipy.stats import lognorm
-from pprint import pprint
 import gym
 from gym import spaces
-from reference_simulator.simulator import Simulator
-from src.env.drugs import empty_treatment
-from util.prepare_dict import prepare_dict
+from src.reference_simulator.simulator import Simulator
+from src.env.drugs import DRUGS, empty_treatment
+from src.util.prepare_dict import prepare_dict, prepare_batch
 from multiprocessing import Manager
 from src.util.pool_hack import MyPool
+from src.util.bootstrap import prepare_bootstrap, report_worker, collect_reports
 
 EPS = 1e-6
 
@@ -24,11 +24,12 @@ EPS = 1e-6
 # Worker administration
 # -------------------------------------------------------------------
 
-def initialize(init_queue): # TODO: Make sure it is one simulator per cell line and no switches
+def initialize(init_queue, simulator_options, report_queue, spawn_time): # TODO: Make sure it is one simulator per cell line and no switches
     global cell_line
     global simulator
     cell_line = init_queue.get()
-    simulator = Simulator()
+    simulator = Simulator(**simulator_options)
+    report_worker(report_queue, cell_line, spawn_time)
 
 def reset_worker(line): # TODO: Implement reset of simulator
     global cell_line
@@ -37,9 +38,14 @@ def reset_worker(line): # TODO: Implement reset of simulator
     obs = simulator.initialize(cell_line)
     return (cell_line, obs) # TODO: Why do we return the cell line here?
 
-def execute_experiment(treatment):
+def execute_experiment(job):
     global cell_line
     global simulator
+    treatment, state = job
+    if state is not None: # continue from a restored snapshot
+        if not simulator.initialized:
+            simulator.initialize(cell_line)
+        simulator.R = state[cell_line]
     rel_proliferation = simulator.apply_treatment(treatment)
     return (cell_line, rel_proliferation)
 
@@ -54,19 +60,40 @@ class SimulatorEnv(gym.Env):
     reward functions that take a vector of relative proliferation rates as input. 
      """
 
-    def __init__(self, n_steps, cell_lines, max_dosage, objective, domain, scale):
+    def __init__(self, n_steps, cell_lines, max_dosage, objective, domain, scale, batched=False, threads=1, compose=False, cache=None, warm_start=False,
+        bootstrap=None, report_queue=None):
         """Initializes a new bio-steering environment.
 
         Args:
             n_steps: Length of sequential treatment plan.
+            batched: If set to true, all cell lines are simulated together in a single solver call
+                of an in-process simulator instead of one worker process per cell line.
+            threads: Number of threads AMICI uses for batched simulations.
+            compose: If set to true, simulators cache step ratios and compose multi-step results from them.
+            cache: Path of a persistent proliferation cache shared by all simulators or None.
+            warm_start: If set to true, simulators start steady state solves from the closest known steady state.
+            bootstrap: Start mode of the workers, see src.util.bootstrap.prepare_bootstrap.
+            report_queue: Queue which receives the footprint of every started worker. If not specified,
+                the environment creates its own queue.
         """
 
         self.cell_lines = cell_lines
         self.max_dosage = max_dosage
         self.objective = objective
         self.scale = scale
+        self.batched = batched
+        self.threads = threads
+        self.simulator_options = {"compose": compose, "cache": cache, "warm_start": warm_start}
+        self.bootstrap = bootstrap
+        self.report_queue = report_queue
+        self.prolifs = np.ones(len(cell_lines))
+        self.restored = None
 
-        self.worker_pool = self.initialize_workers(cell_lines)
+        if self.batched:
+            self.simulator = Simulator(**self.simulator_options)
+            self.worker_pool = None
+        else:
+            self.worker_pool = self.initialize_workers(cell_lines)
 
         self.num_actions = 7 # there are 7 drugs
         self.n_steps = n_steps
@@ -93,14 +120,52 @@ class SimulatorEnv(gym.Env):
         cellQueue = manager.Queue()
         for cell_line in cell_lines:
             cellQueue.put(cell_line)
-        worker_pool = MyPool(len(cell_lines), initialize, (cellQueue,))
+        if self.report_queue is None:
+            self.report_queue = manager.Queue()
+        start_method = prepare_bootstrap(self.bootstrap)
+        worker_pool = MyPool(len(cell_lines), initialize, (cellQueue, self.simulator_options, self.report_queue, time.time()),
+            start_method=start_method)
         return worker_pool
 
+    def worker_report(self):
+        """Returns the footprint and spawn latency of the workers which have been started so far."""
+        if self.report_queue is None:
+            return []
+        return collect_reports(self.report_queue)
+
     def terminate(self):
+        if self.worker_pool is None:
+            return
         # Python guaranetees closure of all processes.
         self.worker_pool.close()
         self.worker_pool.join()
 
+    def snapshot(self):
+        """Captures the state of the current episode.
+
+        Returns:
+            snapshot: Dictionary with the step counter, the cumulative treatment and the relative
+                proliferation of every cell line, which can be passed to restore.
+        """
+        return {
+            "step_counter": self.step_counter,
+            "commulative_treatment": dict(self.commulative_treatment),
+            "prolifs": self.prolifs.copy(),
+        }
+
+    def restore(self, snapshot):
+        """Continues the episode from a snapshot without replaying its steps.
+
+        Args:
+            snapshot: Snapshot of an episode of an environment with the same cell lines.
+        """
+        assert len(snapshot["prolifs"]) == len(self.cell_lines), "Snapshot belongs to different cell lines."
+        self.step_counter = snapshot["step_counter"]
+        self.commulative_treatment = dict(snapshot["commulative_treatment"])
+        self.prolifs = snapshot["prolifs"].copy()
+        if not self.batched: # the workers pick up their proliferation with the next step
+            self.restored = dict(zip(self.cell_lines, self.prolifs))
+
     def sort_by_cell_line(self, results):
         vs = []
         for line in self.cell_lines:
@@ -116,8 +181,14 @@ class SimulatorEnv(gym.Env):
         
         :return observation: Initial observation of the environment.
         '''
-        results = self.worker_pool.map(reset_worker, self.cell_lines)
-        obs = self.sort_by_cell_line(results)
+        if self.batched:
+            self.prolifs = np.ones(len(self.cell_lines))
+            obs = self.prolifs.copy()
+        else:
+            results = self.worker_pool.map(reset_worker, self.cell_lines)
+            obs = self.sort_by_cell_line(results)
+            self.prolifs = obs.copy()
+        self.restored = None
         self.step_counter = 0
         self.commulative_treatment = empty_treatment()
         return obs
@@ -139,10 +210,17 @@ class SimulatorEnv(gym.Env):
         action_dict = prepare_dict(action,  max_dosage=self.max_dosage, scale=self.scale)
         for k in action_dict:
             self.commulative_treatment[k] += action_dict[k]
-        jobs = [action_dict for _ in range(len(self.cell_lines))]
-        
-        results = self.worker_pool.map(execute_experiment, jobs)
-        rel_proliferations = self.sort_by_cell_line(results)
+
+        if self.batched:
+            concentrations = [action_dict[drug] for drug in DRUGS]
+            self.prolifs = self.prolifs * self.simulator.simulate_lines(self.cell_lines, concentrations, num_threads=self.threads)
+            rel_proliferations = self.prolifs.copy()
+        else:
+            jobs = [(action_dict, self.restored) for _ in range(len(self.cell_lines))]
+            results = self.worker_pool.map(execute_experiment, jobs)
+            rel_proliferations = self.sort_by_cell_line(results)
+            self.prolifs = rel_proliferations.copy()
+            self.restored = None
         # NOTE: For now we return the proliferation values as observation
         obs = np.array(rel_proliferations)
         reward = self.objective.eval(rel_proliferations, self.commulative_treatment)
@@ -152,3 +230,118 @@ class SimulatorEnv(gym.Env):
             return obs, reward, False, {}
         else:
             return obs, reward, True, {}
+
+
+class VectorSimulatorEnv(gym.Env):
+    """
+    Vectorized version of SimulatorEnv which steps a whole batch of treatment plans at once. All
+    sub-environments share one in-process simulator and every step evaluates all (plan, cell line)
+    pairs in a single batched simulation. Observations and rewards are returned as numpy arrays.
+    """
+
+    def __init__(self, n_envs, n_steps, cell_lines, max_dosage, objective, domain, scale, threads=1, compose=False, cache=None, warm_start=False):
+        """Initializes a new vectorized bio-steering environment.
+
+        Args:
+            n_envs: Number of sub-environments which are stepped together.
+            n_steps: Length of sequential treatment plan.
+            threads: Number of threads AMICI uses for batched simulations.
+            compose: If set to true, the simulator caches step ratios and composes multi-step results from them.
+            cache: Path of a persistent proliferation cache or None.
+            warm_start: If set to true, the simulator starts steady state solves from the closest known steady state.
+        """
+        self.n_envs = n_envs
+        self.n_steps = n_steps
+        self.cell_lines = cell_lines
+        self.max_dosage = max_dosage
+        self.objective = objective
+        self.scale = scale
+        self.threads = threads
+        self.simulator = Simulator(compose=compose, cache=cache, warm_start=warm_start)
+        self.num_actions = 7 # there are 7 drugs
+
+        if domain.dim > 7: # this extracts the domain for the individual step
+            self.domain = domain.single
+        else:
+            self.domain = domain
+
+        self.observation_space = spaces.Box(
+            low=np.zeros(1),
+            high= np.ones(1),
+            dtype=np.float32
+        )
+        self.reset()
+
+    def terminate(self):
+        if self.simulator.cache is not None:
+            self.simulator.cache.close()
+
+    def reset(self, n_envs=None):
+        '''
+        Resets all sub-environments.
+
+        :param n_envs: new number of sub-environments, keeps the current number if None
+        :return observation: numpy array of shape (n_envs, n_lines) with the initial proliferations
+        '''
+        if n_envs is not None:
+            self.n_envs = n_envs
+        self.prolifs = np.ones((self.n_envs, len(self.cell_lines)))
+        self.commulative_treatments = np.zeros((self.n_envs, len(DRUGS)))
+        self.step_counter = 0
+        return self.prolifs.copy()
+
+    def snapshot(self):
+        """Captures the state of all sub-environments, see SimulatorEnv.snapshot."""
+        return {
+            "step_counter": self.step_counter,
+            "commulative_treatments": self.commulative_treatments.copy(),
+            "prolifs": self.prolifs.copy(),
+        }
+
+    def restore(self, snapshot, indices=None):
+        """Continues from a snapshot without replaying its steps.
+
+        Args:
+            snapshot: Snapshot of a vectorized environment with the same cell lines.
+            indices: Sub-environments of the snapshot to continue from. An index can be repeated
+                to branch several plans from the same prefix. Defaults to all sub-environments.
+        """
+        if indices is None:
+            indices = np.arange(len(snapshot["prolifs"]))
+        self.n_envs = len(indices)
+        self.step_counter = snapshot["step_counter"]
+        self.commulative_treatments = snapshot["commulative_treatments"][indices].copy()
+        self.prolifs = snapshot["prolifs"][indices].copy()
+
+    def step(self, actions, verbose=False):
+        '''
+        Runs one time step of every sub-environment.
+
+        :param actions: numpy array of shape (n_envs, 7) with one action per sub-environment
+        :return observation: numpy array of shape (n_envs, n_lines) with the relative proliferations
+        :return reward: numpy array of shape (n_envs,) with the objective of every sub-environment
+        :return done: numpy array of shape (n_envs,) which is true once the episodes have ended
+        :return info: list with one dictionary of auxiliary information per sub-environment
+        '''
+        actions = np.asarray(actions, dtype=float)
+        assert self.step_counter < self.n_steps, "Environment has already terminated."
+        assert actions.shape == (self.n_envs, len(DRUGS)), "Expected one action per sub-environment."
+        for action in actions:
+            assert self.domain.contains(action), "The provided actions does not belong to the domain."
+
+        concentrations = prepare_batch(actions, max_dosage=self.max_dosage, scale=self.scale)
+        self.commulative_treatments += concentrations
+
+        n_lines = len(self.cell_lines)
+        lines = list(self.cell_lines) * self.n_envs
+        ratios = self.simulator.simulate_pairs(lines, np.repeat(concentrations, n_lines, axis=0), num_threads=self.threads, verbose=verbose)
+        self.prolifs = self.prolifs * ratios.reshape(self.n_envs, n_lines)
+
+        obs = self.prolifs.copy()
+        rewards = np.array([
+            self.objective.eval(obs[i], dict(zip(DRUGS, self.commulative_treatments[i]))) for i in range(self.n_envs)
+        ])
+
+        self.step_counter += 1
+        dones = np.full(self.n_envs, self.step_counter >= self.n_steps)
+        return obs, rewards, dones, [{} for _ in range(self.n_envs)]
@@ -0,0 +1,8 @@
+"""
+Importing this module loads the model and the condition table. It is used as preload module of the
+forkserver so that every forked worker starts with the model already in memory.
+"""
+
+from src.reference_simulator.simulator import preload
+
+preload()
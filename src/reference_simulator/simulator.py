@@ -1,22 +1,223 @@
 import os
 import sys
 import importlib
-import amici
-import pandas as pd
+import hashlib
+import time
+import warnings
+from collections import OrderedDict
 import numpy as np
-from src.env.drugs import empty_treatment
+from src.env.drugs import DRUGS, empty_treatment
+from src.util.cache import ProliferationCache
 
 MODEL_NAME = 'ERBB_RAS_AKT_Drugs'
-CONDITIONS = pd.read_csv('./src/reference_simulator/conditions_petab.tsv', sep='\t')
+MODEL_PATH = os.path.abspath("") + "/src/reference_simulator/" + MODEL_NAME
+CONDITIONS_PATH = './src/reference_simulator/conditions_petab.tsv'
+CONDITIONS_CACHE = './artifacts/cache/'
 ZERO_TREATMENT = empty_treatment()
 
-sys.path.insert(0, os.path.abspath("") + "/src/reference_simulator/" + MODEL_NAME)
-model_module = importlib.import_module(MODEL_NAME)
+# upper bound for the number of step ratios kept in composition mode
+MAX_CACHED_STEPS = 100000
+
+# number of steady states kept per cell line for warm starts
+MAX_STORED_STATES = 256
+
+# treatment plan used to verify that steady states do not depend on the treatment history
+VERIFICATION_PLAN = [
+    {drug: 8000.0 / len(DRUGS) for drug in DRUGS},
+    {drug: (8000.0 if drug == 'PD0325901' else 0.0) for drug in DRUGS},
+    {drug: (4000.0 if drug in ['Lapatinib', 'Erlotinib'] else 0.0) for drug in DRUGS},
+    empty_treatment(),
+]
+
+# NOTE: AMICI, the compiled model and the condition table are only loaded on first use. This keeps
+# the import of this module cheap for processes which never simulate, e.g. the parents of pools.
+amici = None
+_model_module = None
+_conditions = None
+_condition_table = None
+
+def load_model():
+    """Imports AMICI and the compiled model module on first use and returns the model module."""
+    global amici
+    global _model_module
+    if _model_module is None:
+        amici = importlib.import_module("amici")
+        sys.path.insert(0, MODEL_PATH)
+        _model_module = importlib.import_module(MODEL_NAME)
+    return _model_module
+
+def load_condition_frame():
+    """Returns the condition table as a pandas DataFrame and reads it on first use."""
+    global _conditions
+    if _conditions is None:
+        import pandas as pd
+        _conditions = pd.read_csv(CONDITIONS_PATH, sep='\t')
+    return _conditions
+
+def load_condition_table():
+    """Returns the condition ids, numeric columns and values of the condition table.
+
+    The table is read from a binary copy in the CONDITIONS_CACHE directory which is created on first use.
+    The copy is keyed on the hash of the tsv file, so a changed table is never read from a stale copy.
+    Reading it does not require pandas.
+    """
+    global _condition_table
+    if _condition_table is None:
+        with open(CONDITIONS_PATH, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()[:16]
+        path = os.path.join(CONDITIONS_CACHE, "conditions_petab_" + digest + ".npz")
+        if os.path.isfile(path):
+            with np.load(path) as data:
+                _condition_table = ([str(c) for c in data["ids"]], [str(c) for c in data["columns"]], data["values"])
+        else:
+            frame = load_condition_frame()
+            numeric = frame.select_dtypes(include=[np.number])
+            _condition_table = (list(frame.conditionId.values), list(numeric.columns), numeric.values.astype(float))
+            try:
+                os.makedirs(CONDITIONS_CACHE, exist_ok=True)
+                np.savez(path, ids=np.array(_condition_table[0]), columns=np.array(_condition_table[1]),
+                    values=_condition_table[2])
+            except OSError:
+                pass # the cache is only an optimization
+    return _condition_table
+
+_template = None
+
+def preload():
+    """Loads the model, the condition table and a template model into this process.
+
+    Simulators created afterwards clone the template. Processes which are forked after the preload
+    share the loaded model copy-on-write instead of loading it again.
+    """
+    global _template
+    if _template is None:
+        _template = load_model().getModel()
+        parameter_binding(_template)
+
+def __getattr__(name):
+    # module level names of the eagerly loading version of this module
+    if name == "CONDITIONS":
+        return load_condition_frame()
+    if name == "model_module":
+        return load_model()
+    raise AttributeError(f"module {__name__} has no attribute {name}")
+
+_fingerprint = None
+
+def model_fingerprint():
+    """Returns a hash of the compiled model binaries which identifies results of this model."""
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha1(MODEL_NAME.encode())
+        model_dir = os.path.dirname(os.path.abspath(load_model().__file__))
+        for root, _, files in sorted(os.walk(model_dir)):
+            for f in sorted(files):
+                if f.endswith(".so") or f.endswith(".pyd"):
+                    with open(os.path.join(root, f), "rb") as binary:
+                        digest.update(binary.read())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+def solver_steps(rdata):
+    """Returns the number of solver steps of a simulation including the steady state search."""
+    steps = 0
+    for field in ["numsteps", "preeq_numsteps", "posteq_numsteps"]:
+        try:
+            value = rdata[field]
+        except (KeyError, AttributeError):
+            continue # field is not provided by this AMICI version
+        if value is not None:
+            steps += int(np.sum(np.maximum(value, 0)))
+    return steps
 
 # NOTE: Below might be useful if we want to use simulator attributes later on
 # amici.getSimulationStatesAsDataFrame(self.model, edatas, rdatas) 
 
 
+class ParameterBinding(object):
+    """Precomputed mapping from cell lines and drugs to the fixed parameter vector of the model.
+
+    The binding is built once per process from the condition table and replaces the lookup of
+    parameter ids and names on every call. All model instances share the same parameter layout.
+
+    Attributes:
+        drug_indices: Numpy array with the positions of the drugs ordered as in DRUGS.
+        drug_index: Dictionary from drug name to its position in the fixed parameter vector.
+        lines: Dictionary from condition id to the fixed parameter vector of the cell line.
+    """
+
+    def __init__(self, model):
+        fixed_parameter_ids = list(model.getFixedParameterIds())
+        fixed_parameter_names = list(model.getFixedParameterNames())
+        defaults = np.array(model.getFixedParameters())
+
+        self.drug_indices = np.array([fixed_parameter_names.index(drug) for drug in DRUGS])
+        self.drug_index = dict(zip(DRUGS, self.drug_indices))
+
+        condition_ids, columns, values = load_condition_table()
+        selected = [i for i, col in enumerate(columns) if col in fixed_parameter_ids]
+        positions = [fixed_parameter_ids.index(columns[i]) for i in selected]
+        self.lines = {}
+        for condition_id, row in zip(condition_ids, values[:, selected]):
+            fixed_parameters = defaults.copy()
+            fixed_parameters[positions] = row
+            self.lines[condition_id] = fixed_parameters
+
+    def conditions(self, cell_line):
+        """Returns a copy of the fixed parameter vector of a cell line.
+
+        Raises:
+            ValueError: If specified cell line is unknown.
+        """
+        condition_id = f'TUMOR-{cell_line}-cellline-01-01'
+        if condition_id not in self.lines:
+            raise ValueError(f'Requested cell-line "{cell_line}" has no condition data.')
+        return self.lines[condition_id].copy()
+
+_binding = None
+
+def parameter_binding(model):
+    """Returns the parameter binding of this process and builds it on first use."""
+    global _binding
+    if _binding is None:
+        _binding = ParameterBinding(model)
+    return _binding
+
+
+class SteadyStateStore(object):
+    """Keeps the most recent steady states of a cell line indexed by their drug concentrations.
+
+    Distances between dose vectors are measured on a log-scale since the effect of a drug changes
+    with the order of magnitude of its concentration rather than with the absolute difference.
+
+    Attributes:
+        capacity: Maximum number of stored states. The oldest state is replaced once it is reached.
+        doses: Log-scaled drug concentrations of the stored states.
+        states: Stored steady state vectors.
+    """
+
+    def __init__(self, capacity=MAX_STORED_STATES):
+        self.capacity = capacity
+        self.doses = np.zeros((capacity, len(DRUGS)))
+        self.states = [None] * capacity
+        self.size = 0
+        self.position = 0
+
+    def nearest(self, concentrations):
+        """Returns the stored state with the closest dose vector or None if the store is empty."""
+        if self.size == 0:
+            return None
+        distances = np.sum((self.doses[:self.size] - np.log1p(concentrations)) ** 2, axis=1)
+        return self.states[int(np.argmin(distances))]
+
+    def add(self, concentrations, state):
+        """Stores a solved steady state for the given drug concentrations."""
+        self.doses[self.position] = np.log1p(concentrations)
+        self.states[self.position] = np.array(state)
+        self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+
 class Simulator(object):
     """A wrapper class for Fabian's initial cancer cell model which provides some useful interfaces.
 
@@ -31,17 +232,51 @@ class Simulator(object):
         solver: Private instance of solver.
         initialized: Flag that marks if simulator has been initialized yet.
         R: Overall proliferation rate.
+        compose: Flag that marks if step ratios are cached and composed into multi-step results.
+        step_ratios: Cache from (cell line, drug concentrations) to the ratio of a single step.
+        cache: Persistent cache of step ratios shared with other processes or None.
+        warm_start: Flag that marks if steady state solves start from the closest known steady state.
+        cold_lines: Cell lines which failed the warm start check and are solved from the initial state.
+        steady_states: Dictionary from cell line to the SteadyStateStore of the line.
     """
 
-    def __init__(self):
-        ''' Instantiate simulator with private objects.'''
-        self.model = model_module.getModel()
+    def __init__(self, compose=False, cache=None, warm_start=False):
+        ''' Instantiate simulator with private objects.
+
+        Args:
+            compose: If set to true, the proliferation ratio of every step is cached per cell line and
+                dose vector. Since every step runs to steady state from the initial state of the model,
+                the proliferation of a treatment plan is the product of its step ratios and repeated
+                steps do not need to be simulated again.
+            cache: Path of a persistent proliferation cache. If specified, step ratios are looked up
+                in the cache before they are simulated and stored in it afterwards.
+            warm_start: If set to true, every steady state solve starts from the stored steady state of
+                the same cell line with the closest dose vector instead of the initial state of the model.
+                This is only valid if steady states do not depend on the history, which is verified once
+                per cell line. A line which fails the check is solved from the initial state with a warning.
+        '''
+        self.model = _template.clone() if _template is not None else load_model().getModel()
         self.solver = self.model.getSolver()
         self.zero_term = None
+        self.zero_terms = {}
         self.line = None
         self.initialized = False
         self.R = -1
-        
+        self.compose = compose
+        self.step_ratios = OrderedDict()
+        self.verified_lines = set()
+        self.cold_lines = set()
+        self.composition_hits = 0
+        self.composition_misses = 0
+        self.solves = 0
+        self.solve_time = 0.0
+        self.solver_steps = 0
+        self.warm_start = warm_start
+        self.steady_states = {}
+        self.cache = None
+        if cache is not None:
+            self.cache = ProliferationCache(model_fingerprint(), path=cache)
+
 
     def load_conditions(self, cell_line):
         """ Loads conditions for requested cell line into model
@@ -52,12 +287,25 @@ class Simulator(object):
             Raises:
                 ValueError: If specified cell line is unknown.
         """
-        condition = CONDITIONS.loc[CONDITIONS.conditionId == f'TUMOR-{cell_line}-cellline-01-01', :]
-        if len(condition) == 0:
-            raise ValueError(f'Requested cell-line "{cell_line}" has no condition data.')
-        for col in condition.columns:
-            if col in self.model.getFixedParameterIds():
-                self.model.setFixedParameterById(col, condition[col].values[0])
+        binding = parameter_binding(self.model)
+        fixed_parameters = binding.conditions(cell_line)
+        # drug concentrations are not part of the conditions and remain as they are
+        fixed_parameters[binding.drug_indices] = np.array(self.model.getFixedParameters())[binding.drug_indices]
+        self.model.setFixedParameters(fixed_parameters.tolist())
+
+    def condition_parameters(self, cell_line):
+        """ Returns the fixed parameter vector of the model with the conditions of a cell line.
+
+            Args:
+                cell_line: String specifying cell line to simulate.
+
+            Returns:
+                fixed_parameters: Numpy array ordered as the fixed parameters of the model.
+
+            Raises:
+                ValueError: If specified cell line is unknown.
+        """
+        return parameter_binding(self.model).conditions(cell_line)
 
     def load_drug_concentrations(self, concentrations, verbose=False):
         """ Loads specified drug simulation into model.
@@ -66,13 +314,21 @@ class Simulator(object):
                 concentrations: Dictionary specifying the concentrations of the 7 drugs.
                 verbose: If set to true, prints drug concentrations.
         """
+        drug_index = parameter_binding(self.model).drug_index
+        fixed_parameters = np.array(self.model.getFixedParameters())
         for drug, conc in concentrations.items():
-            parameter_id = self.model.getFixedParameterIds()[
-                self.model.getFixedParameterNames().index(drug)
-            ]
-            self.model.setFixedParameterById(parameter_id, conc)
+            fixed_parameters[drug_index[drug]] = conc
             if verbose:
                 print(f'{drug}: {conc}')
+        self.model.setFixedParameters(fixed_parameters.tolist())
+
+    def drug_parameter_indices(self):
+        """ Returns the positions of the 7 drugs in the fixed parameter vector of the model.
+
+            Returns:
+                indices: Numpy array of fixed parameter indices ordered as in DRUGS.
+        """
+        return parameter_binding(self.model).drug_indices
 
     def initialize(self, cell_line):
         """Prepares experiment for requested cell line.
@@ -96,11 +352,16 @@ class Simulator(object):
         self.load_conditions(cell_line)
         self.load_drug_concentrations(ZERO_TREATMENT)
 
+        if self.warm_start:
+            self.check_composition(cell_line)
+
         # compute growth term for zero treatment only once
         if self.zero_term is None:
             edata_ref = amici.ExpData(self.model.get())
+            self.seed_state(edata_ref, cell_line, np.zeros(len(DRUGS)))
             edatas = [edata_ref]
-            rdatas = amici.runAmiciSimulations(self.model, self.solver, edatas)
+            rdatas = self.run_simulations(edatas)
+            self.record_state(cell_line, np.zeros(len(DRUGS)), rdatas[0])
             self.zero_term = rdatas[0]["y"][0, 0]
             self.line = cell_line
 
@@ -127,16 +388,367 @@ class Simulator(object):
         assert self.initialized, "Simulator has not been initialized before first use."
         
         self.load_drug_concentrations(concentrations, verbose=verbose)
-        
+
+        if self.compose or self.cache is not None:
+            key = self.step_key(self.line)
+            ratio = self.cached_ratio(key)
+            if ratio is None:
+                ratio = self.simulate_step(verbose=verbose)
+                self.store_ratio(key, ratio)
+        else:
+            ratio = self.simulate_step(verbose=verbose)
+        self.R  = self.R * ratio
+
+        if verbose:
+            print(f'relative proliferation'f'{self.R}')
+
+        return self.R 
+
+    def simulate_step(self, verbose=False):
+        '''Runs the loaded model until steady state and returns the ratio to the zero treatment.
+
+        Args:
+            verbose: If set to true, prints the time to steady state.
+
+        Returns:
+            ratio: Growth term of the loaded treatment divided by the growth term of the zero treatment.
+        '''
+        concentrations = np.array(self.model.getFixedParameters())[self.drug_parameter_indices()]
         edata_cond = amici.ExpData(self.model.get())
+        self.seed_state(edata_cond, self.line, concentrations)
         edatas = [edata_cond]
-        rdatas = amici.runAmiciSimulations(self.model, self.solver, edatas)
+        rdatas = self.run_simulations(edatas)
+        self.record_state(self.line, concentrations, rdatas[0])
 
         cond_term = rdatas[0]["y"][0, 0]
-        self.R  = self.R * (cond_term / self.zero_term)
-
         if verbose:
             print(f'time to steadystate {rdatas[0]["t_steadystate"]}')
-            print(f'relative proliferation'f'{self.R}')
 
-        return self.R 
+        return cond_term / self.zero_term
+
+    def run_simulations(self, edatas, num_threads=1):
+        '''Runs the simulations of the model and records how long they took.
+
+        Args:
+            edatas: List of ExpData objects, one per simulation.
+            num_threads: Number of threads AMICI uses for the simulations.
+
+        Returns:
+            rdatas: List of ReturnData objects, one per simulation.
+        '''
+        start = time.perf_counter()
+        rdatas = amici.runAmiciSimulations(self.model, self.solver, edatas, num_threads=num_threads)
+        self.solve_time += time.perf_counter() - start
+        self.solves += len(rdatas)
+        self.solver_steps += sum(solver_steps(rdata) for rdata in rdatas)
+        return rdatas
+
+    def solve_statistics(self):
+        """Returns number, accumulated wall time and solver steps of all simulations so far."""
+        return {"solves": self.solves, "time": self.solve_time, "steps": self.solver_steps}
+
+    def seed_state(self, edata, cell_line, concentrations):
+        """ Sets the initial state of a simulation to the closest stored steady state in warm start mode.
+
+            Args:
+                edata: ExpData of the simulation.
+                cell_line: String specifying the simulated cell line.
+                concentrations: Drug concentrations of the simulation ordered as in DRUGS.
+        """
+        if not self.warm_start or cell_line not in self.steady_states or cell_line in self.cold_lines:
+            return
+        state = self.steady_states[cell_line].nearest(concentrations)
+        if state is not None:
+            edata.x0 = state.tolist()
+
+    def record_state(self, cell_line, concentrations, rdata):
+        """ Stores the steady state of a finished simulation in warm start mode.
+
+            Args:
+                cell_line: String specifying the simulated cell line.
+                concentrations: Drug concentrations of the simulation ordered as in DRUGS.
+                rdata: Result of the simulation.
+        """
+        if not self.warm_start or rdata["status"] != amici.AMICI_SUCCESS:
+            return
+        if cell_line not in self.steady_states:
+            self.steady_states[cell_line] = SteadyStateStore()
+        self.steady_states[cell_line].add(concentrations, rdata["x"][0, :])
+
+    def step_key(self, cell_line, concentrations=None):
+        """ Returns the key of a single step in the step ratio cache.
+
+            Args:
+                cell_line: String specifying the simulated cell line.
+                concentrations: Drug concentrations ordered as in DRUGS. If not specified, the
+                    concentrations currently loaded into the model are used.
+
+            Returns:
+                key: Tuple of cell line and drug concentrations.
+        """
+        if concentrations is None:
+            concentrations = np.array(self.model.getFixedParameters())[self.drug_parameter_indices()]
+        return (cell_line, tuple(float(c) for c in concentrations))
+
+    def cached_ratio(self, key):
+        """ Looks up the ratio of a single step in the composition cache and the persistent cache.
+
+            Args:
+                key: Key as returned by step_key.
+
+            Returns:
+                ratio: Proliferation ratio of the step or None if it has not been simulated yet.
+        """
+        if self.compose and key in self.step_ratios:
+            self.step_ratios.move_to_end(key)
+            self.composition_hits += 1
+            return self.step_ratios[key]
+        if self.cache is not None:
+            ratio = self.cache.get(key[0], key[1])
+            if ratio is not None:
+                if self.compose:
+                    self.cache_step_ratio(key, ratio)
+                return ratio
+        return None
+
+    def store_ratio(self, key, ratio):
+        """ Stores the simulated ratio of a single step in all enabled caches.
+
+            Args:
+                key: Key as returned by step_key.
+                ratio: Proliferation ratio of the step.
+        """
+        if self.compose:
+            self.cache_step_ratio(key, ratio)
+            self.composition_misses += 1
+        if self.cache is not None:
+            self.cache.put(key[0], key[1], ratio)
+
+    def cache_step_ratio(self, key, ratio):
+        """ Stores the ratio of a single step and evicts the least recently used entries.
+
+            Args:
+                key: Key as returned by step_key.
+                ratio: Proliferation ratio of the step.
+        """
+        self.step_ratios[key] = ratio
+        self.step_ratios.move_to_end(key)
+        while len(self.step_ratios) > MAX_CACHED_STEPS:
+            self.step_ratios.popitem(last=False)
+
+    def check_composition(self, cell_line):
+        """ Verifies that warm starts are valid for a cell line unless it has been checked before.
+
+            A line whose steady states depend on the treatment history is solved from the initial state
+            of the model from then on, since a seeded solve could end in a different steady state.
+
+            Args:
+                cell_line: String specifying cell line to simulate.
+        """
+        if cell_line in self.verified_lines:
+            return
+        if not self.verify_composition(cell_line):
+            warnings.warn(f'Steady states of cell line "{cell_line}" depend on the treatment history, '
+                'it is solved without warm starts.')
+            self.cold_lines.add(cell_line)
+        self.verified_lines.add(cell_line)
+
+    def verify_composition(self, cell_line, treatments=VERIFICATION_PLAN, rtol=1e-6, verbose=False):
+        '''Checks that the steady states of a cell line do not depend on the treatment history.
+
+        Simulates the treatment plan twice. Once every step starts from the steady state reached by
+        the previous step, once every step starts from the initial state of the model, which is what
+        apply_treatment does. Warm starts are only valid if both agree.
+
+        Args:
+            cell_line: String specifying cell line to simulate.
+            treatments: List of treatment dictionaries which is used for the check.
+            rtol: Tolerated relative deviation of the growth terms.
+            verbose: If set to true, prints the deviation of every step.
+
+        Returns:
+            valid: True if the growth terms agree for every step of the plan.
+        '''
+        self.model.setTimepoints([np.infty])
+        self.load_conditions(cell_line)
+        self.load_drug_concentrations(ZERO_TREATMENT)
+        rdatas = amici.runAmiciSimulations(self.model, self.solver, [amici.ExpData(self.model.get())])
+        state = rdatas[0]["x"][0, :]
+
+        valid = True
+        for treatment in treatments:
+            self.load_drug_concentrations(treatment)
+            edata_history = amici.ExpData(self.model.get())
+            edata_history.x0 = state.tolist()
+            edata_fresh = amici.ExpData(self.model.get())
+            rdatas = amici.runAmiciSimulations(self.model, self.solver, [edata_history, edata_fresh])
+
+            history_term = rdatas[0]["y"][0, 0]
+            fresh_term = rdatas[1]["y"][0, 0]
+            deviation = np.abs(history_term - fresh_term) / np.abs(fresh_term)
+            if verbose:
+                print(f'relative deviation {deviation}')
+            valid = valid and deviation <= rtol
+            state = rdatas[0]["x"][0, :]
+
+        # restore the conditions of the line the simulator has been initialized for
+        if self.line is not None:
+            self.load_conditions(self.line)
+        self.load_drug_concentrations(ZERO_TREATMENT)
+        return valid
+
+    def apply_treatments(self, concentrations, num_threads=1, verbose=False):
+        '''Simulates a batch of alternative treatments in a single AMICI call.
+
+        Every row is handled as if it was passed to apply_treatment on its own copy of the simulator,
+        i.e. all treatments start from the current proliferation rate. The state of the simulator
+        itself is left unchanged. Each treatment gets its own ExpData carrying the fixed parameters of
+        the loaded cell line together with the drug concentrations of the row.
+
+        Args:
+            concentrations: Array of shape (n_treatments, 7) with drug concentrations ordered as in DRUGS.
+            num_threads: Number of threads AMICI uses to run the simulations.
+            verbose: If set to true, prints the time to steady state of every simulation.
+
+        Returns:
+            overall_proliferation_rates: Numpy array with one proliferation rate per treatment.
+
+        Raises:
+            AssertionError: If simulator has not been initialized.
+        '''
+        assert self.initialized, "Simulator has not been initialized before first use."
+        concentrations = np.asarray(concentrations, dtype=float).reshape(-1, len(DRUGS))
+        if len(concentrations) == 0:
+            return np.zeros(0)
+
+        fixed_parameters = np.array(self.model.getFixedParameters())
+        drug_indices = self.drug_parameter_indices()
+        parameter_vectors = []
+        for row in concentrations:
+            fixed_parameters[drug_indices] = row
+            parameter_vectors.append(fixed_parameters.copy())
+        cond_terms = self.simulate_fixed_parameters(parameter_vectors, num_threads=num_threads, verbose=verbose,
+            cell_lines=[self.line] * len(parameter_vectors))
+
+        return self.R * (cond_terms / self.zero_term)
+
+    def simulate_lines(self, cell_lines, concentrations, num_threads=1, verbose=False):
+        '''Evaluates one treatment on a list of cell lines in a single AMICI call.
+
+        Builds one ExpData per cell line which combines the conditions of the line with the drug
+        concentrations. The zero treatment reference of every line is computed once, also in a
+        single call, and kept for later requests. The simulator does not need to be initialized
+        and its state is left unchanged. Only lines without a cached step ratio are simulated.
+
+        Args:
+            cell_lines: List of strings specifying the cell lines to simulate.
+            concentrations: Array of length 7 with drug concentrations ordered as in DRUGS.
+            num_threads: Number of threads AMICI uses to run the simulations.
+            verbose: If set to true, prints the time to steady state of every simulation.
+
+        Returns:
+            relative_proliferations: Numpy array with one relative proliferation rate per cell line.
+
+        Raises:
+            ValueError: If one of the cell lines is unknown.
+        '''
+        concentrations = np.asarray(concentrations, dtype=float)
+        assert len(concentrations) == len(DRUGS), "Expected one concentration per drug."
+        return self.simulate_pairs(cell_lines, np.tile(concentrations, (len(cell_lines), 1)), num_threads=num_threads, verbose=verbose)
+
+    def simulate_pairs(self, cell_lines, concentrations, num_threads=1, verbose=False):
+        '''Evaluates a list of (cell line, treatment) pairs in a single AMICI call.
+
+        Works as simulate_lines but every cell line gets its own drug concentrations, which allows
+        to simulate a whole population of treatments on all cell lines at once.
+
+        Args:
+            cell_lines: List of strings specifying the cell line of every pair.
+            concentrations: Numpy array of shape (len(cell_lines), 7) with drug concentrations
+                ordered as in DRUGS.
+            num_threads: Number of threads AMICI uses to run the simulations.
+            verbose: If set to true, prints the time to steady state of every simulation.
+
+        Returns:
+            relative_proliferations: Numpy array with one relative proliferation rate per pair.
+
+        Raises:
+            ValueError: If one of the cell lines is unknown.
+        '''
+        concentrations = np.asarray(concentrations, dtype=float)
+        assert concentrations.shape == (len(cell_lines), len(DRUGS)), "Expected one concentration per drug and pair."
+        self.model.setTimepoints([np.infty])
+        drug_indices = self.drug_parameter_indices()
+
+        if self.warm_start:
+            for line in dict.fromkeys(cell_lines):
+                self.check_composition(line)
+
+        missing = [line for line in dict.fromkeys(cell_lines) if line not in self.zero_terms]
+        if len(missing) > 0:
+            parameter_vectors = [self.condition_parameters(line) for line in missing]
+            for fixed_parameters in parameter_vectors:
+                fixed_parameters[drug_indices] = 0.0
+            zero_terms = self.simulate_fixed_parameters(parameter_vectors, num_threads=num_threads, cell_lines=missing)
+            self.zero_terms.update(zip(missing, zero_terms))
+
+        keys = [self.step_key(line, c) for line, c in zip(cell_lines, concentrations)]
+        ratios = np.zeros(len(cell_lines))
+        pending = []
+        for i, key in enumerate(keys):
+            ratio = self.cached_ratio(key) if (self.compose or self.cache is not None) else None
+            if ratio is None:
+                pending.append(i)
+            else:
+                ratios[i] = ratio
+
+        if len(pending) > 0:
+            parameter_vectors = []
+            for i in pending:
+                fixed_parameters = self.condition_parameters(cell_lines[i])
+                fixed_parameters[drug_indices] = concentrations[i]
+                parameter_vectors.append(fixed_parameters)
+            cond_terms = self.simulate_fixed_parameters(parameter_vectors, num_threads=num_threads, verbose=verbose,
+                cell_lines=[cell_lines[i] for i in pending])
+            ratios[pending] = cond_terms / np.array([self.zero_terms[cell_lines[i]] for i in pending])
+
+        if self.compose:
+            for i in pending:
+                self.cache_step_ratio(keys[i], ratios[i])
+            self.composition_misses += len(pending)
+        if self.cache is not None and len(pending) > 0:
+            self.cache.put_many([(keys[i][0], keys[i][1], ratios[i]) for i in pending])
+
+        return ratios
+
+    def simulate_fixed_parameters(self, parameter_vectors, num_threads=1, verbose=False, cell_lines=None):
+        '''Runs one steady state simulation per fixed parameter vector in a single AMICI call.
+
+        Args:
+            parameter_vectors: List of numpy arrays ordered as the fixed parameters of the model.
+            num_threads: Number of threads AMICI uses to run the simulations.
+            verbose: If set to true, prints the time to steady state of every simulation.
+            cell_lines: Cell line of every parameter vector. Only required in warm start mode.
+
+        Returns:
+            growth_terms: Numpy array with the growth term of every simulation at steady state.
+        '''
+        drug_indices = self.drug_parameter_indices()
+        edatas = []
+        for i, fixed_parameters in enumerate(parameter_vectors):
+            edata = amici.ExpData(self.model.get())
+            edata.fixedParameters = fixed_parameters.tolist()
+            if cell_lines is not None:
+                self.seed_state(edata, cell_lines[i], fixed_parameters[drug_indices])
+            edatas.append(edata)
+        rdatas = self.run_simulations(edatas, num_threads=num_threads)
+
+        if cell_lines is not None:
+            for i, rdata in enumerate(rdatas):
+                self.record_state(cell_lines[i], parameter_vectors[i][drug_indices], rdata)
+
+        if verbose:
+            for rdata in rdatas:
+                print(f'time to steadystate {rdata["t_steadystate"]}')
+
+        return np.array([rdata["y"][0, 0] for rdata in rdatas])
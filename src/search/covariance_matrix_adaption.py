@@ -2,69 +2,483 @@
 Below an implementation of the covariance-matrix adaption method following the book "Algorithms for Optimization" p. 138
 """
 
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
 import numpy as np
+from src.util.checkpoint import save_checkpoint, load_checkpoint
+from src.util.domain import FactorizedNormal
 
+# number of iterations between two checkpoints
+CHECKPOINT_EVERY = 10
 
+# covariance models, see update, update_separable and update_low_rank
+COVARIANCES = ["full", "diagonal", "low_rank"]
 
-def cma_es(evaluator, domain, max_iter, verbose=True, seed=23):
-    np.random.seed(seed)
+def parameters(n, covariance="full", rank=None, m=None):
+    """Returns population size, weights and learning rates for a search space of dimension n.
 
-    n = domain.dim
-    sigma = 0.25 # 1.0
-    m = int(4 + np.floor(3 * np.log(n))) # recommended value
+    Args:
+        n: Dimension of the search space.
+        covariance: Covariance model, one of COVARIANCES.
+        rank: Number of evolution paths kept by the low rank model. Defaults to the population size.
+        m: Population size. Defaults to the recommended value 4 + 3 log(n).
+    """
+    if covariance not in COVARIANCES:
+        raise ValueError("Specified covariance model is unknown.")
+    if m is None:
+        m = int(4 + np.floor(3 * np.log(n))) # recommended value
     m_elite = int(np.floor(m / 2)) # recommended value
-    mu = domain.center() # initialize in the center of the domain
 
     # constants
     ws = [np.log((m + 1) / 2) - np.log(i) for i in range(1, m_elite + 1)] + [0 for _ in range(m - m_elite)]
-    ws = np.vstack(ws) / sum(ws) # normalized version
+    ws = np.array(ws) / sum(ws) # normalized version
 
-    mu_eff = 1 / (ws.T @ ws)[0,0]
+    mu_eff = 1 / (ws @ ws)
     c_sigma = (mu_eff + 2) / (n + mu_eff + 5)
     d_sigma = 1 + 2 * max(0, np.sqrt((mu_eff - 1) / (n + 1)) - 1) + c_sigma
     c_S = (4 + mu_eff / n) / (n + 4 + 2 * mu_eff / n)
     c_1 = 2 / ((n + 1.3) ** 2 + mu_eff)
     c_mu = min(1 - c_1, 2 * (mu_eff - 2 + (1 / mu_eff)) / ((n + 2) ** 2 + mu_eff))
     E = np.sqrt(n) * (1 - (1 / (4 * n)) + 1 / (21 * n * n))
-    p_sigma = np.vstack(np.zeros(n)) 
-    p_S = np.vstack(np.zeros(n))
-    S = np.identity(n)
-    xs = [None] * m # container for samples
-
-    for k in range(1, max_iter + 1):
-        # sample and evaluate
-        for i in range(m):
-            xs[i] = domain.normal(mu, sigma * sigma * S)
-        ys, _ = evaluator.evaluate(xs)
-        ids = np.argsort(ys) 
+    if covariance != "full":
+        # a diagonal model has n instead of n^2 free entries and can be learned faster (Ros and Hansen, 2008)
+        c_1 = c_1 * (n + 2) / 3
+        c_mu = min(1 - c_1, c_mu * (n + 2) / 3)
+    # the covariance changes little per update, so it is only decomposed every eigen_gap updates
+    eigen_gap = max(1, int(1 / (10 * n * (c_1 + c_mu))))
+    return {"n": n, "m": m, "m_elite": m_elite, "ws": ws, "mu_eff": mu_eff, "c_sigma": c_sigma, "d_sigma": d_sigma,
+        "c_S": c_S, "c_1": c_1, "c_mu": c_mu, "E": E, "eigen_gap": eigen_gap, "covariance": covariance,
+        "rank": rank if rank is not None else m}
+
+def initial_state(domain, sigma=0.25, covariance="full"):
+    """Returns the search distribution at the start of a run, centered in the domain."""
+    n = domain.dim
+    if covariance != "full":
+        return {
+            "mu": domain.center(),
+            "sigma": sigma,
+            "d": np.ones(n), # diagonal of the covariance
+            "paths": [], # weight and vector of the evolution paths of the low rank model, oldest first
+            "p_sigma": np.vstack(np.zeros(n)),
+            "p_S": np.vstack(np.zeros(n)),
+        }
+    return {
+        "mu": domain.center(), # initialize in the center of the domain
+        "sigma": sigma,
+        "S": np.identity(n),
+        "p_sigma": np.vstack(np.zeros(n)),
+        "p_S": np.vstack(np.zeros(n)),
+        "B": np.identity(n),
+        "D": np.ones(n),
+        "C": np.identity(n),
+        "eigen_k": 0,
+    }
+
+def decompose(state, k):
+    """Recomputes the eigendecomposition S = B diag(D^2) B^T and the inverse square root of S."""
+    values, B = np.linalg.eigh(state["S"])
+    D = np.sqrt(np.maximum(values, 1e-20))
+    state.update({"B": B, "D": D, "C": (B / D) @ B.T, "eigen_k": k})
+
+def update(params, state, xs, ys, k):
+    """Moves the search distribution towards the elite of the samples xs with objective values ys.
+
+    Args:
+        params: Parameters returned by parameters.
+        state: Search distribution which is updated in place.
+        xs: Array or list of params["m"] samples.
+        ys: Objective values of the samples.
+        k: Number of the update, starting at 1.
+    """
+    n, m_elite, ws = params["n"], params["m_elite"], params["ws"]
+    c_sigma, mu_eff, c_S = params["c_sigma"], params["mu_eff"], params["c_S"]
+    c_1, c_mu, E = params["c_1"], params["c_mu"], params["E"]
+    mu, sigma, S = state["mu"], state["sigma"], state["S"]
+    w = ws[:m_elite]
+
+    # selection and mean update
+    elite, delta_w = select(params, state, xs, ys)
+    mu += sigma * delta_w
+
+    # step-size control with the inverse square root of the last decomposition
+    C = state["C"]
+    p_sigma = (1 - c_sigma) * state["p_sigma"] + np.sqrt(c_sigma * (2 - c_sigma) * mu_eff) * C @ delta_w
+    sigma *= np.exp(c_sigma / params["d_sigma"] * (np.linalg.norm(p_sigma) / E - 1))
+
+    # covariance adaption
+    h_sigma = int((np.linalg.norm(p_sigma) / np.sqrt(1 - ((1 - c_sigma) ** (2 * k)))) < ((1.4 + 2 / (n + 1)) * E))
+    p_S = (1 - c_S) * state["p_S"] + h_sigma * np.sqrt(c_S * (2 - c_S) * mu_eff) * delta_w
+
+    w0 = np.where(w >= 0, w, n * w / np.maximum(np.sum((elite @ C) ** 2, axis=1), 1e-20))
+
+    S = (1 - c_1 - c_mu) * S + c_1 * (p_S @ p_S.T + (1 - h_sigma) * c_S * (2 - c_S) * S) \
+        + c_mu * (elite.T * w0) @ elite
+    S = np.triu(S) + np.triu(S, 1).T # enforce symmetry
+
+    state.update({"mu": mu, "sigma": sigma, "S": S, "p_sigma": p_sigma, "p_S": p_S})
+    if k - state["eigen_k"] >= params["eigen_gap"]:
+        decompose(state, k)
+
+def covariance_matrix(state):
+    """Returns the covariance of the search distribution without the step size."""
+    if "S" in state:
+        return state["S"]
+    S = np.diag(state["d"])
+    for weight, path in state["paths"]:
+        S += weight * np.outer(path, path)
+    return S
+
+def variances(state):
+    """Returns the diagonal of the covariance without the step size."""
+    if "S" in state:
+        return np.diag(state["S"])
+    return state["d"] + sum(weight * path ** 2 for weight, path in state["paths"])
+
+def condition(state):
+    """Returns the condition number of the covariance, an upper bound of it for the low rank model.
+
+    The full model uses the eigenvalues of its last decomposition, which lag at most eigen_gap updates
+    behind the covariance. The low rank model is bounded with its factors: the smallest eigenvalue is at
+    least the smallest entry of the diagonal and the largest at most the largest entry plus the largest
+    eigenvalue of the small Gram matrix of the weighted paths.
+    """
+    if "S" in state:
+        D = state["D"]
+        return (np.max(D) / max(np.min(D), 1e-300)) ** 2
+    d = state["d"]
+    largest = np.max(d)
+    if len(state["paths"]) > 0:
+        V = np.array([np.sqrt(max(weight, 0)) * path for weight, path in state["paths"]])
+        largest += np.max(np.linalg.eigvalsh(V @ V.T))
+    return largest / max(np.min(d), 1e-300)
+
+def sampler(state):
+    """Returns the search distribution without its mean, including the step size, for normal_batch of the domain.
+
+    No model builds or decomposes a dense covariance to sample: the full model samples sigma B (D * z)
+    with the factors of the last decomposition, the diagonal model sigma sqrt(d) * z and the low rank
+    model sigma (sqrt(d) * z + sum_i sqrt(weight_i) path_i z_i).
+    """
+    sigma = state["sigma"]
+    if "S" in state:
+        B, D = state["B"], state["D"]
+        draw = lambda size: sigma * (np.random.standard_normal((size, len(D))) * D) @ B.T
+        return FactorizedNormal(draw, lambda: sigma * sigma * (B * D * D) @ B.T)
+    scale = np.sqrt(state["d"])
+    weights = np.sqrt(np.maximum([weight for weight, _ in state["paths"]], 0))
+    V = np.array([path for _, path in state["paths"]]).reshape(len(weights), len(scale))
+
+    def draw(size):
+        steps = np.random.standard_normal((size, len(scale))) * scale
+        if len(weights) > 0:
+            steps += (np.random.standard_normal((size, len(weights))) * weights) @ V
+        return sigma * steps
+
+    return FactorizedNormal(draw, lambda: sigma * sigma * covariance_matrix(state))
+
+def update_separable(params, state, xs, ys, k):
+    """Same as update, but only adapts the diagonal of the covariance in O(n) per sample."""
+    n, w = params["n"], params["ws"][:params["m_elite"]]
+    c_sigma, mu_eff, c_S = params["c_sigma"], params["mu_eff"], params["c_S"]
+    c_1, c_mu, E = params["c_1"], params["c_mu"], params["E"]
+    mu, sigma, d = state["mu"], state["sigma"], state["d"]
+
+    elite, delta_w = select(params, state, xs, ys)
+    mu += sigma * delta_w
+
+    p_sigma = (1 - c_sigma) * state["p_sigma"] + np.sqrt(c_sigma * (2 - c_sigma) * mu_eff) * delta_w / np.vstack(np.sqrt(d))
+    sigma *= np.exp(c_sigma / params["d_sigma"] * (np.linalg.norm(p_sigma) / E - 1))
+
+    h_sigma = int((np.linalg.norm(p_sigma) / np.sqrt(1 - ((1 - c_sigma) ** (2 * k)))) < ((1.4 + 2 / (n + 1)) * E))
+    p_S = (1 - c_S) * state["p_S"] + h_sigma * np.sqrt(c_S * (2 - c_S) * mu_eff) * delta_w
+
+    d = (1 - c_1 - c_mu) * d + c_1 * (p_S.flatten() ** 2 + (1 - h_sigma) * c_S * (2 - c_S) * d) + c_mu * (w @ elite ** 2)
+    state.update({"mu": mu, "sigma": sigma, "d": d, "p_sigma": p_sigma, "p_S": p_S})
+
+def update_low_rank(params, state, xs, ys, k):
+    """Same as update, but keeps the covariance as a diagonal plus the outer products of the last rank evolution paths.
+
+    The rank-one terms of the full update are kept as separate paths which decay like the rest of
+    the covariance. Once more than rank paths are stored, the oldest one is folded into the diagonal.
+    The step size is controlled with the diagonal of the covariance.
+    """
+    n, w = params["n"], params["ws"][:params["m_elite"]]
+    c_sigma, mu_eff, c_S = params["c_sigma"], params["mu_eff"], params["c_S"]
+    c_1, c_mu, E = params["c_1"], params["c_mu"], params["E"]
+    mu, sigma, d, paths = state["mu"], state["sigma"], state["d"], state["paths"]
+
+    elite, delta_w = select(params, state, xs, ys)
+    mu += sigma * delta_w
+
+    p_sigma = (1 - c_sigma) * state["p_sigma"] + np.sqrt(c_sigma * (2 - c_sigma) * mu_eff) * delta_w / np.vstack(np.sqrt(variances(state)))
+    sigma *= np.exp(c_sigma / params["d_sigma"] * (np.linalg.norm(p_sigma) / E - 1))
+
+    h_sigma = int((np.linalg.norm(p_sigma) / np.sqrt(1 - ((1 - c_sigma) ** (2 * k)))) < ((1.4 + 2 / (n + 1)) * E))
+    p_S = (1 - c_S) * state["p_S"] + h_sigma * np.sqrt(c_S * (2 - c_S) * mu_eff) * delta_w
+
+    decay = 1 - c_1 - c_mu + (1 - h_sigma) * c_1 * c_S * (2 - c_S)
+    d = decay * d + c_mu * (w @ elite ** 2)
+    paths = [[decay * weight, path] for weight, path in paths] + [[c_1, p_S.flatten()]]
+    while len(paths) > params["rank"]:
+        weight, path = paths.pop(0)
+        d += weight * path ** 2
+    state.update({"mu": mu, "sigma": sigma, "d": d, "paths": paths, "p_sigma": p_sigma, "p_S": p_S})
+
+def select(params, state, xs, ys):
+    """Returns the normalized steps of the elite samples, best first, and their weighted mean."""
+    ids = np.argsort(ys)
+    delta_s = (np.array([np.asarray(x).flatten() for x in xs]) - state["mu"].T) / state["sigma"]
+    elite = delta_s[ids[:params["m_elite"]]]
+    return elite, np.vstack(params["ws"][:params["m_elite"]] @ elite)
+
+UPDATES = {"full": update, "diagonal": update_separable, "low_rank": update_low_rank}
+
+class StopCriteria():
+    """Decides when a CMA-ES run stops before its maximal number of iterations. A criterion set to None is not checked.
+
+    Attributes:
+        tol_fun: Stops once the best objective values of the last 10 + 30 n / m generations and all values
+            of the last generation differ by less than tol_fun.
+        tol_x: Stops once the standard deviation of the search distribution is below tol_x in every coordinate.
+        stagnation: Stops once the median best objective value of the second half of the last stagnation
+            generations is not better than the one of the first half.
+        max_evals: Stops once max_evals samples have been evaluated.
+        max_time: Stops once max_time seconds have passed since the start of the run.
+        max_condition: Stops once the condition number of the covariance exceeds max_condition, see condition.
+        bests: Best objective value of every generation of the current run.
+    """
+
+    def __init__(self, tol_fun=None, tol_x=None, stagnation=None, max_evals=None, max_time=None, max_condition=None):
+        self.tol_fun = tol_fun
+        self.tol_x = tol_x
+        self.stagnation = stagnation
+        self.max_evals = max_evals
+        self.max_time = max_time
+        self.max_condition = max_condition
+        self.start()
+
+    def start(self):
+        """Resets the history for a new run and starts its clock."""
+        self.started = time.perf_counter()
+        self.bests = []
+        self.spread = np.inf
+        self.n_evals = 0
+
+    def record(self, ys, n_evals=None):
+        """Adds the objective values of a generation to the history.
+
+        Args:
+            ys: Exact objective values of the generation.
+            n_evals: Number of evaluated samples if it differs from the number of exact values.
+        """
+        self.bests.append(min(ys))
+        self.spread = max(ys) - min(ys)
+        self.n_evals += len(ys) if n_evals is None else n_evals
+
+    def check(self, params, state):
+        """Returns the name of the first criterion which is met or None if the run continues."""
+        if self.max_evals is not None and self.n_evals >= self.max_evals:
+            return "max_evals"
+        if self.max_time is not None and time.perf_counter() - self.started >= self.max_time:
+            return "max_time"
+        if self.tol_x is not None and state["sigma"] * np.sqrt(np.max(variances(state))) < self.tol_x:
+            return "tol_x"
+        window = 10 + int(np.ceil(30 * params["n"] / params["m"]))
+        if self.tol_fun is not None and len(self.bests) >= window:
+            recent = self.bests[-window:]
+            if max(recent) - min(recent) < self.tol_fun and self.spread < self.tol_fun:
+                return "tol_fun"
+        if self.stagnation is not None and len(self.bests) >= self.stagnation:
+            recent = self.bests[-self.stagnation:]
+            if np.median(recent[self.stagnation // 2:]) >= np.median(recent[:self.stagnation // 2]):
+                return "stagnation"
+        if self.max_condition is not None and condition(state) > self.max_condition:
+            return "max_condition"
+        return None
+
+def cma_es(evaluator, domain, max_iter, verbose=True, seed=23, trace=None, covariance="full", rank=None, stop=None,
+    checkpoint=None, checkpoint_every=CHECKPOINT_EVERY, state=None, racing=False):
+    """Runs CMA-ES with one synchronous evaluation per generation.
+
+    Args:
+        trace: Optional list which receives a tuple (wall time, evaluations, best objective) after every generation.
+        covariance: Covariance model, "full", "diagonal" (sep-CMA-ES) or "low_rank". The latter two scale
+            linearly with the dimension and suit long sequential treatment plans.
+        rank: Number of evolution paths kept by the low rank model. Defaults to the population size.
+        stop: Optional StopCriteria which can end the run before max_iter iterations.
+        checkpoint: Optional path of a checkpoint file. If the file exists, the run continues from it and
+            produces the same iterations as an uninterrupted run with the same arguments. The evaluator
+            has to be reproducible, i.e. without warm starts and proliferation cache, see reproducible_config.
+        checkpoint_every: Number of iterations between two checkpoints.
+        state: Optional search distribution of the same covariance model, from initial_state or an earlier
+            run, which the run starts from instead of the center of the domain. It is updated in place.
+        racing: If set to true, every generation is evaluated with evaluate_racing of the evaluator, which
+            cancels the simulations of samples that cannot be elite. The elite and therefore the updates are
+            the same, the other samples only get lower bounds. Requires the flat scheduler and the worst
+            case objective.
+
+    Returns:
+        mu: Final mean of the search distribution.
+        obj: Objective value of the mean.
+        prolif: Relative proliferation of the mean per cell line.
+        reason: Name of the stop criterion which ended the run, "max_iter" if it ran all iterations.
+    """
+    if checkpoint is not None and not evaluator.reproducible():
+        raise ValueError("Checkpoints require an evaluator without warm starts and proliferation cache.")
+    np.random.seed(seed)
+
+    params = parameters(domain.dim, covariance=covariance, rank=rank)
+    m, m_elite = params["m"], params["m_elite"]
+    if state is None:
+        state = initial_state(domain, covariance=covariance)
+    elif "S" in state: # the decomposition of an earlier run is refreshed on the iteration count of this run
+        decompose(state, 0)
+    start = time.perf_counter()
+    best = np.inf
+    reason = "max_iter"
+    if stop is not None:
+        stop.start()
+    first = 1
+    if checkpoint is not None:
+        resumed = load_checkpoint(checkpoint)
+        if resumed is not None:
+            first, best = resume(resumed, state, domain, evaluator, stop, trace)
+            start -= resumed["elapsed"]
+            if verbose:
+                print("Resumed from iteration", first - 1)
+
+    k = first - 1
+    for k in range(first, max_iter + 1):
+        # sample and evaluate the whole population
+        xs = domain.normal_batch(state["mu"], sampler(state), m)
+        if racing:
+            ys, prolifs = evaluator.evaluate_racing(list(xs), m_elite)
+            # the lower bounds of cancelled samples would understate the spread of the generation
+            exact = [y for y, prolif in zip(ys, prolifs) if not np.any(np.isnan(prolif))]
+        else:
+            ys, _ = evaluator.evaluate(list(xs))
+            exact = ys
+        ids = np.argsort(ys)
+        best = min(best, min(ys))
+        if trace is not None:
+            trace.append((time.perf_counter() - start, k * m, best))
 
         if verbose:
             # TODO: put some effort to make this look nice
-            avg_elite = sum([ys[ids[i]] for i in range(m_elite)]) / m_elite
-            print(k, ":", "Average: ", avg_elite, "mu: ", mu.flatten(), sum(mu))
+            avg_elite = np.mean(np.array(ys)[ids[:m_elite]])
+            print(k, ":", "Average: ", avg_elite, "mu: ", state["mu"].flatten(), sum(state["mu"]))
+
+        UPDATES[covariance](params, state, xs, ys, k)
+        if stop is not None:
+            stop.record(exact, n_evals=len(ys))
+            reason = stop.check(params, state) or reason
+            if reason != "max_iter":
+                break
+        if checkpoint is not None and k % checkpoint_every == 0:
+            save_checkpoint(checkpoint, capture(k, best, time.perf_counter() - start, state, domain, evaluator, stop, trace))
+
+    if verbose:
+        print("Stopped after", k, "iterations:", reason)
+    mu = state["mu"]
+    obj, prolif = evaluator.evaluate([mu])
+    return mu.flatten(), obj[0], prolif[0], reason
+
+def capture(k, best, elapsed, state, domain, evaluator, stop, trace):
+    """Collects everything a run needs to continue after iteration k, including the random number generators."""
+    return {
+        "k": k,
+        "best": best,
+        "elapsed": elapsed,
+        "state": state,
+        "random_state": np.random.get_state(),
+        "domain_seed": getattr(domain, "seed", None),
+        "results": evaluator.snapshot() if evaluator.store else None,
+        "stop": (stop.bests, stop.spread, stop.n_evals) if stop is not None else None,
+        "trace": list(trace) if trace is not None else None,
+    }
+
+def resume(checkpoint, state, domain, evaluator, stop, trace):
+    """Restores a checkpoint written by capture and returns the next iteration and the best objective so far."""
+    state.update(checkpoint["state"])
+    np.random.set_state(checkpoint["random_state"])
+    if checkpoint["domain_seed"] is not None: # the truncated normal sampler is seeded by the domain
+        domain.seed = checkpoint["domain_seed"]
+    if checkpoint["results"] is not None and evaluator.store:
+        evaluator.restore(checkpoint["results"])
+    if stop is not None and checkpoint["stop"] is not None:
+        stop.bests, stop.spread, stop.n_evals = checkpoint["stop"]
+        stop.started -= checkpoint["elapsed"]
+    if trace is not None and checkpoint["trace"] is not None:
+        trace[:] = checkpoint["trace"]
+    return checkpoint["k"] + 1, checkpoint["best"]
+
+def async_cma_es(evaluator, domain, max_iter, verbose=True, seed=23, in_flight=None, trace=None, covariance="full", rank=None,
+    stop=None):
+    """Runs a steady-state CMA-ES which updates as soon as a population's worth of results has arrived.
 
-        # selection and mean update
-        delta_s = [(np.vstack(x) - mu) / sigma for x in xs]
-        delta_w = sum([ws[i] * delta_s[ids[i]] for i in range(m_elite)])
-        mu += sigma * delta_w
+    Every candidate is submitted on its own and replaced by a sample of the current distribution as
+    soon as its result is in, so the workers never wait for the slowest candidate of a generation.
+    Results of candidates which were sampled before the last update are used as they are.
+
+    Args:
+        evaluator: Evaluator with a submit method.
+        domain: Domain of the treatments.
+        max_iter: Number of distribution updates.
+        in_flight: Number of candidates which are evaluated concurrently. Defaults to the population size.
+        trace: Optional list which receives a tuple (wall time, evaluations, best objective) after every update.
+        covariance: Covariance model, see cma_es.
+        rank: Number of evolution paths kept by the low rank model.
+        stop: Optional StopCriteria which is checked after every update.
+
+    Returns:
+        The same as cma_es.
+    """
+    np.random.seed(seed)
 
-        # step-size control
-        values, vectors = np.linalg.eig(S)
-        Q = vectors
-        D = np.sqrt(np.diag(values))
-        C = Q @ np.linalg.inv(D) @ Q.T
-        p_sigma = (1 - c_sigma) * p_sigma + np.sqrt(c_sigma * (2 - c_sigma) * mu_eff) * C @ delta_w
-        sigma *= np.exp(c_sigma / d_sigma * (np.linalg.norm(p_sigma) / E - 1)) 
+    params = parameters(domain.dim, covariance=covariance, rank=rank)
+    m, m_elite = params["m"], params["m_elite"]
+    state = initial_state(domain, covariance=covariance)
+    in_flight = in_flight if in_flight is not None else m
+    futures = {}
+    xs, ys = [], []
+    start = time.perf_counter()
+    best = np.inf
+    n_evals = 0
+    reason = "max_iter"
+    if stop is not None:
+        stop.start()
 
-        # covariance adaption
-        h_sigma = int((np.linalg.norm(p_sigma) / np.sqrt(1 - ((1 - c_sigma) ** (2 * k)))) < ((1.4 + 2 / (n + 1)) * E))
-        p_S = (1 - c_S) * p_S + h_sigma * np.sqrt(c_S * (2 - c_S) * mu_eff) * delta_w
+    def sample():
+        x = domain.normal_batch(state["mu"], sampler(state), 1)[0]
+        futures[evaluator.submit([x])] = x
 
-        w0 = [ws[i] if ws[i] >= 0 else (n * ws[i] / (np.linalg.norm(C @ delta_s[ids[i]]) ** 2)) for i in range(m)]
+    k = 0
+    while k < max_iter and reason == "max_iter":
+        while len(futures) < in_flight:
+            sample()
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            xs.append(futures.pop(future))
+            ys.append(future.result()[0][0])
+            n_evals += 1
+            best = min(best, ys[-1])
 
-        S = (1 - c_1 - c_mu) * S + c_1 * (p_S @ p_S.T + (1 - h_sigma) * c_S * (2 - c_S) * S) \
-            + c_mu * sum(w0[i] * delta_s[ids[i]] @ delta_s[ids[i]].T for i in range(m_elite))
-        S = np.triu(S) + np.triu(S, 1).T # enforce symmetry
+        while len(xs) >= m and k < max_iter and reason == "max_iter":
+            k += 1
+            if trace is not None:
+                trace.append((time.perf_counter() - start, n_evals, best))
+            if verbose:
+                avg_elite = sum(sorted(ys[:m])[:m_elite]) / m_elite
+                print(k, ":", "Average: ", avg_elite, "mu: ", state["mu"].flatten(), sum(state["mu"]))
+            UPDATES[covariance](params, state, xs[:m], ys[:m], k)
+            if stop is not None:
+                stop.record(ys[:m])
+                reason = stop.check(params, state) or reason
+            xs, ys = xs[m:], ys[m:]
 
+    wait(futures) # results of the remaining candidates are not needed, but the workers have to finish them
+    if verbose:
+        print("Stopped after", k, "updates:", reason)
+    mu = state["mu"]
     obj, prolif = evaluator.evaluate([mu])
-    return mu.flatten(), obj[0], prolif[0]
+    return mu.flatten(), obj[0], prolif[0], reason
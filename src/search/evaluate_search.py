@@ -81,6 +81,35 @@ def best_multi_search_result(tissue, path, prefix, lambd=0, obj="avg", max_dosag
     # treatment, concentration, relative proliferation, objective value
     return treatment, concentration, rel_prolif, objective
 
+def pareto_front(tissue, path, prefix, obj="avg", max_dosage=8000):
+    """
+    Function for retrieval of the non-dominated multi-cell search results, e.g. of a pareto search.
+    Returns the treatments, concentrations and relative proliferations ordered by increasing concentration.
+    """
+    data = load_data(path, tissue, prefix=prefix, format="csv")
+    rows = []
+
+    for i in data[data['threshold'] == max_dosage].index:
+        temp_prolif_list = recover_numbers_from_list(data["relative_proliferation"][i])
+        assert len(temp_prolif_list) == len(retrieve_lines(tissue)), "Number of proliferation values is off."
+        if obj == "avg":
+            temp_prolif = np.average(temp_prolif_list)
+        elif obj == "worst":
+            temp_prolif = np.max(temp_prolif_list)
+        else:
+            raise ValueError("Specified objective is unknown.")
+        rows.append((data["total_concentration"][i], temp_prolif, i))
+
+    # a row belongs to the front if every row with less concentration has a higher proliferation
+    treatments, concentrations, prolifs = [], [], []
+    for concentration, prolif, i in sorted(rows):
+        if len(prolifs) == 0 or prolif < prolifs[-1]:
+            treatments.append(row_to_treatment(data.iloc[i]))
+            concentrations.append(concentration)
+            prolifs.append(prolif)
+
+    return treatments, np.array(concentrations), np.array(prolifs)
+
 def best_interpolated_multi_search_result(tissue, path, prefix, n_steps, lambd=0, obj="avg", max_dosage=8000, verification=False):
     """
     This methods retrieves the best single-step treatment from the multi-cell experiments and interpolates it over multiple steps.
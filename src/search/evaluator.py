@@ -2,25 +2,40 @@
 A class which takes as input a list of treatments and parallelizes their evaluation.
 """
 
+import os
+import copy
 import time
+import asyncio
+import threading
 from multiprocessing import Manager
-from src.env.simulator_env import SimulatorEnv
-from src.env.drugs import DRUGS
+from concurrent.futures import Future, ThreadPoolExecutor
+from src.env.simulator_env import SimulatorEnv, VectorSimulatorEnv
+from src.env.drugs import DRUGS, empty_treatment
+from src.search.scheduler import FlatScheduler
+from src.search.prefix_cache import PrefixTrie, QUANTUM
+from src.env.objectives import score_objectives, MultiWorstLinear
 from src.util.pool_hack import MyPool
+from src.util.bootstrap import prepare_bootstrap, report_worker, collect_reports
 from src.util.store import initialize_result_dictionary, update_result_dictionary
+from src.util.prepare_dict import prepare_dict
 import numpy as np
 
 # -------------------------------------------------------------------
 # Worker administration
 # -------------------------------------------------------------------
 
-def initialize(init_queue):
+def initialize(init_queue, report_queue, spawn_time):
     global env_id
     global environment
     init = init_queue.get()
     env_id = init[0]
     conf = init[1]
-    environment = SimulatorEnv(conf["n_steps"], conf["cell_lines"], conf["max_dosage"], conf["objective"], conf["domain"], conf["scale"])
+    # workers of a preloaded environment are forked from this process which has the model loaded already
+    bootstrap = "fork" if conf.get("bootstrap", None) is not None else None
+    environment = SimulatorEnv(conf["n_steps"], conf["cell_lines"], conf["max_dosage"], conf["objective"], conf["domain"], conf["scale"],
+        batched=conf.get("batched", False), threads=conf.get("threads", 1), compose=conf.get("compose", False),
+        cache=conf.get("cache", None), warm_start=conf.get("warm_start", False), bootstrap=bootstrap, report_queue=report_queue)
+    report_worker(report_queue, "env-" + str(env_id), spawn_time)
 
 def eval(treatment_vector):
     global env_id
@@ -34,6 +49,30 @@ def eval(treatment_vector):
         i += 1
     return (obs, reward)
 
+def eval_suffix(job):
+    """Continues a plan from the state after its cached prefix and returns the observation after every further step."""
+    global env_id
+    global environment
+
+    treatment_vector, depth, prolifs = job
+    environment.reset()
+    if depth > 0:
+        commulative_treatment = empty_treatment()
+        for i in range(depth):
+            action_dict = prepare_dict(treatment_vector[i * len(DRUGS):(i + 1) * len(DRUGS)],
+                max_dosage=environment.max_dosage, scale=environment.scale)
+            for k in action_dict:
+                commulative_treatment[k] += action_dict[k]
+        environment.restore({"step_counter": depth, "commulative_treatment": commulative_treatment, "prolifs": prolifs})
+    trajectory = []
+    done = depth >= environment.n_steps
+    i = depth
+    while not done:
+        obs, _, done, _ = environment.step(treatment_vector[i * len(DRUGS):(i + 1) * len(DRUGS)])
+        trajectory.append(obs)
+        i += 1
+    return np.array(trajectory)
+
 def terminate(_):
     global env_id
     global environment
@@ -57,17 +96,193 @@ class Evaluator():
         self.allow_pd = allow_pd
         for line in self.config["cell_lines"]:
             self.res_buffers[line] = initialize_result_dictionary()
-        self.worker_pool = self.initialize_workers(n_envs, config)
+        self.scheduler = None
+        self.worker_pool = None
+        self.worker_objective = config["objective"] # objective the nested environments score with
+        self.vector_env = None
+        self.prefix_cache = None
+        self.executor = None
+        self.lock = threading.Lock()
+        # how often every line has decided the worst case of a raced treatment, and how many tasks were raced
+        self.racing_wins = {line: 0 for line in self.config["cell_lines"]}
+        self.racing_tasks = {"tasks": 0, "cancelled": 0}
+        if config.get("prefix_cache", None) is not None:
+            self.prefix_cache = PrefixTrie(config["n_steps"], max_nodes=config["prefix_cache"],
+                quantum=config.get("prefix_quantum", QUANTUM)) # keyed by concentrations like the proliferation cache
+        if config.get("scheduler", "nested") == "flat":
+            self.scheduler = self.initialize_scheduler(config)
+        elif config.get("scheduler", "nested") == "vector":
+            # the environment and its cache connection are created on, and only used by, the executor thread
+            self.executor = ThreadPoolExecutor(max_workers=1)
+            self.vector_env = self.executor.submit(VectorSimulatorEnv, 1, config["n_steps"], config["cell_lines"],
+                config["max_dosage"], config["objective"], config["domain"], config["scale"],
+                threads=config.get("threads", os.cpu_count() or 1), compose=config.get("compose", False),
+                cache=config.get("cache", None), warm_start=config.get("warm_start", False)).result()
+        elif config.get("scheduler", "nested") == "nested":
+            self.worker_pool = self.initialize_workers(n_envs, config)
+        else:
+            raise ValueError("Specified scheduler is unknown.")
+        if self.prefix_cache is not None and self.executor is None:
+            # the prefix cache lives in this process and is used by one thread only
+            self.executor = ThreadPoolExecutor(max_workers=1)
 
     def initialize_workers(self, n_envs, config):
         manager = Manager()
         init_queue = manager.Queue()
         for i in range(n_envs):
             init_queue.put((i, config))
-        worker_pool = MyPool(n_envs, initialize, (init_queue,))
+        self.report_queue = manager.Queue()
+        start_method = prepare_bootstrap(config.get("bootstrap", None))
+        worker_pool = MyPool(n_envs, initialize, (init_queue, self.report_queue, time.time()), start_method=start_method)
         return worker_pool
 
-    def evaluate(self, treatments):
+    def initialize_scheduler(self, config):
+        simulator_options = {
+            "compose": config.get("compose", False),
+            "cache": config.get("cache", None),
+            "warm_start": config.get("warm_start", False),
+        }
+        return FlatScheduler(config["cell_lines"], n_workers=config.get("workers", None),
+            simulator_options=simulator_options, bootstrap=config.get("bootstrap", None))
+
+    def worker_report(self):
+        """Returns footprint and spawn latency of all environment and simulator workers started so far."""
+        if self.scheduler is not None:
+            return self.scheduler.worker_report()
+        if self.vector_env is not None:
+            return []
+        return collect_reports(self.report_queue)
+
+    def scheduler_stats(self):
+        """Returns task, steal and affinity statistics of the flat scheduler."""
+        assert self.scheduler is not None, "This evaluator does not use the flat scheduler."
+        return self.scheduler.stats()
+
+    def makespan_report(self):
+        """Returns estimated and measured makespan per generation and the measured cost per cell line."""
+        assert self.scheduler is not None, "This evaluator does not use the flat scheduler."
+        return self.scheduler.history, self.scheduler.line_statistics
+
+    def prepare_plans(self, xs):
+        """Turns flat treatment vectors into lists of treatment dictionaries and their cumulative treatments."""
+        domain = self.config["domain"]
+        if domain.dim > len(DRUGS): # this extracts the domain for the individual step
+            domain = domain.single
+        plans = []
+        cumulative_treatments = []
+        for x in xs:
+            plan = []
+            cumulative_treatment = empty_treatment()
+            for i in range(self.config["n_steps"]):
+                action = x[i * len(DRUGS):(i + 1) * len(DRUGS)]
+                assert domain.contains(action), "The provided actions does not belong to the domain."
+                action_dict = prepare_dict(action, max_dosage=self.config["max_dosage"], scale=self.config["scale"])
+                for k in action_dict:
+                    cumulative_treatment[k] += action_dict[k]
+                plan.append(action_dict)
+            plans.append(plan)
+            cumulative_treatments.append(cumulative_treatment)
+        return plans, cumulative_treatments
+
+    def score(self, prolifs, cumulative_treatments):
+        return [self.config["objective"].eval(p, c) for p, c in zip(prolifs, cumulative_treatments)]
+
+    def set_objective(self, objective):
+        """Scores all later evaluations with the objective, the workers and their caches are kept.
+
+        The nested environments score in their worker processes with the objective they received at their
+        start, so their results are scored again in this process once the objective has been switched.
+        """
+        self.config["objective"] = objective
+        if self.vector_env is not None:
+            self.executor.submit(setattr, self.vector_env, "objective", objective).result()
+
+    def dosages(self, xs):
+        """Returns the total dosage of every flat treatment vector over all steps."""
+        _, cumulative_treatments = self.prepare_plans(xs)
+        return np.array([sum(c.values()) for c in cumulative_treatments])
+
+    def run_vector(self, xs):
+        xs = np.array(xs)
+        self.vector_env.reset(n_envs=len(xs))
+        for i in range(self.config["n_steps"]):
+            obs, rewards, _, _ = self.vector_env.step(xs[:, i * len(DRUGS):(i + 1) * len(DRUGS)])
+        return list(rewards), list(obs)
+
+    def simulate_suffixes(self, xs, plans, depths, states):
+        """Simulates every plan from its first uncached step and returns the observations after every further step."""
+        if self.scheduler is not None:
+            suffixes = [plan[depth:] for plan, depth in zip(plans, depths)]
+            return self.scheduler.run(suffixes, initial=states, trajectories=True)
+
+        if self.vector_env is not None:
+            trajectories = [None for _ in xs]
+            for depth in sorted(set(depths)): # plans with the same cached depth are stepped together
+                group = [i for i, d in enumerate(depths) if d == depth]
+                self.vector_env.reset(n_envs=len(group))
+                if depth > 0:
+                    cumulative = np.zeros((len(group), len(DRUGS)))
+                    for j, i in enumerate(group):
+                        cumulative[j] = [sum(step[drug] for step in plans[i][:depth]) for drug in DRUGS]
+                    self.vector_env.restore({"step_counter": depth, "commulative_treatments": cumulative,
+                        "prolifs": np.array([states[i] for i in group])})
+                group_xs = np.array([xs[i] for i in group])
+                observations = []
+                for k in range(depth, self.config["n_steps"]):
+                    obs, _, _, _ = self.vector_env.step(group_xs[:, k * len(DRUGS):(k + 1) * len(DRUGS)])
+                    observations.append(obs)
+                for j, i in enumerate(group):
+                    trajectories[i] = np.array([obs[j] for obs in observations])
+            return trajectories
+
+        return self.worker_pool.map(eval_suffix, list(zip(xs, depths, states)))
+
+    def run_prefix(self, xs):
+        """Evaluates the plans and only simulates the steps which are not in the prefix cache.
+
+        Plans of the batch which share their first uncached step are not simulated together. Only one
+        of them is simulated and the others are looked up again afterwards, so they continue from the
+        prefix it has inserted.
+        """
+        plans, cumulative_treatments = self.prepare_plans(xs)
+        # the trie is keyed by the concentrations of the steps, not by the unit treatment vectors
+        concentrations = [np.array([[step[drug] for drug in DRUGS] for step in plan]).flatten() for plan in plans]
+        prolifs = [None for _ in xs]
+        pending = list(range(len(xs)))
+        depths = {}
+        while len(pending) > 0:
+            lookups = {i: self.prefix_cache.lookup(concentrations[i], repeated=depths.get(i, None)) for i in pending}
+            leaders, followers, keys = [], [], set()
+            for i in pending:
+                depth, state = lookups[i]
+                depths[i] = depth
+                if depth == self.config["n_steps"]:
+                    prolifs[i] = state
+                    continue
+                key = self.prefix_cache.next_key(concentrations[i], depth)
+                if key in keys:
+                    followers.append(i)
+                else:
+                    keys.add(key)
+                    leaders.append(i)
+
+            if len(leaders) > 0:
+                trajectories = self.simulate_suffixes([xs[i] for i in leaders], [plans[i] for i in leaders],
+                    [lookups[i][0] for i in leaders], [lookups[i][1] for i in leaders])
+                for i, trajectory in zip(leaders, trajectories):
+                    self.prefix_cache.insert(concentrations[i], trajectory, start=lookups[i][0])
+                    prolifs[i] = np.array(trajectory[-1])
+            pending = followers
+
+        return self.score(prolifs, cumulative_treatments), prolifs
+
+    def prefix_stats(self):
+        """Returns hit rates and size of the prefix cache."""
+        assert self.prefix_cache is not None, "This evaluator does not use a prefix cache."
+        return self.prefix_cache.stats()
+
+    def prepare_treatments(self, treatments):
+        """Turns the treatments into flat treatment vectors covering all steps."""
         xs = [t.flatten() for t in treatments]
         if self.repeated:
             for x in xs:
@@ -85,24 +300,215 @@ class Evaluator():
 
         for x in xs:
             assert len(x) == len(DRUGS) * self.config["n_steps"], "Detected dimension mismatch in treatment vector."
-        res = self.worker_pool.map(eval, xs)
-        ys = [r[1] for r in res]
-        prolifs = [r[0] for r in res]
+        return xs
 
+    def complete(self, xs, ys, prolifs):
+        """Buffers the results of an evaluation if requested and returns them."""
         if self.store: # We simply buffer all experimental results for a later readout
-            for i, line in enumerate(self.config["cell_lines"]):
-                rel_prolifs = [p[i] for p in prolifs]
-                update_result_dictionary(self.res_buffers[line], xs, rel_prolifs, self.config["max_dosage"], self.config["scale"])
-
+            with self.lock:
+                for i, line in enumerate(self.config["cell_lines"]):
+                    rel_prolifs = [p[i] for p in prolifs]
+                    update_result_dictionary(self.res_buffers[line], xs, rel_prolifs, self.config["max_dosage"], self.config["scale"])
         return ys, prolifs
 
+    def run_serial(self, xs):
+        if self.prefix_cache is not None:
+            ys, prolifs = self.run_prefix(xs)
+        else:
+            ys, prolifs = self.run_vector(xs)
+        return self.complete(xs, ys, prolifs)
+
+    def submit(self, treatments):
+        """Starts the evaluation of the treatments without waiting for the results.
+
+        Submissions of several callers share the workers. The flat scheduler and the nested environments
+        interleave concurrent submissions, the vectorized environment and the prefix cache run them one
+        after another.
+
+        Returns:
+            future: concurrent.futures.Future which resolves to the tuple (ys, prolifs) returned by evaluate.
+        """
+        xs = self.prepare_treatments(treatments)
+        if self.executor is not None:
+            return self.executor.submit(self.run_serial, xs)
+
+        future = Future()
+        def resolve(compute):
+            try:
+                ys, prolifs = compute()
+                future.set_result(self.complete(xs, ys, prolifs))
+            except Exception as e:
+                future.set_exception(e)
+
+        if self.scheduler is not None:
+            plans, cumulative_treatments = self.prepare_plans(xs)
+            def scheduled(inner):
+                def compute():
+                    prolifs = list(inner.result())
+                    return self.score(prolifs, cumulative_treatments), prolifs
+                resolve(compute)
+            self.scheduler.submit(plans).add_done_callback(scheduled)
+        else:
+            objective = self.config["objective"]
+            def mapped(res):
+                def compute():
+                    prolifs = [r[0] for r in res]
+                    if objective is self.worker_objective:
+                        return [r[1] for r in res], prolifs
+                    return [objective.eval(p, c) for p, c in zip(prolifs, self.prepare_plans(xs)[1])], prolifs
+                resolve(compute)
+            self.worker_pool.map_async(eval, xs, callback=mapped, error_callback=future.set_exception)
+        return future
+
+    def submit_objectives(self, treatments, objectives):
+        """Starts the evaluation of the treatments and scores them under several objectives.
+
+        The objectives are linear in the total dosage, so a single simulation of every treatment gives
+        its value for any lambda and aggregation, see score_objectives.
+
+        Returns:
+            future: concurrent.futures.Future which resolves to the tuple (ys, prolifs, dosages), where ys
+                holds one row per objective, prolifs one row per treatment and one column per cell line and
+                dosages the total dosage of every treatment.
+        """
+        dosages = self.dosages(self.prepare_treatments(treatments))
+        future = Future()
+        def scored(inner):
+            try:
+                _, prolifs = inner.result()
+                prolifs = np.array(prolifs, dtype=float)
+                future.set_result((score_objectives(prolifs, dosages, objectives), prolifs, dosages))
+            except Exception as e:
+                future.set_exception(e)
+        self.submit(treatments).add_done_callback(scored)
+        return future
+
+    def evaluate_objectives(self, treatments, objectives):
+        return self.submit_objectives(treatments, objectives).result()
+
+    def racing_order(self):
+        """Orders the cell lines by how often they decided the worst case per measured cost of a simulation."""
+        costs = self.scheduler.costs
+        default = np.mean(list(costs.values())) if len(costs) > 0 else 1.0
+        return sorted(self.config["cell_lines"], key=lambda line: -(self.racing_wins[line] + 1) / costs.get(line, default))
+
+    def submit_racing(self, treatments, keep):
+        """Starts an evaluation which stops simulating treatments that cannot be among the keep best.
+
+        The objective is the worst case proliferation plus a dosage penalty, so the maximum over the lines
+        simulated so far plus the penalty bounds the objective value of a treatment from below. All
+        treatments are first simulated on the line which most often decides the worst case per cost. The
+        remaining simulations are then run treatment by treatment, lowest bound first. Once keep treatments
+        are completed, a treatment whose bound exceeds the keep-th best completed value cannot be among
+        the keep best and its remaining simulations are cancelled.
+
+        Returns:
+            future: concurrent.futures.Future which resolves to the tuple (ys, prolifs) as evaluate. The keep
+                best treatments are exact. A cancelled treatment has the lower bound of its objective value,
+                which is larger than the keep best values, and NaN for the lines it was not simulated on.
+        """
+        assert self.scheduler is not None, "Racing requires the flat scheduler."
+        assert isinstance(self.config["objective"], MultiWorstLinear), "Racing requires the worst case objective."
+        xs = self.prepare_treatments(treatments)
+        plans, cumulative_treatments = self.prepare_plans(xs)
+        penalties = self.config["objective"].lambd * np.array([sum(c.values()) for c in cumulative_treatments])
+        n_lines = len(self.config["cell_lines"])
+        order = self.racing_order()
+        rank = {line: j for j, line in enumerate(order)}
+        worst = np.full(len(xs), -np.inf)
+        simulated = np.zeros(len(xs), dtype=int)
+        exact = []
+        cancelled = set()
+
+        def on_result(batch_id, index, line, rel_proliferation):
+            if index in cancelled:
+                return
+            worst[index] = max(worst[index], rel_proliferation)
+            simulated[index] += 1
+            if simulated[index] == 1 and np.all(simulated > 0):
+                # every treatment has a bound, the most promising ones are completed first
+                bounds = worst + penalties
+                self.scheduler.reorder(batch_id, lambda i, line: (bounds[i], rank[line]))
+            if simulated[index] == n_lines:
+                exact.append(worst[index] + penalties[index])
+            if len(exact) < keep:
+                return
+            cutoff = np.partition(exact, keep - 1)[keep - 1]
+            hopeless = [i for i in range(len(xs)) if simulated[i] < n_lines and i not in cancelled
+                and worst[i] + penalties[i] > cutoff]
+            if len(hopeless) > 0:
+                cancelled.update(hopeless)
+                dropped = self.scheduler.cancel(batch_id, hopeless)
+                with self.lock:
+                    self.racing_tasks["cancelled"] += dropped
+
+        future = Future()
+        def raced(inner):
+            try:
+                prolifs = inner.result()
+                completed = [i for i in range(len(xs)) if not np.any(np.isnan(prolifs[i]))]
+                ys = list(np.nanmax(prolifs, axis=1) + penalties)
+                for i, y in zip(completed, self.score(prolifs[completed], [cumulative_treatments[i] for i in completed])):
+                    ys[i] = y
+                with self.lock:
+                    self.racing_tasks["tasks"] += len(xs) * n_lines
+                    for i in completed:
+                        self.racing_wins[self.config["cell_lines"][int(np.argmax(prolifs[i]))]] += 1
+                # only completed treatments are buffered
+                self.complete([xs[i] for i in completed], [ys[i] for i in completed], prolifs[completed])
+                future.set_result((ys, list(prolifs)))
+            except Exception as e:
+                future.set_exception(e)
+        self.scheduler.submit(plans, order=order, on_result=on_result).add_done_callback(raced)
+        return future
+
+    def evaluate_racing(self, treatments, keep):
+        return self.submit_racing(treatments, keep).result()
+
+    def racing_stats(self):
+        """Returns the number of raced (treatment, cell line) tasks and how many of them were cancelled."""
+        with self.lock:
+            return dict(self.racing_tasks, rate=self.racing_tasks["cancelled"] / max(self.racing_tasks["tasks"], 1))
+
+    async def evaluate_async(self, treatments):
+        """Evaluates the treatments without blocking the event loop. Returns the same as evaluate."""
+        return await asyncio.wrap_future(self.submit(treatments))
+
+    def evaluate(self, treatments):
+        return self.submit(treatments).result()
+
     def terminate(self):
+        if self.vector_env is not None:
+            # the cache connection of the environment belongs to the executor thread
+            self.executor.submit(self.vector_env.terminate).result()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if self.scheduler is not None:
+            self.scheduler.terminate()
+            return
+        if self.vector_env is not None:
+            return
         ids = self.worker_pool.map(terminate, [None for i in range(self.n_envs)])
         ids.sort()
         assert ids == list(range(self.n_envs)), "Not all environment processes have terminated."
         self.worker_pool.close()
         self.worker_pool.join()
 
+    def reproducible(self):
+        """Returns true if the result of an evaluation does not depend on the evaluations before it."""
+        return not self.config.get("warm_start", False) and self.config.get("cache", None) is None
+
+    def snapshot(self):
+        """Returns the stored experimental results, which can be passed to restore to continue an interrupted run."""
+        with self.lock:
+            return copy.deepcopy(self.res_buffers)
+
+    def restore(self, snapshot):
+        """Replaces the stored experimental results by a snapshot of an evaluator with the same cell lines."""
+        assert set(snapshot) == set(self.config["cell_lines"]), "Snapshot belongs to different cell lines."
+        with self.lock:
+            self.res_buffers = copy.deepcopy(snapshot)
+
     def get_res_dict(self):
         """Return dictionary with results."""
         assert self.store, "This evaluator was not configured to store experimental logs."
@@ -0,0 +1,169 @@
+"""
+A multi-objective search for the trade-off between relative proliferation and total dosage. Instead of
+one optimization per penalty weight, a single run keeps a population which spreads along the front,
+following NSGA-II (Deb et al., 2002) for the selection: non-dominated sorting with crowding distance.
+
+Offspring are sampled by the domain from a normal distribution around their parent, so every candidate
+stays feasible. Every individual carries its own step size, which grows when its offspring survive and
+shrinks otherwise, as in the success rule of MO-CMA-ES.
+"""
+
+import numpy as np
+from src.env.objectives import retrieve_multi_objective
+
+# factors of the step size of a parent whose offspring survives and of one whose offspring is discarded
+SUCCESS = np.exp(0.2)
+FAILURE = np.exp(-0.05)
+
+# bounds of the step sizes
+SIGMA_MIN = 1e-4
+SIGMA_MAX = 0.5
+
+# number of non-dominated treatments kept in the archive
+ARCHIVE = 200
+
+# -------------------------------------------------------------------
+# Helper functions
+# -------------------------------------------------------------------
+
+def dominates(a, b):
+    """Returns true if the objective vector a is at least as good as b everywhere and better somewhere."""
+    return np.all(a <= b) and np.any(a < b)
+
+def non_dominated_sort(objectives):
+    """Sorts the objective vectors into fronts.
+
+    Returns:
+        fronts: List of lists of indices, the first front holds the non-dominated vectors.
+    """
+    objectives = np.asarray(objectives)
+    n = len(objectives)
+    # dominance[i, j] is true if vector i dominates vector j
+    dominance = np.all(objectives[:, None] <= objectives[None], axis=2) & np.any(objectives[:, None] < objectives[None], axis=2)
+    counts = np.sum(dominance, axis=0)
+    remaining = np.ones(n, dtype=bool)
+    fronts = []
+    front = np.flatnonzero(counts == 0)
+    while len(front) > 0:
+        fronts.append(front.tolist())
+        remaining[front] = False
+        counts = counts - np.sum(dominance[front], axis=0)
+        front = np.flatnonzero(remaining & (counts == 0))
+    return fronts
+
+def crowding_distance(objectives):
+    """Returns the crowding distance of every vector of a front. The extreme vectors get infinity."""
+    n, d = objectives.shape
+    distance = np.zeros(n)
+    for k in range(d):
+        order = np.argsort(objectives[:, k])
+        span = objectives[order[-1], k] - objectives[order[0], k]
+        distance[order[0]] = distance[order[-1]] = np.inf
+        if span == 0:
+            continue
+        distance[order[1:-1]] += (objectives[order[2:], k] - objectives[order[:-2], k]) / span
+    return distance
+
+def truncate(objectives, size):
+    """Returns the indices of the size vectors of a front with the largest crowding distance, the extremes first."""
+    if len(objectives) <= size:
+        return list(range(len(objectives)))
+    return np.argsort(-crowding_distance(objectives), kind="stable")[:size].tolist()
+
+def select(objectives, size):
+    """Returns the indices of the size best vectors by front and crowding distance, and the rank of every vector."""
+    ranks = np.zeros(len(objectives), dtype=int)
+    crowding = np.zeros(len(objectives))
+    selected = []
+    for rank, front in enumerate(non_dominated_sort(objectives)):
+        ranks[front] = rank
+        crowding[front] = crowding_distance(objectives[front])
+        if len(selected) + len(front) <= size:
+            selected += front
+        elif len(selected) < size:
+            selected += sorted(front, key=lambda i: -crowding[i])[:size - len(selected)]
+    return selected, ranks, crowding
+
+# -------------------------------------------------------------------
+# Search
+# -------------------------------------------------------------------
+
+def pareto_search(evaluator, domain, max_iter, population=40, aggregation="worst", sigma=0.1, archive_size=ARCHIVE,
+    verbose=True, seed=23):
+    """Searches the front of relative proliferation against total dosage.
+
+    Args:
+        evaluator: Evaluator of the treatments. Its objective is not used.
+        domain: Domain of the treatments.
+        max_iter: Number of generations.
+        population: Number of individuals, every generation evaluates as many offspring.
+        aggregation: How the proliferation of the cell lines is combined, "avg" or "worst".
+        sigma: Initial step size of every individual.
+        archive_size: Number of non-dominated treatments kept. A larger front is thinned out by crowding
+            distance, so its extremes and its sparse regions are kept.
+
+    Returns:
+        xs: At most archive_size non-dominated treatments of all evaluated ones, one per row, ordered by increasing dosage.
+        objectives: Aggregated relative proliferation and total dosage of every treatment.
+        prolifs: Relative proliferation of every treatment per cell line.
+    """
+    proliferation = retrieve_multi_objective(aggregation, 0)
+    np.random.seed(seed)
+
+    def evaluate(xs):
+        ys, prolifs, dosages = evaluator.evaluate_objectives(xs, [proliferation])
+        return np.column_stack([ys[0], dosages]), list(prolifs)
+
+    # start with the untreated plan, the center and uniform samples of the domain
+    xs = [domain.center().flatten()]
+    if domain.contains(np.zeros(domain.dim)):
+        xs.append(np.zeros(domain.dim))
+    xs += [domain.uniform() for _ in range(population - len(xs))]
+    objectives, prolifs = evaluate(xs)
+    sigmas = np.full(len(xs), sigma)
+    _, ranks, crowding = select(objectives, population)
+    front = non_dominated_sort(objectives)[0]
+    front = [front[i] for i in truncate(objectives[front], archive_size)]
+    archive = ([xs[i] for i in front], objectives[front], [prolifs[i] for i in front])
+
+    for k in range(1, max_iter + 1):
+        # binary tournaments by rank and crowding distance
+        parents = []
+        for _ in range(population):
+            a, b = np.random.randint(len(xs), size=2)
+            parents.append(a if (ranks[a], -crowding[a]) <= (ranks[b], -crowding[b]) else b)
+        offspring = [domain.normal(np.vstack(xs[p]), sigmas[p] ** 2 * np.identity(domain.dim)) for p in parents]
+        offspring_objectives, offspring_prolifs = evaluate(offspring)
+
+        candidates = xs + offspring
+        candidate_objectives = np.vstack([objectives, offspring_objectives])
+        candidate_sigmas = np.concatenate([sigmas, sigmas[parents]])
+        selected, ranks, crowding = select(candidate_objectives, population)
+        survivors = set(selected)
+        for i, p in enumerate(parents):
+            if len(xs) + i in survivors:
+                candidate_sigmas[len(xs) + i] *= SUCCESS
+                candidate_sigmas[p] *= SUCCESS
+            else:
+                candidate_sigmas[p] *= FAILURE
+
+        prolifs = [(prolifs + offspring_prolifs)[i] for i in selected]
+        xs = [candidates[i] for i in selected]
+        objectives = candidate_objectives[selected]
+        sigmas = np.clip(candidate_sigmas[selected], SIGMA_MIN, SIGMA_MAX)
+        ranks, crowding = ranks[selected], crowding[selected]
+
+        # the archive keeps the non-dominated treatments seen so far, thinned out to archive_size
+        archive_xs = archive[0] + offspring
+        archive_objectives = np.vstack([archive[1], offspring_objectives])
+        archive_prolifs = archive[2] + offspring_prolifs
+        front = non_dominated_sort(archive_objectives)[0]
+        front = [front[i] for i in truncate(archive_objectives[front], archive_size)]
+        archive = ([archive_xs[i] for i in front], archive_objectives[front], [archive_prolifs[i] for i in front])
+
+        if verbose:
+            print(k, ":", "Archive: ", len(front), "Proliferation: ", np.min(archive[1][:, 0]), "-", np.max(archive[1][:, 0]),
+                "Dosage: ", np.min(archive[1][:, 1]), "-", np.max(archive[1][:, 1]))
+
+    order = np.argsort(archive[1][:, 1])
+    return np.array([archive[0][i] for i in order]), archive[1][order], np.array([archive[2][i] for i in order])
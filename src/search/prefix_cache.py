@@ -0,0 +1,138 @@
+"""
+A bounded cache of evaluated prefixes of sequential treatment plans. For every prefix of a plan it
+stores the relative proliferation of every cell line after the last step of the prefix. A new plan
+only needs to be simulated from its first step which has not been seen before.
+
+The cache is a trie whose nodes are stored in a single ordered dictionary keyed by the path from
+the root. Whenever a node is used, its path is touched from the node up to the root, so ancestors
+are always more recently used than their descendants and the least recently used node is a leaf.
+"""
+
+from collections import OrderedDict
+import numpy as np
+from src.env.drugs import DRUGS
+from src.util.cache import QUANTUM
+
+# maximum number of stored prefixes before least recently used ones are evicted
+MAX_NODES = 100000
+
+# NOTE: plans are keyed by the concentrations of their steps, which are rounded to multiples of QUANTUM
+# before lookup, the same resolution as the proliferation cache
+
+
+class PrefixTrie():
+    """Maps prefixes of treatment plans to the relative proliferations after their last step.
+
+    Attributes:
+        n_steps: Number of steps of a plan.
+        step_dim: Length of a single step in the flat treatment vector.
+        max_nodes: Number of stored prefixes after which least recently used prefixes are evicted.
+        quantum: Resolution of the concentrations in the key.
+        lookups: Number of looked up plans, repeated lookups of the same plan are not counted.
+        hits: Number of looked up plans with at least one cached step.
+        full_hits: Number of looked up plans with all steps cached.
+        cached_steps: Number of steps which did not need to be simulated.
+        relookups: Number of repeated lookups of plans which waited for a plan of the same batch.
+        shared_steps: Number of steps the repeated lookups found beyond their first lookup.
+        evictions: Number of evicted prefixes.
+    """
+
+    def __init__(self, n_steps, step_dim=len(DRUGS), max_nodes=MAX_NODES, quantum=QUANTUM):
+        self.n_steps = n_steps
+        self.step_dim = step_dim
+        self.max_nodes = max_nodes
+        self.quantum = quantum
+        self.nodes = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        self.full_hits = 0
+        self.cached_steps = 0
+        self.relookups = 0
+        self.shared_steps = 0
+        self.evictions = 0
+
+    def path(self, x):
+        """Quantizes every step of a flat concentration vector and returns the tuple of step keys."""
+        x = np.asarray(x, dtype=float)
+        assert len(x) == self.n_steps * self.step_dim, "Detected dimension mismatch in treatment vector."
+        steps = np.rint(x / self.quantum).astype(np.int64).reshape(self.n_steps, self.step_dim)
+        return tuple(tuple(step) for step in steps)
+
+    def next_key(self, x, depth):
+        """Returns the key of the prefix of a plan which ends with its first step after depth."""
+        return self.path(x)[:depth + 1]
+
+    def touch(self, path, depth):
+        for k in range(depth, 0, -1):
+            if path[:k] in self.nodes: # ancestors can be evicted by insertions of the same batch
+                self.nodes.move_to_end(path[:k])
+
+    def lookup(self, x, repeated=None):
+        """Returns the longest cached prefix of a plan.
+
+        Args:
+            x: Flat vector of the concentrations of every step of the plan.
+            repeated: Depth of the earlier lookup if the plan has been looked up before, the lookup
+                then only counts as relookup and does not change the hit counters.
+
+        Returns:
+            depth: Number of leading steps which are cached.
+            rel_proliferations: Numpy array with the relative proliferation of every cell line after
+                the cached steps or None if no step is cached.
+        """
+        path = self.path(x)
+        depth = 0
+        while depth < self.n_steps and path[:depth + 1] in self.nodes:
+            depth += 1
+
+        if repeated is None:
+            self.lookups += 1
+            self.cached_steps += depth
+            self.hits += int(depth > 0)
+            self.full_hits += int(depth == self.n_steps)
+        else:
+            self.relookups += 1
+            self.shared_steps += depth - repeated
+        if depth == 0:
+            return 0, None
+        self.touch(path, depth)
+        return depth, self.nodes[path[:depth]].copy()
+
+    def insert(self, x, trajectory, start=0):
+        """Stores the relative proliferations after every step of a plan.
+
+        Args:
+            x: Flat vector of the concentrations of every step of the plan.
+            trajectory: Array with the relative proliferation of every cell line after each of the
+                steps start + 1, ..., n_steps.
+            start: Number of leading steps which have not been simulated.
+        """
+        path = self.path(x)
+        assert len(trajectory) == self.n_steps - start, "Expected one entry per simulated step."
+        for k, rel_proliferations in enumerate(trajectory, start=start + 1):
+            self.nodes[path[:k]] = np.array(rel_proliferations, dtype=float)
+        self.touch(path, self.n_steps)
+        self.evict()
+
+    def evict(self):
+        while len(self.nodes) > self.max_nodes:
+            self.nodes.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def stats(self):
+        """Returns hit counters, the fraction of steps served from the cache and the size of the trie."""
+        total_steps = self.lookups * self.n_steps
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "full_hits": self.full_hits,
+            "hit_rate": self.hits / self.lookups if self.lookups > 0 else 0.0,
+            "step_hit_rate": self.cached_steps / total_steps if total_steps > 0 else 0.0,
+            "relookups": self.relookups,
+            "shared_steps": self.shared_steps,
+            "nodes": len(self.nodes),
+            "evictions": self.evictions,
+        }
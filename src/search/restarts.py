@@ -0,0 +1,190 @@
+"""
+Restart strategies for CMA-ES. A population which has stagnated is replaced by a new one with a larger
+population size (IPOP), or alternately by a larger or a small one with a smaller step size (BIPOP), see
+Hansen, "Benchmarking a BI-population CMA-ES on the BBOB-2009 function testbed".
+
+Several populations run concurrently on the workers of one evaluator. Every population submits its
+generation on its own and is advanced as soon as its results are in, so the workers are kept busy
+while another population samples or updates.
+"""
+
+import time
+from concurrent.futures import wait, FIRST_COMPLETED, ALL_COMPLETED
+import numpy as np
+from src.search.covariance_matrix_adaption import parameters, initial_state, sampler, UPDATES, StopCriteria, CHECKPOINT_EVERY
+from src.util.checkpoint import save_checkpoint, load_checkpoint
+
+# a population has stagnated once the standard deviation of all coordinates is below TOL_X ...
+TOL_X = 1e-5
+
+# ... or the objective values of its recent generations differ by less than TOL_FUN ...
+TOL_FUN = 1e-8
+
+# ... or the condition number of its covariance exceeds MAX_CONDITION
+MAX_CONDITION = 1e14
+
+
+class Population():
+    """A CMA-ES population which is advanced one generation at a time.
+
+    Attributes:
+        params: Parameters returned by parameters.
+        state: Search distribution.
+        k: Number of completed generations.
+        stop: StopCriteria which decide when the population has stagnated.
+        best: Tuple of the best objective value, sample and proliferation seen by this population.
+    """
+
+    def __init__(self, domain, m=None, sigma=0.25, covariance="full", rank=None):
+        self.domain = domain
+        self.covariance = covariance
+        self.params = parameters(domain.dim, covariance=covariance, rank=rank, m=m)
+        self.state = initial_state(domain, sigma=sigma, covariance=covariance)
+        self.k = 0
+        window = 10 + int(np.ceil(30 * self.params["n"] / self.params["m"]))
+        self.stop = StopCriteria(tol_fun=TOL_FUN, tol_x=TOL_X, stagnation=window, max_condition=MAX_CONDITION)
+        self.best = (np.inf, None, None)
+
+    def ask(self):
+        """Samples a generation, one sample per row."""
+        return self.domain.normal_batch(self.state["mu"], sampler(self.state), self.params["m"])
+
+    def tell(self, xs, ys, prolifs):
+        """Updates the search distribution with the objective values of a generation."""
+        self.k += 1
+        i = int(np.argmin(ys))
+        if ys[i] < self.best[0]:
+            self.best = (ys[i], np.array(xs[i]).flatten(), prolifs[i])
+        self.stop.record(ys)
+        UPDATES[self.covariance](self.params, self.state, xs, ys, self.k)
+
+    def stagnated(self):
+        """Returns true if this population is unlikely to improve further."""
+        return self.stop.check(self.params, self.state) is not None
+
+
+def restart_cma_es(evaluator, domain, max_evals, strategy="ipop", concurrent=2, verbose=True, seed=23, sigma=0.25,
+    covariance="full", rank=None, trace=None, checkpoint=None, checkpoint_every=CHECKPOINT_EVERY):
+    """Runs CMA-ES with restarts until max_evals samples have been evaluated.
+
+    Args:
+        evaluator: Evaluator with a submit method.
+        domain: Domain of the treatments.
+        max_evals: Number of evaluated samples over all populations.
+        strategy: "ipop" doubles the population size with every restart. "bipop" alternates between
+            this large regime and small populations with a reduced step size, whichever has used less
+            of the budget.
+        concurrent: Number of populations which run at the same time.
+        sigma: Initial step size of the default and large populations.
+        covariance: Covariance model of the populations, see cma_es.
+        rank: Number of evolution paths kept by the low rank model.
+        trace: Optional list which receives a tuple (wall time, evaluations, best objective) after every generation.
+        checkpoint: Optional path of a checkpoint file, see cma_es. The order in which generations finish
+            changes the run, so with a checkpoint the running populations advance in rounds: every round
+            waits for all of their generations and handles them in the order the populations were started.
+        checkpoint_every: Number of rounds between two checkpoints.
+
+    Returns:
+        mu: Best treatment found by any population, either a sample or the final mean of a population.
+        obj: Objective value of this treatment.
+        prolif: Relative proliferation of this treatment per cell line.
+        reason: Name of the stop criterion which ended the run, always "max_evals" since populations are
+            restarted until the budget is spent. Kept to match the results of cma_es.
+    """
+    if strategy not in ["ipop", "bipop"]:
+        raise ValueError("Specified restart strategy is unknown.")
+    if checkpoint is not None and not evaluator.reproducible():
+        raise ValueError("Checkpoints require an evaluator without warm starts and proliferation cache.")
+    np.random.seed(seed)
+
+    default = parameters(domain.dim)["m"]
+    budgets = {"large": 0, "small": 0}
+    n_large = 0
+    finished = []
+    running = {}
+    spent = 0
+    best = (np.inf, None, None)
+    n_populations = 0
+    rounds = 0
+    start = time.perf_counter()
+
+    def launch():
+        nonlocal n_large, n_populations
+        n_populations += 1
+        if strategy == "bipop" and n_large > 0 and budgets["small"] < budgets["large"]:
+            u = np.random.uniform()
+            m_large = default * 2 ** (n_large - 1)
+            m = int(default * (0.5 * m_large / default) ** (u ** 2))
+            population = Population(domain, m=max(m, default), sigma=sigma * 10 ** (-2 * u), covariance=covariance, rank=rank)
+            return n_populations, population, "small"
+        m = default * 2 ** n_large
+        n_large += 1
+        return n_populations, Population(domain, m=m, sigma=sigma, covariance=covariance, rank=rank), "large"
+
+    def submit(index, population, regime):
+        nonlocal spent
+        xs = population.ask()
+        running[evaluator.submit(list(xs))] = (index, population, regime, xs)
+        spent += len(xs)
+
+    resumed = load_checkpoint(checkpoint) if checkpoint is not None else None
+    if resumed is not None:
+        np.random.set_state(resumed["random_state"])
+        if resumed["domain_seed"] is not None: # the truncated normal sampler is seeded by the domain
+            domain.seed = resumed["domain_seed"]
+        if resumed["results"] is not None and evaluator.store:
+            evaluator.restore(resumed["results"])
+        if trace is not None and resumed["trace"] is not None:
+            trace[:] = resumed["trace"]
+        budgets, n_large, spent, best, n_populations, rounds = resumed["progress"]
+        start -= resumed["elapsed"]
+        finished = resumed["finished"]
+        for population in finished:
+            population.domain = domain
+        for index, population, regime, xs in resumed["running"]:
+            population.domain = domain
+            running[evaluator.submit(list(xs))] = (index, population, regime, xs)
+        if verbose:
+            print("Resumed from round", rounds)
+
+    while len(running) > 0 or spent < max_evals:
+        while len(running) < concurrent and spent < max_evals:
+            submit(*launch())
+        done, _ = wait(running, return_when=FIRST_COMPLETED if checkpoint is None else ALL_COMPLETED)
+        for future in sorted(done, key=lambda future: running[future][0]):
+            index, population, regime, xs = running.pop(future)
+            ys, prolifs = future.result()
+            budgets[regime] += len(xs)
+            population.tell(xs, ys, prolifs)
+            if population.best[0] < best[0]:
+                best = population.best
+            if trace is not None:
+                trace.append((time.perf_counter() - start, budgets["large"] + budgets["small"], best[0]))
+            if verbose:
+                print(index, regime, population.k, ":", "Best: ", population.stop.bests[-1], "sigma: ", population.state["sigma"])
+            if population.stagnated() or spent >= max_evals:
+                finished.append(population)
+                if verbose:
+                    print("Population", index, "of size", population.params["m"], "stopped after", population.k, "generations.")
+            else:
+                submit(index, population, regime)
+        rounds += 1
+        if checkpoint is not None and rounds % checkpoint_every == 0:
+            save_checkpoint(checkpoint, {
+                "progress": (budgets, n_large, spent, best, n_populations, rounds),
+                "elapsed": time.perf_counter() - start,
+                "finished": finished,
+                "running": sorted(running.values(), key=lambda generation: generation[0]),
+                "random_state": np.random.get_state(),
+                "domain_seed": getattr(domain, "seed", None),
+                "results": evaluator.snapshot() if evaluator.store else None,
+                "trace": list(trace) if trace is not None else None,
+            })
+
+    # the final means are evaluated together
+    means = [population.state["mu"].flatten() for population in finished]
+    ys, prolifs = evaluator.evaluate(means)
+    for mu, y, prolif in zip(means, ys, prolifs):
+        if y < best[0]:
+            best = (y, mu, prolif)
+    return best[1], best[0], best[2], "max_evals"
@@ -0,0 +1,542 @@
+"""
+A flat scheduler which evaluates treatment plans on a single set of worker processes. Every
+treatment plan is split into one task per cell line, the tasks are distributed over the workers
+and the results are reassembled per plan. The number of workers only depends on the number of
+available cores and not on the number of cell lines.
+
+Tasks are assigned longest first to the least loaded worker, using the measured simulation times
+of every cell line as cost estimates. Tasks of a cell line are preferably sent to a worker which has
+simulated this line before and therefore has its zero treatment reference computed, as long as this
+does not extend the estimated makespan. Workers which run out of tasks steal pending tasks from the
+worker with the longest queue. Every worker keeps a single simulator and switches it between cell
+lines. If a worker dies, the open batches fail and the scheduler does not accept new ones.
+
+Batches of plans can be submitted without waiting for their results. The tasks of concurrent batches
+share the workers, so a caller does not have to wait for the slowest task of another batch.
+
+A batch can be queued line by line in a given order and observed result by result, its pending tasks
+can be reordered and the remaining tasks of single plans can be cancelled. This lets a caller race candidates and stop simulating the
+ones which are already known to lose.
+"""
+
+import os
+import time
+import queue
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+from src.reference_simulator.simulator import Simulator
+from src.util.bootstrap import prepare_bootstrap, report_worker, collect_reports
+
+# number of tasks which are sent to a worker before it has returned a result
+PREFETCH = 2
+
+# weight of the latest measurement in the running estimate of the cost of a cell line
+SMOOTHING = 0.3
+
+# seconds the collector waits for a result before it checks whether the workers are alive
+POLL = 1.0
+
+# -------------------------------------------------------------------
+# Worker administration
+# -------------------------------------------------------------------
+
+def initialize(simulator_options, report_queue, spawn_time):
+    global simulator
+    simulator = Simulator(**simulator_options) # shared by all cell lines, keeps their zero terms
+    report_worker(report_queue, "worker-" + str(os.getpid()), spawn_time)
+
+def simulate_plan(task):
+    """Simulates a treatment plan on a single cell line.
+
+    Args:
+        task: Tuple of (batch, plan) index, cell line, the list of treatment dictionaries of the plan and the
+            relative proliferation the plan starts from or None to start from the untreated state.
+
+    Returns:
+        result: Tuple of (batch, plan) index, cell line, the relative proliferation after the last step, the
+            relative proliferation after every step and a dictionary with the wall time, solver time
+            and solver steps of the task.
+    """
+    global simulator
+    start = time.perf_counter()
+    index, cell_line, treatments, initial = task
+    before = simulator.solve_statistics()
+    if simulator.line != cell_line:
+        # switch lines with the zero term of an earlier task on the new line, if there was one
+        simulator.zero_term = simulator.zero_terms.get(cell_line, None)
+        simulator.line = cell_line if simulator.zero_term is not None else None
+    simulator.initialized = False
+    rel_proliferation = simulator.initialize(cell_line)
+    simulator.zero_terms[cell_line] = simulator.zero_term
+    if initial is not None:
+        simulator.R = rel_proliferation = initial
+    trajectory = []
+    for treatment in treatments:
+        rel_proliferation = simulator.apply_treatment(treatment)
+        trajectory.append(rel_proliferation)
+    after = simulator.solve_statistics()
+    cost = {
+        "time": time.perf_counter() - start,
+        "solve_time": after["time"] - before["time"],
+        "steps": after["steps"] - before["steps"],
+    }
+    return (index, cell_line, rel_proliferation, trajectory, cost)
+
+def work(worker_id, task_queue, result_queue, simulator_options, report_queue, spawn_time):
+    """Main loop of a worker process. Runs tasks until it receives None."""
+    initialize(simulator_options, report_queue, spawn_time)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        try:
+            result_queue.put((worker_id, simulate_plan(task), None))
+        except Exception as e:
+            result_queue.put((worker_id, (task[0], task[1], None, None, None), (e, traceback.format_exc())))
+
+# -------------------------------------------------------------------
+# Scheduler
+# -------------------------------------------------------------------
+
+class FlatScheduler():
+    """Evaluates treatment plans with one (plan, cell line) task per simulation.
+
+    Several batches of plans can be submitted concurrently. Their tasks share the pending queues of
+    the workers and a collector thread hands every result to the batch it belongs to.
+
+    Attributes:
+        cell_lines: Cell lines every plan is evaluated on.
+        n_workers: Number of worker processes.
+        report_queue: Queue which receives the footprint of every started worker.
+        warm: Set of cell lines every worker has simulated before.
+        costs: Running estimate of the wall time of a single treatment step per cell line.
+        line_statistics: Number of tasks, accumulated wall and solver time and solver steps per cell line.
+        history: Task count, estimated and measured makespan, start and end time of every finished batch.
+        steals: Number of tasks which have been executed by a worker other than the assigned one.
+        warm_tasks: Number of tasks which have been executed by a worker with a warm simulator.
+        n_tasks: Number of executed tasks.
+        broken: Message of the worker failure which stopped the scheduler or None.
+    """
+
+    def __init__(self, cell_lines, n_workers=None, simulator_options=None, bootstrap=None):
+        """Starts the workers and the collector thread.
+
+        Args:
+            cell_lines: Cell lines every plan is evaluated on.
+            n_workers: Number of worker processes. Defaults to the number of cores.
+            simulator_options: Keyword arguments of the simulators of the workers.
+            bootstrap: Start mode of the workers, see src.util.bootstrap.prepare_bootstrap.
+        """
+        self.cell_lines = list(cell_lines)
+        self.n_workers = n_workers if n_workers is not None else os.cpu_count()
+        self.steals = 0
+        self.warm_tasks = 0
+        self.n_tasks = 0
+        self.warm = [set() for _ in range(self.n_workers)]
+        self.costs = {}
+        self.line_statistics = {line: {"tasks": 0, "time": 0.0, "solve_time": 0.0, "steps": 0} for line in self.cell_lines}
+        self.history = []
+        self.pending = [deque() for _ in range(self.n_workers)]
+        self.in_flight = [0 for _ in range(self.n_workers)]
+        self.batches = {}
+        self.n_batches = 0
+        self.broken = None
+        self.closing = False
+        self.lock = threading.Lock()
+
+        start_method = prepare_bootstrap(bootstrap)
+        context = multiprocessing.get_context(start_method)
+        self.manager = context.Manager()
+        self.report_queue = self.manager.Queue()
+        simulator_options = simulator_options if simulator_options is not None else {}
+        self.result_queue = context.Queue()
+        self.task_queues = []
+        self.workers = []
+        spawn_time = time.time()
+        for i in range(self.n_workers):
+            task_queue = context.Queue()
+            worker = context.Process(target=work, args=(i, task_queue, self.result_queue, simulator_options, self.report_queue, spawn_time))
+            worker.daemon = True
+            worker.start()
+            self.task_queues.append(task_queue)
+            self.workers.append(worker)
+        self.collector = threading.Thread(target=self.collect, daemon=True)
+        self.collector.start()
+
+    def tasks(self, batch_id, plans, initial=None):
+        """Splits the plans into one task per (plan, cell line). Tasks are indexed by batch and plan."""
+        tasks = []
+        for i, plan in enumerate(plans):
+            for j, line in enumerate(self.cell_lines):
+                start = initial[i][j] if initial is not None and initial[i] is not None else None
+                tasks.append(((batch_id, i), line, plan, start))
+        return tasks
+
+    def estimate(self, task):
+        """Returns the estimated wall time of a task or None if no line has been measured yet."""
+        if len(self.costs) == 0:
+            return None
+        step_cost = self.costs.get(task[1], np.mean(list(self.costs.values())))
+        return step_cost * max(len(task[2]), 1)
+
+    def record(self, line, n_steps, cost):
+        """Updates the cost estimate and statistics of a cell line with a finished task."""
+        step_cost = cost["time"] / max(n_steps, 1)
+        if line in self.costs:
+            self.costs[line] = (1 - SMOOTHING) * self.costs[line] + SMOOTHING * step_cost
+        else:
+            self.costs[line] = step_cost
+        statistics = self.line_statistics[line]
+        statistics["tasks"] += 1
+        statistics["time"] += cost["time"]
+        statistics["solve_time"] += cost["solve_time"]
+        statistics["steps"] += cost["steps"]
+
+    def distribute(self, tasks):
+        """Assigns the tasks longest first to the pending queues of the workers.
+
+        Every task goes to the least loaded worker, counting the tasks which are already pending. A
+        worker which has simulated the cell line of the task before is preferred as long as its load
+        stays below the estimated makespan. Must be called with the lock held.
+
+        Returns:
+            makespan: Estimated makespan of the pending tasks or None if there are no cost estimates.
+        """
+        estimates = [self.estimate(task) for task in tasks]
+        costs = [e if e is not None else 1.0 for e in estimates]
+        order = sorted(range(len(tasks)), key=lambda i: (-costs[i], tasks[i][1]))
+
+        loads = [sum(self.estimate(task) or 1.0 for task in queue) for queue in self.pending]
+        lower_bound = (sum(costs) + sum(loads)) / self.n_workers
+        lines = [set(warm) for warm in self.warm]
+        for i in order:
+            task = tasks[i]
+            worker_id = min(range(self.n_workers), key=lambda w: loads[w])
+            warm = [w for w in range(self.n_workers) if task[1] in lines[w]]
+            if len(warm) > 0:
+                warm_id = min(warm, key=lambda w: loads[w])
+                if loads[warm_id] + costs[i] <= max(lower_bound, max(loads)):
+                    worker_id = warm_id
+            self.pending[worker_id].append(task)
+            loads[worker_id] += costs[i]
+            lines[worker_id].add(task[1])
+
+        return max(loads) if estimates and estimates[0] is not None else None
+
+    def steal(self, worker_id):
+        """Takes a task from the worker with the most pending tasks, preferring lines the thief has simulated."""
+        victim = max(range(self.n_workers), key=lambda i: len(self.pending[i]))
+        if len(self.pending[victim]) == 0:
+            return None
+        for task in reversed(self.pending[victim]):
+            if task[1] in self.warm[worker_id]:
+                self.pending[victim].remove(task)
+                return task
+        return self.pending[victim].pop()
+
+    def next_task(self, worker_id):
+        if len(self.pending[worker_id]) > 0:
+            return self.pending[worker_id].popleft()
+        task = self.steal(worker_id)
+        if task is not None:
+            self.steals += 1
+        return task
+
+    def dispatch(self, worker_id):
+        """Sends tasks to a worker until it has PREFETCH unfinished tasks or no task is left."""
+        while self.in_flight[worker_id] < PREFETCH:
+            task = self.next_task(worker_id)
+            if task is None:
+                return
+            if task[1] in self.warm[worker_id]:
+                self.warm_tasks += 1
+            self.warm[worker_id].add(task[1])
+            self.task_queues[worker_id].put(task)
+            self.in_flight[worker_id] += 1
+
+    def submit(self, plans, initial=None, trajectories=False, order=None, on_result=None):
+        """Starts the evaluation of every plan on every cell line without waiting for the results.
+
+        Args:
+            plans: List of treatment plans. A plan is a list of treatment dictionaries, one per step.
+            initial: Optional list with the relative proliferation per cell line every plan starts from.
+                An entry of None starts the plan from the untreated state.
+            trajectories: If set to true, the future resolves to the relative proliferation after every step.
+            order: Optional list of all cell lines. The tasks of a line are queued behind those of the lines
+                before it, instead of longest first.
+            on_result: Optional function which is called with the batch id, the plan index, the cell line and
+                the relative proliferation of every task of the batch as soon as it has returned. It is
+                called by the collector thread and may call reorder and cancel.
+
+        Returns:
+            future: concurrent.futures.Future which resolves to the result of run. If a simulation fails
+                in a worker or a worker dies, the future holds a RuntimeError. The tasks of cancelled plans which have not
+                been simulated are NaN.
+        """
+        future = Future()
+        with self.lock:
+            if self.broken is not None:
+                future.set_exception(RuntimeError(self.broken))
+                return future
+            batch_id = self.n_batches
+            self.n_batches += 1
+            tasks = self.tasks(batch_id, plans, initial=initial)
+            if order is None:
+                estimated = self.distribute(tasks)
+            else:
+                assert sorted(order) == sorted(self.cell_lines), "The order has to contain every cell line once."
+                for line in order:
+                    estimated = self.distribute([task for task in tasks if task[1] == line])
+            self.batches[batch_id] = {
+                "future": future,
+                "plans": plans,
+                "trajectories": trajectories,
+                "rel_proliferations": np.full((len(plans), len(self.cell_lines)), np.nan),
+                "steps": [np.zeros((len(plan), len(self.cell_lines))) for plan in plans],
+                "outstanding": len(tasks),
+                "failure": None,
+                "cancelled": set(),
+                "on_result": on_result,
+                "start": time.perf_counter(),
+                "estimated": estimated,
+            }
+            for i in range(self.n_workers):
+                self.dispatch(i)
+            finished = self.finish(batch_id) if len(tasks) == 0 else None
+        if finished is not None:
+            self.resolve(*finished)
+        return future
+
+    def run(self, plans, initial=None, trajectories=False):
+        """Evaluates every plan on every cell line.
+
+        Args:
+            plans: List of treatment plans. A plan is a list of treatment dictionaries, one per step.
+            initial: Optional list with the relative proliferation per cell line every plan starts from.
+                An entry of None starts the plan from the untreated state.
+            trajectories: If set to true, returns the relative proliferation after every step.
+
+        Returns:
+            rel_proliferations: Numpy array of shape (len(plans), len(cell_lines)) ordered as the cell lines.
+                If trajectories is set, a list with one array of shape (len(plan), len(cell_lines)) per plan.
+
+        Raises:
+            RuntimeError: If a simulation has failed in a worker or a worker has died.
+        """
+        return self.submit(plans, initial=initial, trajectories=trajectories).result()
+
+    def drop(self, batch_id, indices=None):
+        """Removes the pending tasks of a batch, or only those of the given plans. Must be called with the lock held.
+
+        Returns:
+            dropped: Number of removed tasks.
+        """
+        batch = self.batches[batch_id]
+        dropped = 0
+        for queue in self.pending:
+            tasks = [task for task in queue if task[0][0] == batch_id and (indices is None or task[0][1] in indices)]
+            for task in tasks:
+                queue.remove(task)
+            dropped += len(tasks)
+        batch["outstanding"] -= dropped
+        return dropped
+
+    def reorder(self, batch_id, key):
+        """Sorts the pending tasks of a batch in every queue by key(plan index, cell line).
+
+        The tasks of other batches keep their positions.
+        """
+        with self.lock:
+            for queue in self.pending:
+                positions = [i for i, task in enumerate(queue) if task[0][0] == batch_id]
+                tasks = sorted([queue[i] for i in positions], key=lambda task: key(task[0][1], task[1]))
+                for i, task in zip(positions, tasks):
+                    queue[i] = task
+
+    def cancel(self, batch_id, indices):
+        """Stops the simulation of the given plans of a batch. Tasks which are already running still return.
+
+        Returns:
+            dropped: Number of tasks which will not be simulated.
+        """
+        finished = None
+        with self.lock:
+            if batch_id not in self.batches:
+                return 0
+            self.batches[batch_id]["cancelled"].update(indices)
+            dropped = self.drop(batch_id, set(indices))
+            if self.batches[batch_id]["outstanding"] == 0:
+                finished = self.finish(batch_id)
+        if finished is not None:
+            self.resolve(*finished)
+        return dropped
+
+    def check_workers(self):
+        """Fails every open batch once a worker has died, since the tasks it was sent never return.
+
+        Must be called with the lock held.
+
+        Returns:
+            finished: List of the prepared results of the failed batches.
+        """
+        if self.closing or self.broken is not None:
+            return []
+        dead = [i for i, worker in enumerate(self.workers) if not worker.is_alive()]
+        if len(dead) == 0:
+            return []
+        self.broken = "Worker %d died with exit code %s." % (dead[0], self.workers[dead[0]].exitcode)
+        for pending in self.pending:
+            pending.clear()
+        finished = []
+        for batch_id in list(self.batches):
+            if self.batches[batch_id]["failure"] is None:
+                self.batches[batch_id]["failure"] = (None, self.broken)
+            finished.append(self.finish(batch_id))
+        return finished
+
+    def collect(self):
+        """Main loop of the collector thread. Hands results to their batches until it receives None.
+
+        While it waits for results, it checks every POLL seconds whether the workers are still alive.
+        """
+        column = {line: j for j, line in enumerate(self.cell_lines)}
+        while True:
+            try:
+                result = self.result_queue.get(timeout=POLL)
+            except queue.Empty:
+                with self.lock:
+                    failed = self.check_workers()
+                for finished in failed:
+                    self.resolve(*finished)
+                continue
+            if result is None:
+                break
+            worker_id, ((batch_id, index), line, rel_proliferation, trajectory, cost), error = result
+            finished = None
+            on_result = None
+            with self.lock:
+                if batch_id not in self.batches: # failed by a dead worker
+                    continue
+                self.in_flight[worker_id] -= 1
+                self.n_tasks += 1
+                batch = self.batches[batch_id]
+                batch["outstanding"] -= 1
+                if error is not None:
+                    if batch["failure"] is None:
+                        batch["failure"] = error
+                    # drop the remaining tasks of the batch, but collect the results which are under way
+                    self.drop(batch_id)
+                elif batch["failure"] is None:
+                    batch["rel_proliferations"][index, column[line]] = rel_proliferation
+                    batch["steps"][index][:, column[line]] = trajectory
+                    self.record(line, len(batch["plans"][index]), cost)
+                    on_result = batch["on_result"]
+                self.dispatch(worker_id)
+                if batch["outstanding"] == 0:
+                    finished = self.finish(batch_id)
+            # futures are resolved outside of the lock since their callbacks may submit new batches
+            if on_result is not None:
+                on_result(batch_id, index, line, rel_proliferation)
+            if finished is not None:
+                self.resolve(*finished)
+
+    def finish(self, batch_id):
+        """Removes a batch whose tasks have all returned and prepares its result. Must be called with the lock held."""
+        batch = self.batches.pop(batch_id)
+        if batch["failure"] is not None:
+            error = RuntimeError("Simulation failed in worker:\n" + batch["failure"][1])
+            error.__cause__ = batch["failure"][0]
+            return batch["future"], None, error
+        completed = [i for i in range(len(batch["plans"])) if i not in batch["cancelled"]]
+        assert not np.any(np.isnan(batch["rel_proliferations"][completed])), "Not all tasks have been completed."
+        end = time.perf_counter()
+        self.history.append({
+            "tasks": len(batch["plans"]) * len(self.cell_lines) - int(np.sum(np.isnan(batch["rel_proliferations"]))),
+            "estimated": batch["estimated"],
+            "measured": end - batch["start"],
+            "start": batch["start"],
+            "end": end,
+        })
+        if batch["trajectories"]:
+            return batch["future"], batch["steps"], None
+        return batch["future"], batch["rel_proliferations"], None
+
+    def resolve(self, future, result, error):
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def stats(self):
+        """Returns the number of executed, stolen and warm started tasks."""
+        return {
+            "tasks": self.n_tasks,
+            "steals": self.steals,
+            "warm_tasks": self.warm_tasks,
+            "warm_rate": self.warm_tasks / self.n_tasks if self.n_tasks > 0 else 0.0,
+        }
+
+    def worker_report(self):
+        """Returns footprint and spawn latency of the workers started so far."""
+        return collect_reports(self.report_queue)
+
+    def terminate(self):
+        with self.lock:
+            self.closing = True
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.result_queue.put(None)
+        self.collector.join()
+        self.manager.shutdown()
+
+# -------------------------------------------------------------------
+# Reports
+# -------------------------------------------------------------------
+
+def aggregate_history(history, tasks):
+    """Merges consecutively finished batches of the history until every entry holds at least tasks tasks.
+
+    Steady-state CMA-ES submits every candidate as its own batch, which makes its history incomparable
+    with the one of a generational run. Merged with the task count of a generation, every entry spans from
+    the first start to the last end of its batches, and its estimate ends with the latest estimated end.
+    """
+    merged = []
+    group = []
+    for i, entry in enumerate(history):
+        group.append(entry)
+        if sum(e["tasks"] for e in group) < tasks and i < len(history) - 1:
+            continue
+        start = min(e["start"] for e in group)
+        estimated = None
+        if all(e["estimated"] is not None for e in group):
+            estimated = max(e["start"] + e["estimated"] for e in group) - start
+        merged.append({
+            "tasks": sum(e["tasks"] for e in group),
+            "estimated": estimated,
+            "measured": max(e["end"] for e in group) - start,
+            "start": start,
+            "end": max(e["end"] for e in group),
+        })
+        group = []
+    return merged
+
+def print_makespan_report(history, line_statistics=None):
+    """Prints estimated and measured makespan per generation and the measured cost of every cell line."""
+    print("generation  tasks  estimated  measured")
+    for i, entry in enumerate(history):
+        estimated = "%9.2f s" % entry["estimated"] if entry["estimated"] is not None else "      n/a  "
+        print("%10d  %5d  %s  %6.2f s" % (i, entry["tasks"], estimated, entry["measured"]))
+    if line_statistics is None:
+        return
+    print("cell line          tasks   mean time   mean steps")
+    for line, statistics in sorted(line_statistics.items(), key=lambda item: -item[1]["time"]):
+        if statistics["tasks"] == 0:
+            continue
+        print("%-16s  %6d  %8.3f s  %11.1f" % (line, statistics["tasks"], statistics["time"] / statistics["tasks"],
+            statistics["steps"] / statistics["tasks"]))
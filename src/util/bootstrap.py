@@ -0,0 +1,87 @@
+"""
+Helpers to start worker processes from a process which has loaded the model already, so that the
+model is shared copy-on-write instead of being loaded by every worker, and to report the memory
+footprint and spawn latency of the started workers.
+"""
+
+import os
+import time
+import resource
+import multiprocessing
+
+# importing this module loads the model into the forkserver
+PRELOAD_MODULE = "src.reference_simulator.preload"
+
+def prepare_bootstrap(bootstrap):
+    """Prepares a bootstrap mode and returns the start method for MyPool.
+
+    Args:
+        bootstrap: None to keep the default start method, "fork" to load the model in this process
+            before forking the workers or "forkserver" to load it once in the forkserver.
+
+    Returns:
+        start_method: Start method which has to be used for the worker pool.
+
+    Raises:
+        ValueError: If the bootstrap mode is unknown.
+    """
+    if bootstrap is None:
+        return None
+    if bootstrap == "fork":
+        from src.reference_simulator.simulator import preload
+        preload()
+        return "fork"
+    if bootstrap == "forkserver":
+        multiprocessing.set_forkserver_preload([PRELOAD_MODULE])
+        return "forkserver"
+    raise ValueError("Specified bootstrap mode is unknown.")
+
+def memory_usage():
+    """Returns resident and proportional set size of this process in bytes.
+
+    The proportional set size splits shared pages between the processes sharing them and therefore
+    shows the effect of copy-on-write sharing. It is None if the platform does not provide it.
+    """
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                if key in ["Rss", "Pss"]:
+                    usage[key] = int(value.split()[0]) * 1024
+    except OSError:
+        usage["Rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return usage.get("Rss"), usage.get("Pss")
+
+def report_worker(report_queue, name, spawn_time):
+    """Sends the footprint of a freshly initialized worker to the report queue."""
+    if report_queue is None:
+        return
+    rss, pss = memory_usage()
+    report_queue.put({
+        "name": name,
+        "pid": os.getpid(),
+        "latency": time.time() - spawn_time,
+        "rss": rss,
+        "pss": pss,
+    })
+
+def collect_reports(report_queue):
+    """Returns all worker reports which have been sent so far."""
+    reports = []
+    while not report_queue.empty():
+        reports.append(report_queue.get())
+    return reports
+
+def print_reports(reports):
+    """Prints the worker reports together with a short summary."""
+    if len(reports) == 0:
+        print("No worker reports available.")
+        return
+    mb = 1024.0 * 1024.0
+    for r in sorted(reports, key=lambda r: r["name"]):
+        pss = "%8.1f MB" % (r["pss"] / mb) if r["pss"] is not None else "     n/a"
+        print("  %-16s pid %7d  spawn %6.2f s  rss %8.1f MB  pss %s" % (r["name"], r["pid"], r["latency"], r["rss"] / mb, pss))
+    latencies = [r["latency"] for r in reports]
+    print("  %d workers, max spawn latency %.2f s, total rss %.1f MB" \
+        % (len(reports), max(latencies), sum(r["rss"] for r in reports) / mb))
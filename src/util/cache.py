@@ -0,0 +1,188 @@
+"""
+A persistent cache for the proliferation ratios of single treatment steps. The cache is stored in a local
+SQLite database which allows many concurrent processes (e.g. all jobs of a lambda sweep) to share results.
+Entries are keyed by cell line, quantized drug concentrations and a fingerprint of the compiled model.
+"""
+
+import os
+import time
+import sqlite3
+import numpy as np
+from src.env.drugs import DRUGS
+
+DEFAULT_PATH = "./artifacts/cache/proliferation.sqlite"
+
+# concentrations are rounded to multiples of this value before lookup
+QUANTUM = 1e-4
+
+# maximum number of entries before least recently used entries are evicted
+MAX_ENTRIES = 2000000
+
+# number of insertions between two checks of the cache size
+EVICTION_INTERVAL = 1000
+
+# fraction of the maximum size which remains after an eviction
+EVICTION_TARGET = 0.9
+
+# number of buffered access times of hits after which they are written even without an insertion
+ACCESS_FLUSH = 1000
+
+# used for the two drug baseline
+RATIOS = [x * 5 for x in range(21)] # 5% steps
+
+
+class ProliferationCache():
+    """Persistent mapping from (cell line, drug concentrations, model) to the ratio of a treatment step.
+
+    Attributes:
+        fingerprint: Fingerprint of the compiled model the entries belong to.
+        path: Location of the database file.
+        max_entries: Number of entries after which least recently used entries are evicted.
+        quantum: Resolution of the concentrations in the key.
+        hits: Number of successful lookups of this instance.
+        misses: Number of failed lookups of this instance.
+    """
+
+    def __init__(self, fingerprint, path=DEFAULT_PATH, max_entries=MAX_ENTRIES, quantum=QUANTUM, timeout=60.0):
+        self.fingerprint = fingerprint
+        self.path = path
+        self.max_entries = max_entries
+        self.quantum = quantum
+        self.hits = 0
+        self.misses = 0
+        self.insertions = 0
+        # access times of hits, written together with the next insertion so lookups do not write
+        self.accesses = {}
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS ratios ("
+                "line TEXT, doses TEXT, model TEXT, ratio REAL, last_access REAL, "
+                "PRIMARY KEY (line, doses, model))"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS access ON ratios (last_access)")
+
+    def key(self, concentrations):
+        """Quantizes the concentrations of the 7 drugs and turns them into a string key."""
+        concentrations = np.asarray(concentrations, dtype=float)
+        assert len(concentrations) == len(DRUGS), "Expected one concentration per drug."
+        return ",".join(str(int(q)) for q in np.rint(concentrations / self.quantum))
+
+    def get(self, cell_line, concentrations):
+        """Returns the cached ratio for the treatment or None if it has not been simulated yet."""
+        doses = self.key(concentrations)
+        row = self.connection.execute(
+            "SELECT ratio FROM ratios WHERE line = ? AND doses = ? AND model = ?",
+            (cell_line, doses, self.fingerprint)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.accesses[(cell_line, doses)] = time.time()
+        if len(self.accesses) >= ACCESS_FLUSH:
+            with self.connection:
+                self.flush()
+        return row[0]
+
+    def flush(self):
+        """Writes the buffered access times. Must be called inside a transaction."""
+        if len(self.accesses) == 0:
+            return
+        self.connection.executemany(
+            "UPDATE ratios SET last_access = ? WHERE line = ? AND doses = ? AND model = ?",
+            [(t, line, doses, self.fingerprint) for (line, doses), t in self.accesses.items()]
+        )
+        self.accesses = {}
+
+    def put(self, cell_line, concentrations, ratio):
+        """Stores the ratio of a single treatment step."""
+        self.put_many([(cell_line, concentrations, ratio)])
+
+    def put_many(self, entries):
+        """Stores a list of (cell line, concentrations, ratio) tuples in a single transaction."""
+        now = time.time()
+        rows = [(line, self.key(c), self.fingerprint, float(r), now) for line, c, r in entries]
+        with self.connection:
+            self.flush()
+            self.connection.executemany("INSERT OR REPLACE INTO ratios VALUES (?, ?, ?, ?, ?)", rows)
+
+        previous = self.insertions
+        self.insertions += len(rows)
+        if self.insertions // EVICTION_INTERVAL > previous // EVICTION_INTERVAL:
+            self.evict()
+
+    def evict(self):
+        """Removes least recently used entries once the cache exceeds its maximum size."""
+        size = len(self)
+        if size <= self.max_entries:
+            return 0
+        n = size - int(EVICTION_TARGET * self.max_entries)
+        with self.connection:
+            self.flush()
+            self.connection.execute(
+                "DELETE FROM ratios WHERE rowid IN (SELECT rowid FROM ratios ORDER BY last_access LIMIT ?)", (n,)
+            )
+        return n
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM ratios").fetchone()[0]
+
+    def stats(self):
+        """Returns the hit and miss counters of this instance together with the size of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        with self.connection:
+            self.flush()
+        self.connection.close()
+
+# -------------------------------------------------------------------
+# Pre-warming from baseline data
+# -------------------------------------------------------------------
+
+def warm_from_baselines(cache, cell_lines, path="./artifacts/baselines/"):
+    """
+    Loads the single and two drug baselines of the given cell lines into the cache. Baselines contain
+    the relative proliferation of a single treatment step which is exactly the cached quantity.
+    Returns the number of stored entries.
+    """
+    import pandas as pd # only needed here, keeps the import of the simulator cheap
+    n = 0
+    for line in cell_lines:
+        entries = []
+        single_path = path + line + "_baseline.pkl"
+        if os.path.isfile(single_path):
+            data = pd.read_pickle(single_path)
+            for i, drug in enumerate(DRUGS):
+                for con, prolif in zip(data["concentration"].values, data[drug].values):
+                    concentrations = np.zeros(len(DRUGS))
+                    concentrations[i] = con
+                    entries.append((line, concentrations, prolif))
+
+        dual_path = path + line + "_dual.pkl"
+        if os.path.isfile(dual_path):
+            data = pd.read_pickle(dual_path)
+            for r in RATIOS:
+                for con, prolif in zip(data["concentration"].values, data[r].values):
+                    concentrations = np.zeros(len(DRUGS))
+                    concentrations[DRUGS.index('PD0325901')] = (1 - (r / 100.0)) * con
+                    concentrations[DRUGS.index('PLX-4720')] = (r / 100.0) * con
+                    entries.append((line, concentrations, prolif))
+
+        cache.put_many(entries)
+        n += len(entries)
+    return n
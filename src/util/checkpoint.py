@@ -0,0 +1,44 @@
+"""
+Helpers to write and read checkpoints of long optimization runs. A checkpoint is written to a temporary
+file first and then moved into place, so a run which is interrupted while writing keeps its previous
+checkpoint.
+
+A run continues from its checkpoint with the same iterations as an uninterrupted run only if the result of
+an evaluation does not depend on the evaluations before it, see reproducible_config.
+"""
+
+import os
+import pickle
+
+def save_checkpoint(path, checkpoint):
+    """Writes a checkpoint dictionary to path, replacing an older checkpoint atomically."""
+    directory = os.path.dirname(path)
+    if directory != "" and not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    """Returns the checkpoint dictionary stored at path or None if there is no checkpoint."""
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def remove_checkpoint(path):
+    """Removes the checkpoint of a finished run."""
+    if os.path.isfile(path):
+        os.remove(path)
+
+def reproducible_config(config):
+    """Returns a copy of an evaluator configuration without the features whose results depend on the evaluation order.
+
+    Warm started solves start from the steady states of earlier solves, and the shared proliferation cache
+    returns the ratio of whichever treatment within its quantum was simulated first, by this or another job.
+    Composition and the schedulers do not change any result.
+    """
+    return dict(config, warm_start=False, cache=None)
@@ -7,6 +7,30 @@ EPS = 0
 SEED = 23
 BURN_IN = 5000
 
+class FactorizedNormal():
+    """Zero-mean normal distribution which is sampled through a factor of its covariance.
+
+    Attributes:
+        draw: Function which returns size samples as an array with one sample per row.
+        covariance: Function which returns the dense covariance, only called by domains which cannot sample otherwise.
+    """
+
+    def __init__(self, draw, covariance):
+        self.draw = draw
+        self.covariance = covariance
+
+def normal_samples(mu, sigma, size):
+    """Samples size points of the normal distribution with mean mu, one per row.
+
+    Args:
+        mu: Mean of the distribution.
+        sigma: Covariance matrix or FactorizedNormal of the distribution.
+        size: Number of samples.
+    """
+    if isinstance(sigma, FactorizedNormal):
+        return mu.flatten() + sigma.draw(size)
+    return multivariate_normal(mu.flatten(), sigma, size)
+
 class Domain(ABC):
     @abstractmethod
     def contains(self, x):
@@ -24,6 +48,24 @@ class Domain(ABC):
     def center(self):
         raise NotImplementedError()
 
+    def normal_batch(self, mu, sigma, size):
+        """Samples size points of the normal distribution restricted to the domain, one per row.
+
+        The covariance sigma is either a matrix or a FactorizedNormal.
+        """
+        if isinstance(sigma, FactorizedNormal):
+            sigma = sigma.covariance()
+        return np.array([self.normal(mu, sigma) for _ in range(size)])
+
+    def rejection_batch(self, mu, sigma, size, contains):
+        """Samples a whole batch at once and only resamples the rows for which contains is false."""
+        samples = normal_samples(mu, sigma, size)
+        invalid = ~contains(samples)
+        while np.any(invalid):
+            samples[invalid] = normal_samples(mu, sigma, int(np.sum(invalid)))
+            invalid = ~contains(samples)
+        return samples
+
 class UnitSimplex(Domain):
     def __init__(self, dim, seed=23):
         np.random.seed(seed)
@@ -52,6 +94,10 @@ class UnitSimplex(Domain):
             s = multivariate_normal(mu.flatten(), sigma)
         return s
 
+    def normal_batch(self, mu, sigma, size):
+        return self.rejection_batch(mu, sigma, size,
+            lambda xs: np.all(xs >= -EPS, axis=1) & (np.sum(xs, axis=1) <= 1 + EPS))
+
     def center(self):
         return np.vstack(np.ones(self.dim) / self.dim) 
 
@@ -125,6 +171,9 @@ class Cube(Domain):
             s = multivariate_normal(mu.flatten(), sigma)
         return s
 
+    def normal_batch(self, mu, sigma, size):
+        return self.rejection_batch(mu, sigma, size, lambda xs: np.all((xs >= -EPS) & (xs <= 1 + EPS), axis=1))
+
     def center(self):
         return np.vstack(np.ones(self.dim) / 2)
  
@@ -159,6 +208,9 @@ class SequentialCube(Domain):
             s = multivariate_normal(mu.flatten(), sigma)
         return s
 
+    def normal_batch(self, mu, sigma, size):
+        return self.rejection_batch(mu, sigma, size, lambda xs: np.all((xs >= -EPS) & (xs <= 1 + EPS), axis=1))
+
     def center(self):
         center = np.concatenate([self.single.center().flatten() for i in range(self.n_steps)])
         return np.vstack(center) 
@@ -5,9 +5,10 @@ In the future one might switch to celery for a clean solution
 """
 
 import multiprocessing
+from multiprocessing import context
 from multiprocessing.pool import Pool
 
-class NoDaemonProcess(multiprocessing.Process):
+class NoDaemonMixin():
     @property
     def daemon(self):
         return False
@@ -17,12 +18,60 @@ class NoDaemonProcess(multiprocessing.Process):
         pass
 
 
+class NoDaemonProcess(NoDaemonMixin, multiprocessing.Process):
+    pass
+
+
 class NoDaemonContext(type(multiprocessing.get_context())):
     Process = NoDaemonProcess
 
+# Variants for explicit start methods. They need to live on module level to be pickable.
+
+class NoDaemonForkProcess(NoDaemonMixin, context.ForkProcess):
+    pass
+
+
+class NoDaemonForkContext(context.ForkContext):
+    Process = NoDaemonForkProcess
+
+
+class NoDaemonForkServerProcess(NoDaemonMixin, context.ForkServerProcess):
+    pass
+
+
+class NoDaemonForkServerContext(context.ForkServerContext):
+    Process = NoDaemonForkServerProcess
+
+
+class NoDaemonSpawnProcess(NoDaemonMixin, context.SpawnProcess):
+    pass
+
+
+class NoDaemonSpawnContext(context.SpawnContext):
+    Process = NoDaemonSpawnProcess
+
+
+CONTEXTS = {
+    None: NoDaemonContext,
+    "fork": NoDaemonForkContext,
+    "forkserver": NoDaemonForkServerContext,
+    "spawn": NoDaemonSpawnContext,
+}
+
+def no_daemon_context(start_method=None):
+    """Returns a context for the start method whose processes can have children."""
+    if start_method not in CONTEXTS:
+        raise ValueError("Specified start method is unknown.")
+    return CONTEXTS[start_method]()
+
 # We sub-class multiprocessing.pool.Pool instead of multiprocessing.Pool
 # because the latter is only a wrapper function, not a proper class.
 class MyPool(Pool):
-    def __init__(self, *args, **kwargs):
-        kwargs['context'] = NoDaemonContext()
+    def __new__(cls, *args, start_method=None, **kwargs):
+        # checked before the pool exists, Pool.__del__ fails on a pool whose __init__ has not run
+        no_daemon_context(start_method)
+        return super(MyPool, cls).__new__(cls)
+
+    def __init__(self, *args, start_method=None, **kwargs):
+        kwargs['context'] = no_daemon_context(start_method)
         super(MyPool, self).__init__(*args, **kwargs)
@@ -66,3 +66,25 @@ def prepare_dict(concentrations, max_dosage=8000, scale="linear"):
 
 
 
+
+def prepare_batch(concentrations, max_dosage=8000, scale="linear"):
+    """ Vectorized version of prepare_dict for a batch of treatments.
+
+        Args:
+            concentrations: A numpy array of shape (n, 7) with one treatment per row.
+            max_dosage: A 1 concentration corresponds to this value.
+
+        Returns:
+            treatments: A numpy array of shape (n, 7) with drug concentrations ordered as in DRUGS.
+    """
+    concentrations = np.asarray(concentrations, dtype=float)
+    assert concentrations.ndim == 2 and concentrations.shape[1] == len(DRUGS)
+
+    if scale == "linear":
+        return concentrations * max_dosage
+    elif scale == "log":
+        return ((max_dosage + 1) ** concentrations) - 1
+    elif scale == "real":
+        return concentrations.copy()
+    else:
+        raise ValueError("Provided scale, is unknown.")
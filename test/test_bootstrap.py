@@ -0,0 +1,47 @@
+import unittest
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+import time
+from multiprocessing import Manager
+from src.util.bootstrap import prepare_bootstrap, memory_usage, report_worker, collect_reports
+from src.util.pool_hack import MyPool
+
+def initialize(report_queue, spawn_time):
+    report_worker(report_queue, "worker-" + str(os.getpid()), spawn_time)
+
+def pid(_):
+    return os.getpid()
+
+class TestBootstrap(unittest.TestCase):
+
+    def test_prepare_bootstrap(self):
+        self.assertIsNone(prepare_bootstrap(None))
+        self.assertRaises(ValueError, prepare_bootstrap, "unknown")
+
+    def test_memory_usage(self):
+        rss, pss = memory_usage()
+        self.assertTrue(rss > 0)
+        self.assertTrue(pss is None or pss > 0)
+
+    def test_worker_reports(self):
+        # every worker of every start method reports once after its initialization
+        n_workers = 2
+        for start_method in [None, "fork", "forkserver", "spawn"]:
+            manager = Manager()
+            report_queue = manager.Queue()
+            pool = MyPool(n_workers, initialize, (report_queue, time.time()), start_method=start_method)
+            pool.map(pid, range(4 * n_workers))
+            pool.close()
+            pool.join()
+            reports = collect_reports(report_queue)
+            self.assertEqual(len(reports), n_workers)
+            for r in reports:
+                self.assertTrue(r["latency"] >= 0)
+                self.assertTrue(r["rss"] > 0)
+            manager.shutdown()
+        self.assertRaises(ValueError, MyPool, 1, start_method="unknown")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import os,sys,inspect
+import tempfile
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+from src.util.cache import ProliferationCache
+from src.env.drugs import DRUGS
+import numpy as np
+
+FINGERPRINT = "test"
+
+class TestProliferationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite")
+        self.cache = ProliferationCache(FINGERPRINT, path=self.path, max_entries=10)
+        self.concentrations = np.array([1000.0, 0, 0, 500.0, 0, 0, 0])
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get("DV90", self.concentrations))
+        self.cache.put("DV90", self.concentrations, 0.5)
+        self.assertAlmostEqual(self.cache.get("DV90", self.concentrations), 0.5)
+        # quantized concentrations share an entry, other lines and models do not
+        self.assertAlmostEqual(self.cache.get("DV90", self.concentrations + 1e-6), 0.5)
+        self.assertIsNone(self.cache.get("HS695T", self.concentrations))
+        other = ProliferationCache("other", path=self.path)
+        self.assertIsNone(other.get("DV90", self.concentrations))
+        other.close()
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["entries"], 1)
+
+    def test_shared(self):
+        # a second connection sees the entries of the first one
+        self.cache.put("DV90", self.concentrations, 0.25)
+        second = ProliferationCache(FINGERPRINT, path=self.path)
+        self.assertAlmostEqual(second.get("DV90", self.concentrations), 0.25)
+        second.close()
+
+    def test_eviction(self):
+        entries = [("DV90", np.full(len(DRUGS), float(i)), 1.0) for i in range(20)]
+        self.cache.put_many(entries)
+        self.cache.get("DV90", np.zeros(len(DRUGS)))
+        self.assertEqual(self.cache.evict(), 11)
+        self.assertEqual(len(self.cache), 9)
+        # the recently used entry survives the eviction
+        self.assertAlmostEqual(self.cache.get("DV90", np.zeros(len(DRUGS))), 1.0)
+
+    def test_access_buffered(self):
+        # hits do not write, their access times are stored with the next insertion
+        self.cache.put("DV90", self.concentrations, 0.5)
+        query = "SELECT last_access FROM ratios WHERE line = 'DV90'"
+        stored = self.cache.connection.execute(query).fetchone()[0]
+        self.cache.get("DV90", self.concentrations)
+        self.assertEqual(self.cache.connection.execute(query).fetchone()[0], stored)
+        self.cache.put("HS695T", self.concentrations, 0.25)
+        self.assertTrue(self.cache.connection.execute(query).fetchone()[0] > stored)
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()
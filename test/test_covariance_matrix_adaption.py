@@ -1,15 +1,17 @@
 import unittest
+import tempfile
 import os,sys,inspect
 import numpy as np
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0,parentdir) 
 from src.search.evaluator import Evaluator
-from src.search.covariance_matrix_adaption import cma_es
+from src.search.covariance_matrix_adaption import cma_es, async_cma_es, parameters, initial_state, update, UPDATES, covariance_matrix, sampler, decompose, condition, StopCriteria
 from src.reference_simulator.simulator import Simulator
 from src.util.domain import UnitSimplex, Cube
 from src.util.prepare_dict import prepare_dict
 from src.env.objectives import Objective
+from src.util.checkpoint import load_checkpoint, reproducible_config
 
 EPS = 10e-8
 MAX_ITER = 10
@@ -36,8 +38,9 @@ class TestCovarianceMatrixAdaption(unittest.TestCase):
         self.domain = UnitSimplex(7)
 
     def test_cma_es(self):
-        mu, obj, prolif = cma_es(self.evaluator, self.domain, MAX_ITER, verbose=True, seed=23)
+        mu, obj, prolif, reason = cma_es(self.evaluator, self.domain, MAX_ITER, verbose=True, seed=23)
         self.assertTrue(np.abs(obj - np.average(prolif)) < EPS)
+        self.assertEqual(reason, "max_iter")
         self.assertTrue(self.domain.contains(mu))
 
         # compare objective with sequential computation
@@ -51,6 +54,130 @@ class TestCovarianceMatrixAdaption(unittest.TestCase):
         o = TEST_CONFIG["objective"].eval(prolifs, treatment)
         self.assertTrue(np.abs(obj - o) <= EPS)
 
+    def test_update(self):
+        # the lazily decomposed covariance matches the covariance it was computed from
+        params = parameters(self.domain.dim)
+        state = initial_state(self.domain)
+        for k in range(1, 3 * params["eigen_gap"] + 1):
+            xs = self.domain.normal_batch(state["mu"], sampler(state), params["m"])
+            self.assertTrue(all(self.domain.contains(x) for x in xs))
+            update(params, state, xs, np.sum((xs - 0.1) ** 2, axis=1), k)
+            self.assertTrue(np.allclose(state["S"], state["S"].T))
+        self.assertEqual(state["eigen_k"], 3 * params["eigen_gap"])
+        B, D = state["B"], state["D"]
+        self.assertTrue(np.allclose((B * D ** 2) @ B.T, state["S"]))
+        self.assertTrue(np.allclose(state["C"] @ state["S"] @ state["C"], np.identity(self.domain.dim)))
+        # the condition number is read off the cached factors
+        values = np.linalg.eigvalsh(state["S"])
+        self.assertTrue(np.isclose(condition(state), np.max(values) / np.min(values)))
+
+    def test_sampler(self):
+        # samples of the cached factors follow the covariance they were decomposed from
+        params = parameters(self.domain.dim)
+        state = initial_state(self.domain)
+        for k in range(1, 4):
+            xs = self.domain.normal_batch(state["mu"], sampler(state), params["m"])
+            update(params, state, xs, np.sum((xs - 0.1) ** 2, axis=1), k)
+        decompose(state, 3)
+        steps = sampler(state).draw(20000)
+        S = state["sigma"] ** 2 * state["S"]
+        self.assertTrue(np.allclose(np.cov(steps.T), S, atol=0.05 * np.max(np.abs(S))))
+        self.assertTrue(np.allclose(sampler(state).covariance(), S))
+
+    def test_linear_covariances(self):
+        # the diagonal and low rank models keep a positive definite covariance with bounded memory
+        for covariance in ["diagonal", "low_rank"]:
+            params = parameters(self.domain.dim, covariance=covariance, rank=3)
+            state = initial_state(self.domain, covariance=covariance)
+            for k in range(1, 11):
+                xs = self.domain.normal_batch(state["mu"], sampler(state), params["m"])
+                UPDATES[covariance](params, state, xs, np.sum((xs - 0.1) ** 2, axis=1), k)
+                self.assertTrue(np.all(np.linalg.eigvalsh(covariance_matrix(state)) > 0))
+            self.assertNotIn("S", state)
+            self.assertEqual(len(state["paths"]), 0 if covariance == "diagonal" else 3)
+            # the factorized samples follow the dense covariance, whose condition number is bounded by condition
+            S = state["sigma"] ** 2 * covariance_matrix(state)
+            steps = sampler(state).draw(20000)
+            self.assertTrue(np.allclose(np.cov(steps.T), S, atol=0.05 * np.max(np.abs(S))))
+            values = np.linalg.eigvalsh(S)
+            self.assertTrue(np.max(values) / np.min(values) <= condition(state) * (1 + EPS))
+
+    def test_stop_criteria(self):
+        # the run ends with the first criterion which is met
+        m = parameters(self.domain.dim)["m"]
+        mu, obj, prolif, reason = cma_es(self.evaluator, self.domain, MAX_ITER, verbose=True, seed=23,
+            stop=StopCriteria(max_evals=2 * m))
+        self.assertEqual(reason, "max_evals")
+        self.assertTrue(self.domain.contains(mu))
+
+        params = parameters(self.domain.dim)
+        state = initial_state(self.domain)
+        stop = StopCriteria(tol_x=1e-5, max_time=3600)
+        self.assertIsNone(stop.check(params, state))
+        state["sigma"] = 1e-9
+        self.assertEqual(stop.check(params, state), "tol_x")
+        stop = StopCriteria(tol_fun=1e-6, stagnation=20)
+        for _ in range(20):
+            stop.record([1.0, 1.0 + 1e-8])
+        self.assertEqual(stop.check(params, initial_state(self.domain)), "stagnation")
+        for _ in range(40):
+            stop.record([1.0, 1.0 + 1e-8])
+        stop.stagnation = None
+        self.assertEqual(stop.check(params, initial_state(self.domain)), "tol_fun")
+
+    def test_checkpoint(self):
+        # a run which continues from a checkpoint ends exactly as an uninterrupted run
+        path = os.path.join(tempfile.mkdtemp(), "cma_es.pkl")
+        mu, obj, _, _ = cma_es(self.evaluator, self.domain, MAX_ITER, verbose=False, seed=23)
+        cma_es(self.evaluator, self.domain, MAX_ITER // 2, verbose=False, seed=23, checkpoint=path, checkpoint_every=MAX_ITER // 2)
+        self.assertEqual(load_checkpoint(path)["k"], MAX_ITER // 2)
+        resumed_mu, resumed_obj, _, _ = cma_es(self.evaluator, UnitSimplex(7), MAX_ITER, verbose=False, seed=5, checkpoint=path)
+        self.assertTrue(np.array_equal(mu, resumed_mu))
+        self.assertEqual(obj, resumed_obj)
+        # the final mean of the interrupted run is not part of its checkpoint
+        m = parameters(self.domain.dim)["m"]
+        self.assertEqual(len(self.evaluator.get_res_dict()[TEST_CONFIG["cell_lines"][0]]["relative_proliferation"]),
+            2 * MAX_ITER * m + 2)
+
+    def test_checkpoint_script_config(self):
+        # the experiment scripts resume exactly with every feature they enable and reproducible_config
+        cache = os.path.join(tempfile.mkdtemp(), "proliferation.sqlite")
+        config = dict(TEST_CONFIG, scheduler="flat", workers=self.n_envs, compose=True, cache=cache, warm_start=True)
+        evaluator = Evaluator(config, self.n_envs, store=False)
+        self.assertRaises(ValueError, cma_es, evaluator, self.domain, MAX_ITER, verbose=False,
+            checkpoint=os.path.join(tempfile.mkdtemp(), "cma_es.pkl"))
+        evaluator.terminate()
+
+        evaluator = Evaluator(reproducible_config(config), self.n_envs, store=False)
+        path = os.path.join(tempfile.mkdtemp(), "cma_es.pkl")
+        mu, obj, _, _ = cma_es(evaluator, self.domain, MAX_ITER, verbose=False, seed=23)
+        cma_es(evaluator, self.domain, MAX_ITER // 2, verbose=False, seed=23, checkpoint=path, checkpoint_every=MAX_ITER // 2)
+        resumed_mu, resumed_obj, _, _ = cma_es(evaluator, UnitSimplex(7), MAX_ITER, verbose=False, seed=5, checkpoint=path)
+        evaluator.terminate()
+        self.assertTrue(np.array_equal(mu, resumed_mu))
+        self.assertEqual(obj, resumed_obj)
+
+    def test_warm_start(self):
+        # a run continues the search distribution it is given
+        state = initial_state(self.domain)
+        mu, _, _, _ = cma_es(self.evaluator, self.domain, 2, verbose=False, seed=23, state=state)
+        self.assertTrue(np.array_equal(mu, state["mu"].flatten()))
+        state["sigma"] = 0.01
+        warm_mu, _, _, _ = cma_es(self.evaluator, self.domain, 2, verbose=False, seed=23, state=state)
+        self.assertTrue(np.linalg.norm(warm_mu - mu) < np.linalg.norm(self.domain.center().flatten() - mu))
+
+    def test_async_cma_es(self):
+        # the steady-state variant streams results through the flat scheduler
+        evaluator = Evaluator(dict(TEST_CONFIG, scheduler="flat", workers=self.n_envs), store=True)
+        trace = []
+        mu, obj, prolif, reason = async_cma_es(evaluator, self.domain, MAX_ITER, verbose=True, seed=23, trace=trace)
+        self.assertTrue(np.abs(obj - np.average(prolif)) < EPS)
+        self.assertEqual(reason, "max_iter")
+        self.assertTrue(self.domain.contains(mu))
+        self.assertEqual(len(trace), MAX_ITER)
+        self.assertTrue(all(trace[i][2] >= trace[i + 1][2] for i in range(MAX_ITER - 1)))
+        evaluator.terminate()
+
     def tearDown(self):
         # performs internal check if all environments terminate
         self.evaluator.terminate()
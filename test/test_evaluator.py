@@ -1,4 +1,6 @@
 import unittest
+import asyncio
+import tempfile
 import os,sys,inspect
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parentdir = os.path.dirname(currentdir)
@@ -6,6 +8,7 @@ sys.path.insert(0,parentdir)
 from src.search.evaluator import Evaluator
 from src.reference_simulator.simulator import Simulator
 from src.util.domain import UnitSimplex
+from src.env.objectives import MultiAvgLinear, MultiWorstLinear
 from util.prepare_dict import prepare_dict
 import numpy as np
 
@@ -120,6 +123,137 @@ class TestEvaluator(unittest.TestCase):
         self.assertAlmostEqual(prolifs[0][1], p)
         repeated_evaluator.terminate()
 
+    def test_flat_scheduler(self):
+        # the flat scheduler returns the same results as the nested environments
+        FLAT_CONFIG = dict(TEST_CONFIG)
+        FLAT_CONFIG["scheduler"] = "flat"
+        FLAT_CONFIG["workers"] = 3
+        flat_evaluator = Evaluator(FLAT_CONFIG, store=True)
+        flat_ys, flat_prolifs = flat_evaluator.evaluate(self.xs)
+        ys, prolifs = self.evaluator.evaluate(self.xs)
+        for i in range(EVALS):
+            self.assertTrue(np.abs(flat_ys[i] - ys[i]) < EPS)
+            self.assertTrue(np.all(np.abs(flat_prolifs[i] - prolifs[i]) < EPS))
+        self.assertEqual(len(flat_evaluator.get_res_dict()[TEST_CONFIG["cell_lines"][0]]["relative_proliferation"]), EVALS)
+        flat_evaluator.terminate()
+
+    def test_vector_cache(self):
+        # the vectorized environment reads and writes its persistent cache from the executor thread
+        ys, prolifs = self.evaluator.evaluate(self.xs)
+        with tempfile.TemporaryDirectory() as directory:
+            config = dict(TEST_CONFIG, scheduler="vector", cache=os.path.join(directory, "cache.sqlite"))
+            for _ in range(2):
+                evaluator = Evaluator(config, store=False)
+                for _ in range(2):
+                    cached_ys, cached_prolifs = evaluator.evaluate(self.xs)
+                    for i in range(EVALS):
+                        self.assertTrue(np.abs(cached_ys[i] - ys[i]) < EPS)
+                        self.assertTrue(np.all(np.abs(cached_prolifs[i] - prolifs[i]) < EPS))
+                evaluator.terminate()
+
+    def test_prefix_cache(self):
+        # plans which share their first step are continued from the cached prefix
+        SEQUENTIAL_CONFIG = {
+            "n_steps": 2,
+            "cell_lines": ['DV90', 'HS695T'],
+            "objective": TestObjective(),
+            "max_dosage": 8000,
+            "domain": UnitSimplex(7),
+            "scale": "linear",
+        }
+        xs = [np.concatenate([self.xs[0], x]) for x in self.xs]
+        reference = Evaluator(SEQUENTIAL_CONFIG, self.n_envs, store=False)
+        ys, prolifs = reference.evaluate(xs)
+        reference.terminate()
+
+        for scheduler in ["nested", "flat", "vector"]:
+            config = dict(SEQUENTIAL_CONFIG, scheduler=scheduler, prefix_cache=100)
+            evaluator = Evaluator(config, self.n_envs, store=False)
+            cached_ys, cached_prolifs = evaluator.evaluate(xs)
+            for i in range(EVALS):
+                self.assertTrue(np.abs(cached_ys[i] - ys[i]) < EPS)
+                self.assertTrue(np.all(np.abs(cached_prolifs[i] - prolifs[i]) < EPS))
+            # the shared first step is simulated once, the other plans of the batch continue from it
+            stats = evaluator.prefix_stats()
+            self.assertEqual(stats["lookups"], EVALS)
+            self.assertEqual(stats["hits"], 0)
+            self.assertEqual(stats["relookups"], EVALS - 1)
+            self.assertEqual(stats["shared_steps"], EVALS - 1)
+            cached_ys, _ = evaluator.evaluate(xs)
+            stats = evaluator.prefix_stats()
+            self.assertEqual(stats["full_hits"], EVALS)
+            self.assertAlmostEqual(stats["step_hit_rate"], 0.5)
+            self.assertTrue(np.allclose(cached_ys, ys))
+            evaluator.terminate()
+
+    def test_submit(self):
+        # submitted evaluations resolve to the results of evaluate
+        ys, prolifs = self.evaluator.evaluate(self.xs)
+        for scheduler in ["nested", "flat"]:
+            evaluator = Evaluator(dict(TEST_CONFIG, scheduler=scheduler), self.n_envs, store=True)
+            futures = [evaluator.submit([x]) for x in self.xs]
+            for i, future in enumerate(futures):
+                future_ys, future_prolifs = future.result()
+                self.assertTrue(np.abs(future_ys[0] - ys[i]) < EPS)
+                self.assertTrue(np.all(np.abs(future_prolifs[0] - prolifs[i]) < EPS))
+            self.assertEqual(len(evaluator.get_res_dict()[TEST_CONFIG["cell_lines"][0]]["relative_proliferation"]), EVALS)
+
+            async def gather():
+                return await asyncio.gather(evaluator.evaluate_async(self.xs[:2]), evaluator.evaluate_async(self.xs[2:]))
+            first, second = asyncio.run(gather())
+            self.assertTrue(np.allclose(first[0] + second[0], ys))
+            evaluator.terminate()
+
+    def test_evaluate_objectives(self):
+        # one evaluation is scored under every objective as if it had been evaluated with it
+        ys, prolifs = self.evaluator.evaluate(self.xs)
+        lambdas = [0, 1e-5, 1e-4]
+        objectives = [MultiAvgLinear(l) for l in lambdas] + [MultiWorstLinear(l) for l in lambdas]
+        scores, matrix, dosages = self.evaluator.evaluate_objectives(self.xs, objectives)
+        self.assertEqual(scores.shape, (len(objectives), EVALS))
+        self.assertEqual(matrix.shape, (EVALS, len(TEST_CONFIG["cell_lines"])))
+        for i, x in enumerate(self.xs):
+            treat = prepare_dict(x, max_dosage=TEST_CONFIG["max_dosage"])
+            self.assertTrue(np.abs(dosages[i] - sum(treat.values())) < EPS)
+            self.assertTrue(np.all(np.abs(matrix[i] - prolifs[i]) < EPS))
+            self.assertTrue(np.abs(scores[0][i] - ys[i]) < EPS)
+            for j, objective in enumerate(objectives):
+                self.assertTrue(np.abs(scores[j][i] - objective.eval(prolifs[i], treat)) < EPS)
+
+    def test_set_objective(self):
+        # the same workers score later evaluations with the new objective
+        for scheduler in ["nested", "flat", "vector"]:
+            evaluator = Evaluator(dict(TEST_CONFIG, objective=MultiAvgLinear(0), scheduler=scheduler), self.n_envs, store=False)
+            ys, prolifs = evaluator.evaluate(self.xs)
+            evaluator.set_objective(MultiAvgLinear(1e-4))
+            penalized_ys, penalized_prolifs = evaluator.evaluate(self.xs)
+            evaluator.terminate()
+            for i, x in enumerate(self.xs):
+                treat = prepare_dict(x, max_dosage=TEST_CONFIG["max_dosage"])
+                self.assertTrue(np.all(np.abs(np.array(penalized_prolifs[i]) - prolifs[i]) < EPS))
+                self.assertTrue(np.abs(penalized_ys[i] - ys[i] - 1e-4 * sum(treat.values())) < EPS)
+
+    def test_evaluate_racing(self):
+        # the best treatments are exact and the others get lower bounds which rank behind them
+        keep = 2
+        xs = [np.random.uniform(0, 1, 7) for i in range(3 * EVALS)]
+        xs = [x / sum(x + EPS) for x in xs]
+        config = dict(TEST_CONFIG, cell_lines=['DV90', 'HS695T', 'NCIH1092'], objective=MultiWorstLinear(1e-5), scheduler="flat")
+        evaluator = Evaluator(config, self.n_envs, store=False)
+        ys, _ = evaluator.evaluate(xs)
+        raced_ys, raced_prolifs = evaluator.evaluate_racing(xs, keep)
+        ids = np.argsort(ys)
+        self.assertTrue(np.all(np.argsort(raced_ys)[:keep] == ids[:keep]))
+        for i in ids[:keep]:
+            self.assertTrue(np.abs(raced_ys[i] - ys[i]) < EPS)
+        for i in ids[keep:]:
+            self.assertTrue(raced_ys[i] <= ys[i] + EPS)
+            self.assertTrue(raced_ys[i] >= ys[ids[keep - 1]])
+        stats = evaluator.racing_stats()
+        self.assertEqual(stats["tasks"], len(xs) * 3)
+        self.assertEqual(stats["cancelled"], sum(int(np.sum(np.isnan(p))) for p in raced_prolifs))
+        evaluator.terminate()
+
     def tearDown(self):
         # performs internal check if all environments terminate
         self.evaluator.terminate()
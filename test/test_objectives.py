@@ -3,8 +3,9 @@ import os,sys,inspect
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0,parentdir) 
-from src.env.objectives import SingleLinear, MultiAvgLinear, MultiWorstLinear
+from src.env.objectives import Objective, SingleLinear, MultiAvgLinear, MultiWorstLinear, score_objectives
 from src.env.drugs import empty_treatment
+import numpy as np
 
 
 class TestObjectives(unittest.TestCase):
@@ -37,6 +38,27 @@ class TestObjectives(unittest.TestCase):
         obj = MultiWorstLinear(self.lambd)
         self.assertAlmostEqual(3 + self.lambd * 7, obj.eval([self.p1, self.p2, self.p3], self.treatment))
 
+    def test_score_objectives(self):
+        prolifs = np.array([[self.p1, self.p2, self.p3], [self.p3, self.p3, self.p3]])
+        treatments = [self.treatment, {k: 2 * self.treatment[k] for k in self.treatment}]
+        dosages = [sum(t.values()) for t in treatments]
+        objectives = [MultiAvgLinear(0), MultiWorstLinear(0), MultiAvgLinear(self.lambd), MultiWorstLinear(0.5)]
+        ys = score_objectives(prolifs, dosages, objectives)
+        self.assertEqual(ys.shape, (len(objectives), len(prolifs)))
+        for j, obj in enumerate(objectives):
+            for i in range(len(prolifs)):
+                self.assertAlmostEqual(ys[j][i], obj.eval(list(prolifs[i]), treatments[i]))
+        self.assertAlmostEqual(score_objectives(prolifs[:, :1], dosages, [SingleLinear(self.lambd)])[0][1], self.p3 + 14)
+
+    def test_score_objectives_without_aggregate(self):
+        class EvalOnly(Objective):
+            def eval(self, rel_proliferations, action_dict):
+                return np.median(rel_proliferations)
+
+        prolifs = np.array([[self.p1, self.p2, self.p3]])
+        with self.assertRaisesRegex(TypeError, "EvalOnly"):
+            score_objectives(prolifs, [7], [EvalOnly()])
+
     def tearDown(self):
         pass
 
@@ -0,0 +1,94 @@
+import unittest
+import os,sys,inspect
+import numpy as np
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+from src.search.evaluator import Evaluator
+from src.search.pareto import pareto_search, non_dominated_sort, crowding_distance, dominates, truncate
+from src.util.domain import UnitSimplex
+from src.env.objectives import MultiWorstLinear
+
+MAX_ITER = 3
+POPULATION = 8
+ARCHIVE = 6
+
+TEST_CONFIG = {
+    "n_steps": 1,
+    "cell_lines": ['DV90', 'HS695T'],
+    "objective": MultiWorstLinear(0),
+    "max_dosage": 8000,
+    "domain": UnitSimplex(7),
+    "scale": "linear",
+    "scheduler": "flat",
+    "workers": 4
+}
+
+class TestNonDominatedSort(unittest.TestCase):
+
+    def test_fronts(self):
+        objectives = np.array([[1.0, 3.0], [2.0, 2.0], [3.0, 1.0], [2.0, 3.0], [3.0, 3.0], [1.0, 3.0]])
+        fronts = non_dominated_sort(objectives)
+        self.assertEqual(sorted(fronts[0]), [0, 1, 2, 5])
+        self.assertEqual(fronts[1], [3])
+        self.assertEqual(fronts[2], [4])
+        self.assertTrue(dominates(objectives[1], objectives[3]))
+        self.assertFalse(dominates(objectives[0], objectives[5]))
+
+    def test_random_fronts(self):
+        # every vector is dominated by one of the previous front and by none of its own or a later front
+        objectives = np.random.RandomState(23).randint(0, 6, size=(60, 2)).astype(float)
+        fronts = non_dominated_sort(objectives)
+        self.assertEqual(sorted(i for front in fronts for i in front), list(range(60)))
+        for k, front in enumerate(fronts):
+            for i in front:
+                later = [j for f in fronts[k:] for j in f]
+                self.assertFalse(any(dominates(objectives[j], objectives[i]) for j in later))
+                if k > 0:
+                    self.assertTrue(any(dominates(objectives[j], objectives[i]) for j in fronts[k - 1]))
+
+    def test_truncate(self):
+        # a front is thinned out by crowding distance and keeps its extremes
+        objectives = np.array([[0.0, 4.0], [0.1, 3.9], [1.0, 3.0], [2.0, 2.0], [4.0, 0.0]])
+        self.assertEqual(sorted(truncate(objectives, 3)), [0, 3, 4])
+        self.assertEqual(truncate(objectives, 10), list(range(5)))
+
+    def test_crowding_distance(self):
+        objectives = np.array([[1.0, 4.0], [2.0, 2.0], [4.0, 1.0]])
+        distance = crowding_distance(objectives)
+        self.assertTrue(np.isinf(distance[0]) and np.isinf(distance[2]))
+        self.assertAlmostEqual(distance[1], 1.0 + 1.0)
+
+class TestParetoSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.evaluator = Evaluator(TEST_CONFIG, store=False)
+        self.domain = UnitSimplex(7)
+
+    def test_pareto_search(self):
+        xs, objectives, prolifs = pareto_search(self.evaluator, self.domain, MAX_ITER, population=POPULATION,
+            aggregation="worst", archive_size=ARCHIVE, verbose=True, seed=23)
+        self.assertEqual(len(xs), len(objectives))
+        self.assertTrue(len(xs) <= ARCHIVE)
+        self.assertEqual(prolifs.shape, (len(xs), 2))
+        for x, o, p in zip(xs, objectives, prolifs):
+            self.assertTrue(self.domain.contains(x))
+            self.assertAlmostEqual(o[0], np.max(p))
+            self.assertAlmostEqual(o[1], 8000 * np.sum(x))
+        # the archive is non-dominated and ordered by dosage, so proliferation decreases
+        self.assertEqual(len(non_dominated_sort(objectives)), 1)
+        self.assertTrue(np.all(np.diff(objectives[:, 1]) >= 0))
+        self.assertTrue(np.all(np.diff(objectives[:, 0]) <= 0))
+        # the untreated plan is never dominated
+        self.assertEqual(objectives[0, 1], 0)
+
+    def test_initial_archive(self):
+        # without generations the archive is the front of the initial population
+        xs, objectives, _ = pareto_search(self.evaluator, self.domain, 0, population=POPULATION, verbose=False, seed=23)
+        self.assertEqual(len(non_dominated_sort(objectives)), 1)
+
+    def tearDown(self):
+        self.evaluator.terminate()
+
+if __name__ == '__main__':
+    unittest.main()
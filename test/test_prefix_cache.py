@@ -0,0 +1,67 @@
+import unittest
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+from src.search.prefix_cache import PrefixTrie
+import numpy as np
+
+N_STEPS = 3
+N_LINES = 2
+
+class TestPrefixTrie(unittest.TestCase):
+
+    def setUp(self):
+        self.trie = PrefixTrie(N_STEPS, max_nodes=4)
+        self.x = np.random.uniform(0, 1, N_STEPS * 7)
+        self.trajectory = np.random.uniform(0, 1, (N_STEPS, N_LINES))
+
+    def test_lookup(self):
+        self.assertEqual(self.trie.lookup(self.x), (0, None))
+        self.trie.insert(self.x, self.trajectory)
+
+        # same plan and plans which share the first step
+        depth, prolifs = self.trie.lookup(self.x)
+        self.assertEqual(depth, N_STEPS)
+        self.assertTrue(np.allclose(prolifs, self.trajectory[-1]))
+        y = self.x.copy()
+        y[7:] = 0.5
+        depth, prolifs = self.trie.lookup(y)
+        self.assertEqual(depth, 1)
+        self.assertTrue(np.allclose(prolifs, self.trajectory[0]))
+
+        # continuing a plan from its cached prefix
+        self.trie.insert(y, self.trajectory[1:], start=1)
+        self.assertEqual(self.trie.lookup(y)[0], N_STEPS)
+        stats = self.trie.stats()
+        self.assertEqual(stats["lookups"], 4)
+        self.assertEqual(stats["full_hits"], 2)
+        self.assertEqual(stats["nodes"], 4)
+
+    def test_quantization(self):
+        self.trie.insert(self.x, self.trajectory)
+        self.assertEqual(self.trie.lookup(self.x + 1e-8)[0], N_STEPS)
+
+    def test_relookup(self):
+        # a repeated lookup of a waiting plan does not count as another lookup
+        y = self.x.copy()
+        y[7:] = 0.5
+        self.assertEqual(self.trie.lookup(y), (0, None))
+        self.trie.insert(self.x, self.trajectory)
+        self.assertEqual(self.trie.lookup(y, repeated=0)[0], 1)
+        stats = self.trie.stats()
+        self.assertEqual((stats["lookups"], stats["hits"], stats["relookups"], stats["shared_steps"]), (1, 0, 1, 1))
+
+    def test_eviction(self):
+        # the least recently used plan is evicted from its leaf upwards
+        y = self.x.copy()
+        y[7:] = 0.5
+        self.trie.insert(self.x, self.trajectory)
+        self.trie.insert(y, self.trajectory[1:], start=1)
+        self.assertEqual(len(self.trie), 4)
+        self.assertEqual(self.trie.stats()["evictions"], 1)
+        self.assertEqual(self.trie.lookup(y)[0], N_STEPS)
+        self.assertEqual(self.trie.lookup(self.x)[0], 2)
+
+if __name__ == '__main__':
+    unittest.main()
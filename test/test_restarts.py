@@ -0,0 +1,93 @@
+import unittest
+import tempfile
+import os,sys,inspect
+import numpy as np
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir) 
+from src.search.evaluator import Evaluator
+from src.search.restarts import restart_cma_es, Population
+from src.util.domain import UnitSimplex
+from src.env.objectives import Objective
+
+EPS = 10e-8
+MAX_EVALS = 200
+
+class TestObjective(Objective):
+    # We use a replicator object because functions are not pickable
+    def eval(self, rel_proliferations, action_dict):
+        return np.average(rel_proliferations)
+
+TEST_CONFIG = {
+    "n_steps": 1,
+    "cell_lines": ['DV90', 'HS695T'],
+    "objective": TestObjective(),
+    "max_dosage": 8000,
+    "domain": UnitSimplex(7),
+    "scale": "linear",
+    "scheduler": "flat",
+    "workers": 4
+}
+
+class Preempted(Exception):
+    pass
+
+class PreemptedEvaluator():
+    # stops the run on the submission after n_submits, as a preempted job would
+    def __init__(self, evaluator, n_submits):
+        self.evaluator = evaluator
+        self.n_submits = n_submits
+
+    def submit(self, treatments):
+        if self.n_submits == 0:
+            raise Preempted()
+        self.n_submits -= 1
+        return self.evaluator.submit(treatments)
+
+    def __getattr__(self, name):
+        return getattr(self.evaluator, name)
+
+class TestRestarts(unittest.TestCase):
+
+    def setUp(self):
+        self.evaluator = Evaluator(TEST_CONFIG, store=False)
+        self.domain = UnitSimplex(7)
+
+    def test_stagnation(self):
+        # a population with a collapsed step size has stagnated
+        population = Population(self.domain, m=20)
+        self.assertEqual(population.params["m"], 20)
+        self.assertFalse(population.stagnated())
+        population.state["sigma"] = 1e-9
+        self.assertTrue(population.stagnated())
+
+    def test_restart_cma_es(self):
+        for strategy in ["ipop", "bipop"]:
+            trace = []
+            mu, obj, prolif, reason = restart_cma_es(self.evaluator, self.domain, MAX_EVALS, strategy=strategy, concurrent=2,
+                verbose=True, seed=23, trace=trace)
+            self.assertTrue(np.abs(obj - np.average(prolif)) < EPS)
+            self.assertTrue(self.domain.contains(mu))
+            self.assertTrue(obj <= trace[-1][2])
+            self.assertTrue(trace[-1][1] >= MAX_EVALS)
+            self.assertEqual(reason, "max_evals")
+
+    def test_checkpoint(self):
+        # a preempted run continues from its checkpoint and ends as an uninterrupted run
+        checkpoint = lambda: os.path.join(tempfile.mkdtemp(), "restarts.pkl")
+        mu, obj, _, _ = restart_cma_es(self.evaluator, self.domain, MAX_EVALS, strategy="bipop", verbose=False, seed=23,
+            checkpoint=checkpoint(), checkpoint_every=2)
+        path = checkpoint()
+        with self.assertRaises(Preempted):
+            restart_cma_es(PreemptedEvaluator(self.evaluator, 10), self.domain, MAX_EVALS, strategy="bipop", verbose=False,
+                seed=23, checkpoint=path, checkpoint_every=2)
+        resumed_mu, resumed_obj, _, _ = restart_cma_es(self.evaluator, UnitSimplex(7), MAX_EVALS, strategy="bipop", verbose=False,
+            seed=5, checkpoint=path, checkpoint_every=2)
+        self.assertTrue(np.array_equal(mu, resumed_mu))
+        self.assertEqual(obj, resumed_obj)
+
+    def tearDown(self):
+        self.evaluator.terminate()
+
+if __name__ == '__main__':
+    unittest.main()
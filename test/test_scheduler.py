@@ -0,0 +1,115 @@
+import unittest
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+from src.search.scheduler import FlatScheduler, aggregate_history
+from src.reference_simulator.simulator import Simulator
+from src.env.drugs import DRUGS
+from src.util.prepare_dict import prepare_dict
+import numpy as np
+
+EPS = 10e-6
+EVALS = 4
+
+class TestFlatScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.cell_lines = ['DV90', 'HS695T', 'NCIH1092']
+        self.scheduler = FlatScheduler(self.cell_lines, n_workers=2)
+        xs = np.random.uniform(0, 1, (EVALS, len(DRUGS)))
+        xs = xs / xs.sum(axis=1, keepdims=True)
+        self.plans = [[prepare_dict(x, max_dosage=8000), prepare_dict(x[::-1], max_dosage=8000)] for x in xs]
+
+    def test_run(self):
+        # results are reassembled per plan and ordered as the cell lines
+        prolifs = self.scheduler.run(self.plans)
+        self.assertEqual(prolifs.shape, (EVALS, len(self.cell_lines)))
+        for j, line in enumerate(self.cell_lines):
+            simulator = Simulator()
+            for i, plan in enumerate(self.plans):
+                simulator.initialized = False
+                simulator.initialize(line)
+                for treatment in plan:
+                    r = simulator.apply_treatment(treatment)
+                self.assertTrue(np.abs(prolifs[i, j] - r) < EPS)
+
+    def test_affinity(self):
+        # the worker with two lines is helped by the other worker
+        self.scheduler.run(self.plans)
+        self.scheduler.run(self.plans)
+        stats = self.scheduler.stats()
+        self.assertEqual(stats["tasks"], 2 * EVALS * len(self.cell_lines))
+        self.assertTrue(stats["steals"] > 0)
+        self.assertTrue(stats["warm_rate"] > 0.5)
+
+    def test_cost_estimates(self):
+        # the second run is planned with the measured cost of every cell line
+        self.scheduler.run(self.plans)
+        self.scheduler.run(self.plans)
+        history = self.scheduler.history
+        self.assertEqual(len(history), 2)
+        self.assertIsNone(history[0]["estimated"])
+        self.assertTrue(history[1]["estimated"] > 0)
+        for line in self.cell_lines:
+            self.assertTrue(self.scheduler.costs[line] > 0)
+            self.assertEqual(self.scheduler.line_statistics[line]["tasks"], 2 * EVALS)
+            self.assertTrue(self.scheduler.line_statistics[line]["steps"] > 0)
+
+    def test_submit(self):
+        # concurrently submitted batches share the workers and return the same results as run
+        prolifs = self.scheduler.run(self.plans)
+        futures = [self.scheduler.submit(self.plans[i:i + 1]) for i in range(EVALS)]
+        for i, future in enumerate(futures):
+            self.assertTrue(np.all(np.abs(future.result()[0] - prolifs[i]) < EPS))
+        self.assertEqual(len(self.scheduler.history), EVALS + 1)
+        self.assertEqual(len(self.scheduler.batches), 0)
+
+    def test_aggregate_history(self):
+        # batches of single plans are merged into entries of a whole generation of tasks
+        futures = [self.scheduler.submit(self.plans[i:i + 1]) for i in range(EVALS)]
+        for future in futures:
+            future.result()
+        history = self.scheduler.history
+        merged = aggregate_history(history, EVALS * len(self.cell_lines))
+        self.assertEqual(len(merged), 1)
+        self.assertEqual(merged[0]["tasks"], EVALS * len(self.cell_lines))
+        self.assertEqual(merged[0]["measured"], max(e["end"] for e in history) - min(e["start"] for e in history))
+        self.assertTrue(merged[0]["measured"] >= max(e["measured"] for e in history))
+
+    def test_cancel(self):
+        # lines are queued in the given order and cancelled plans are not simulated further
+        prolifs = self.scheduler.run(self.plans)
+        order = self.cell_lines[::-1]
+        results = []
+        def on_result(batch_id, index, line, rel_proliferation):
+            results.append((index, line))
+            if len(results) == 1:
+                self.scheduler.cancel(batch_id, list(range(1, EVALS)))
+        raced = self.scheduler.submit(self.plans, order=order, on_result=on_result).result()
+        self.assertEqual(results[0][1], order[0])
+        self.assertTrue(np.all(np.abs(raced[0] - prolifs[0]) < EPS))
+        self.assertTrue(np.any(np.isnan(raced[1:])))
+        simulated = ~np.isnan(raced)
+        self.assertTrue(np.all(np.abs(raced[simulated] - prolifs[simulated]) < EPS))
+        # every result is handed to on_result, including the one which completes the batch
+        self.assertEqual(len(results), int(np.sum(simulated)))
+        self.assertEqual(len(self.scheduler.batches), 0)
+
+    def test_dead_worker(self):
+        # the batch of a dead worker fails instead of waiting forever and no new batch is accepted
+        self.scheduler.run(self.plans)
+        self.scheduler.workers[0].kill()
+        self.scheduler.workers[0].join()
+        future = self.scheduler.submit(self.plans)
+        with self.assertRaises(RuntimeError):
+            future.result(timeout=60)
+        self.assertEqual(len(self.scheduler.batches), 0)
+        with self.assertRaises(RuntimeError):
+            self.scheduler.run(self.plans)
+
+    def tearDown(self):
+        self.scheduler.terminate()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -64,6 +64,9 @@ class TestSequential(unittest.TestCase):
         self.assertTrue(seq_cube.contains(seq_cube.center()))
         self.assertTrue(seq_cube.contains(seq_cube.uniform()))
         self.assertTrue(seq_cube.contains(seq_cube.normal(seq_cube.center(), self.sigma)))
+        samples = seq_cube.normal_batch(seq_cube.center(), self.sigma, 20)
+        self.assertEqual(samples.shape, (20, self.dim * self.n_steps))
+        self.assertTrue(all(seq_cube.contains(s) for s in samples))
 
     def test_sequential_single_drug(self):
         # get single step result
@@ -104,7 +107,7 @@ class TestSequential(unittest.TestCase):
         self.assertAlmostEqual(prolifs[0][1], p)
 
     def test_sequential_cma_es(self):
-        mu, obj, prolif = cma_es(self.evaluator, self.domain, MAX_ITER, verbose=True, seed=23)
+        mu, obj, prolif, reason = cma_es(self.evaluator, self.domain, MAX_ITER, verbose=True, seed=23)
         # generate total dosage
         total_dosage = sum([8000 * x for x in mu])
         self.assertTrue(np.abs(obj - (np.max(prolif) + LAMBD * total_dosage)) < EPS)
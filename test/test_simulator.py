@@ -0,0 +1,109 @@
+import unittest
+import os,sys,inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0,parentdir)
+from src.reference_simulator.simulator import Simulator, CONDITIONS
+from src.env.drugs import DRUGS
+from src.util.prepare_dict import prepare_dict
+import numpy as np
+
+EPS = 10e-8
+EVALS = 5
+
+class TestSimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.cell_line = 'DV90'
+        self.max_dosage = 8000
+        self.xs = np.random.uniform(0, 1, (EVALS, len(DRUGS)))
+        self.xs = self.xs / self.xs.sum(axis=1, keepdims=True)
+
+    def test_apply_treatments(self):
+        # compare batched simulation with one simulation per treatment
+        simulator = Simulator()
+        simulator.initialize(self.cell_line)
+        prolifs = simulator.apply_treatments(self.xs * self.max_dosage)
+        self.assertEqual(len(prolifs), EVALS)
+        self.assertEqual(simulator.R, 1)
+
+        for i, x in enumerate(self.xs):
+            reference = Simulator()
+            reference.initialize(self.cell_line)
+            r = reference.apply_treatment(prepare_dict(x, max_dosage=self.max_dosage))
+            self.assertTrue(np.abs(prolifs[i] - r) < EPS)
+
+    def test_simulate_lines(self):
+        # compare cross-cell-line simulation with one simulator per cell line
+        cell_lines = ['DV90', 'HS695T', 'NCIH1092', 'PK59']
+        simulator = Simulator()
+        prolifs = simulator.simulate_lines(cell_lines, self.xs[0] * self.max_dosage)
+        self.assertEqual(len(prolifs), len(cell_lines))
+
+        for i, line in enumerate(cell_lines):
+            reference = Simulator()
+            reference.initialize(line)
+            r = reference.apply_treatment(prepare_dict(self.xs[0], max_dosage=self.max_dosage))
+            self.assertTrue(np.abs(prolifs[i] - r) < EPS)
+
+    def test_parameter_binding(self):
+        # the precomputed condition vectors match the entries of the condition table
+        simulator = Simulator()
+        simulator.load_conditions(self.cell_line)
+        simulator.load_drug_concentrations(prepare_dict(self.xs[0], max_dosage=self.max_dosage))
+        condition = CONDITIONS.loc[CONDITIONS.conditionId == f'TUMOR-{self.cell_line}-cellline-01-01', :]
+        for col in condition.columns:
+            if col in simulator.model.getFixedParameterIds():
+                self.assertEqual(simulator.model.getFixedParameterById(col), condition[col].values[0])
+        fixed_parameters = np.array(simulator.model.getFixedParameters())
+        self.assertTrue(np.allclose(fixed_parameters[simulator.drug_parameter_indices()], self.xs[0] * self.max_dosage))
+        self.assertRaises(ValueError, simulator.load_conditions, "UNKNOWN")
+
+    def test_warm_start_fallback(self):
+        # a cell line which fails the history check is solved from the initial state instead of aborting
+        treatment = prepare_dict(self.xs[0], max_dosage=self.max_dosage)
+        simulator = Simulator(warm_start=True)
+        simulator.verify_composition = lambda cell_line: False
+        with self.assertWarns(UserWarning):
+            simulator.initialize(self.cell_line)
+        self.assertIn(self.cell_line, simulator.cold_lines)
+        reference = Simulator()
+        reference.initialize(self.cell_line)
+        self.assertTrue(np.abs(simulator.apply_treatment(treatment) - reference.apply_treatment(treatment)) < EPS)
+
+    def test_composition(self):
+        # repeated steps are served from the step ratio cache and match regular simulation
+        n_steps = 3
+        treatment = prepare_dict(self.xs[0], max_dosage=self.max_dosage)
+        simulator = Simulator(compose=True)
+        self.assertTrue(simulator.verify_composition(self.cell_line))
+        simulator.initialize(self.cell_line)
+        reference = Simulator()
+        reference.initialize(self.cell_line)
+        for _ in range(n_steps):
+            p = simulator.apply_treatment(treatment)
+            r = reference.apply_treatment(treatment)
+            self.assertTrue(np.abs(p - r) < EPS)
+        self.assertEqual(simulator.composition_misses, 1)
+        self.assertEqual(simulator.composition_hits, n_steps - 1)
+
+    def test_warm_start(self):
+        # warm started solves reach the same steady states as solves from the initial state
+        simulator = Simulator(warm_start=True)
+        reference = Simulator()
+        for x in self.xs:
+            treatment = prepare_dict(x, max_dosage=self.max_dosage)
+            simulator.initialize(self.cell_line)
+            reference.initialize(self.cell_line)
+            p = simulator.apply_treatment(treatment)
+            r = reference.apply_treatment(treatment)
+            self.assertTrue(np.abs(p - r) < 10e-6)
+            simulator.initialized = False
+            reference.initialized = False
+        self.assertEqual(simulator.steady_states[self.cell_line].size, EVALS + 1)
+
+    def tearDown(self):
+        pass
+
+if __name__ == '__main__':
+    unittest.main()
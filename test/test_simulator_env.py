@@ -3,7 +3,7 @@ import os,sys,inspect
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0,parentdir) 
-from src.env.simulator_env import SimulatorEnv
+from src.env.simulator_env import SimulatorEnv, VectorSimulatorEnv
 from src.reference_simulator.simulator import Simulator
 from src.util.domain import UnitSimplex
 from util.prepare_dict import prepare_dict
@@ -77,6 +77,61 @@ class TestSimulatorEnv(unittest.TestCase):
             r = simulator.apply_treatment(treat)
             self.assertTrue(np.abs(r - reward[i]) < EPS)
 
+    def test_batched_experiment(self):
+        # a batched environment needs to reproduce the results of the worker based environment
+        batched_env = SimulatorEnv(2, self.cell_lines, self.max_dosage, TestObjective(), UnitSimplex(7), "linear", batched=True)
+        sequential_env = SimulatorEnv(2, self.cell_lines, self.max_dosage, TestObjective(), UnitSimplex(7), "linear")
+        self.assertTrue(np.allclose(batched_env.reset(), np.ones(len(self.cell_lines))))
+        _ = sequential_env.reset()
+
+        done = False
+        while not done:
+            _, reward, done, _ = batched_env.step(self.treatment)
+            _, ref_reward, _, _ = sequential_env.step(self.treatment)
+            self.assertTrue(np.allclose(reward, ref_reward, atol=EPS))
+
+        batched_env.terminate()
+        sequential_env.terminate()
+
+    def test_vector_experiment(self):
+        # every sub-environment of a vectorized environment reproduces the batched environment
+        n_envs = 3
+        actions = np.array([self.treatment, self.treatment[::-1], np.ones(7) / 7])
+        vector_env = VectorSimulatorEnv(n_envs, 2, self.cell_lines, self.max_dosage, TestObjective(), UnitSimplex(7), "linear")
+        batched_env = SimulatorEnv(2, self.cell_lines, self.max_dosage, TestObjective(), UnitSimplex(7), "linear", batched=True)
+        self.assertEqual(vector_env.reset().shape, (n_envs, len(self.cell_lines)))
+        for _ in range(2):
+            vector_obs, vector_rewards, dones, _ = vector_env.step(actions)
+        self.assertTrue(np.all(dones))
+
+        for i in range(n_envs):
+            batched_env.reset()
+            for _ in range(2):
+                obs, reward, _, _ = batched_env.step(actions[i])
+            self.assertTrue(np.allclose(vector_obs[i], obs))
+            self.assertTrue(np.allclose(vector_rewards[i], reward))
+        vector_env.terminate()
+        batched_env.terminate()
+
+    def test_snapshot(self):
+        # branching from a snapshot gives the same results as replaying the prefix
+        for batched in [False, True]:
+            env = SimulatorEnv(3, self.cell_lines, self.max_dosage, TestObjective(), UnitSimplex(7), "linear", batched=batched)
+            env.reset()
+            env.step(self.treatment)
+            snapshot = env.snapshot()
+            env.step(self.treatment)
+            obs, _, done, _ = env.step(self.treatment[::-1])
+            self.assertTrue(done)
+
+            env.restore(snapshot)
+            self.assertEqual(env.step_counter, 1)
+            env.step(self.treatment)
+            restored_obs, _, done, _ = env.step(self.treatment[::-1])
+            self.assertTrue(done)
+            self.assertTrue(np.allclose(obs, restored_obs))
+            env.terminate()
+
     def tearDown(self):
         self.env.terminate()
 